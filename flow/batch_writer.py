@@ -0,0 +1,140 @@
+"""Background batch writer.
+
+Collects points and writes them in batches from a background thread,
+so that callers don't wait for a round trip per point.
+
+Usage:
+
+writer = BatchWriter(dbclient.write_points, batch_size=100, flush_interval=5.0)
+writer.add([point])
+writer.close()  # writes any remaining points
+
+"""
+import atexit
+import logging
+import threading
+import time
+
+
+def write_valid(write, points, is_rejected):
+    """Write points, leaving out any points the server rejects; returns the list of rejected points.
+
+    When a write fails with an error for which is_rejected(error) is true (e.g. a point with
+    a field type conflict), the points are split in halves that are written separately, so that
+    only the rejected points are left out. Other errors (e.g. connection errors) are raised.
+    """
+    try:
+        write(points)
+        return []
+    except Exception as err:
+        if not is_rejected(err):
+            raise
+        if len(points) == 1:
+            return points
+        middle = len(points) // 2
+        return write_valid(write, points[:middle], is_rejected) + write_valid(write, points[middle:], is_rejected)
+
+
+class BatchWriter(object):
+    """Writes points in batches using a write function that takes a list of points.
+
+    A batch is written when batch_size points are waiting or flush_interval
+    seconds after the previous write, whichever comes first. Points the server
+    rejects (those for which is_rejected(error) is true; see write_valid) are
+    dropped. Points from a write that failed otherwise (e.g. without a connection)
+    are kept and retried with the next batch, up to max_retries times in a row;
+    at most max_buffered points are kept (the oldest are dropped first).
+    """
+
+    def __init__(self, write, batch_size=100, flush_interval=5.0, max_buffered=10000, max_retries=10,
+                 is_rejected=None):
+        self.write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.max_retries = max_retries
+        self.is_rejected = is_rejected or (lambda err: False)
+        self.points = []
+        self.dropped_count = 0
+        self.failure_count = 0  # the number of failed writes in a row
+        self.lock = threading.Lock()  # held while writing, so that flushes happen one at a time
+        self.condition = threading.Condition()  # guards points and closed
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name='BatchWriter')
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.close)
+
+    def add(self, points):
+        """Queue points to be written."""
+        with self.condition:
+            self.points.extend(points)
+            self.trim()
+            if len(self.points) >= self.batch_size:
+                self.condition.notify()
+
+    def run(self):
+        failed = False
+        while True:
+            with self.condition:
+                # after a failed write, wait a full interval before retrying
+                deadline = time.time() + self.flush_interval
+                while not self.closed and (failed or len(self.points) < self.batch_size) and time.time() < deadline:
+                    self.condition.wait(deadline - time.time())
+                if self.closed:
+                    return
+            failed = not self.flush()
+
+    def flush(self):
+        """Write all waiting points; returns False if the write failed."""
+        with self.lock:
+            with self.condition:
+                points = self.points
+                self.points = []
+            if not points:
+                return True
+            try:
+                rejected = write_valid(self.write, points, self.is_rejected)
+            except Exception as err:
+                self.failure_count += 1
+                with self.condition:
+                    if self.failure_count > self.max_retries:
+                        logging.error("BatchWriter: error writing %d points; dropped them after %d attempts: %s" %
+                                      (len(points), self.failure_count, err))
+                        self.dropped_count += len(points)
+                        self.failure_count = 0
+                    else:
+                        logging.error("BatchWriter: error writing %d points: %s" % (len(points), err))
+                        self.points = points + self.points
+                        self.trim()
+                return False
+            self.failure_count = 0
+            if rejected:
+                logging.error("BatchWriter: dropped %d points rejected by the server, e.g. %s" %
+                              (len(rejected), rejected[0]))
+                with self.condition:
+                    self.dropped_count += len(rejected)
+            return True
+
+    def trim(self):
+        # called with the condition held
+        excess = len(self.points) - self.max_buffered
+        if excess > 0:
+            del self.points[:excess]
+            self.dropped_count += excess
+            logging.warning("BatchWriter: buffer full; dropped %d points" % excess)
+
+    def pending_count(self):
+        """The number of points waiting to be written."""
+        with self.condition:
+            return len(self.points)
+
+    def close(self):
+        """Stop the background thread and write any remaining points."""
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+        self.flush()
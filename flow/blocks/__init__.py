@@ -3,6 +3,11 @@ from filters.brightness import Brightness
 from filters.operator import Operator
 from filters.sma import SimpleMovingAverage
 from filters.ema import ExponentialMovingAverage
+from filters.rolling_minimum import RollingMinimum
+from filters.rolling_maximum import RollingMaximum
+from filters.rolling_median import RollingMedian
+from filters.rolling_percentile import RollingPercentile
+from filters.rolling_standard_deviation import RollingStandardDeviation
 from timer import Timer
 from block import Block
 
@@ -10,7 +15,12 @@ non_operator_blocks = {
     'blur': Blur,
     'brightness': Brightness,
     'simple moving average': SimpleMovingAverage,
-    'exponential moving average': ExponentialMovingAverage
+    'exponential moving average': ExponentialMovingAverage,
+    'rolling minimum': RollingMinimum,
+    'rolling maximum': RollingMaximum,
+    'rolling median': RollingMedian,
+    'rolling percentile': RollingPercentile,
+    'rolling standard deviation': RollingStandardDeviation
 }
 
 
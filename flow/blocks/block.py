@@ -1,7 +1,9 @@
 import abc
 import logging
 
-from decimal import Decimal, ROUND_HALF_UP
+import numpy as np
+
+from precision import count_decimal_places, round_half_up, round_batch
 
 
 # represents a block (an input, filter, or output) in a data flow diagram
@@ -17,6 +19,10 @@ class Block(object):
                             "soilmoisture",
                             "CO2" ]
 
+    # true for blocks whose value can change from tick to tick even when their inputs do not
+    # (e.g. timers and filters that keep a history); these are recomputed on every incremental update
+    time_dependent = False
+
     # create a block using a block spec dictionary
     def __init__(self, block_spec=None):
         if block_spec is not None:
@@ -76,21 +82,25 @@ class Block(object):
                 source_values.append(source.value)
         return source_values
 
+    # compute the values of this block for a batch of timesteps; inputs is a list of arrays (one per source)
+    # and mask is a boolean array that is true for the timesteps at which compute() would be called;
+    # returns an array of values (with NaN for undefined values) or None if no value is defined for any timestep;
+    # implemented in sub-class if needed
+    def compute_batch(self, inputs, params, mask):
+        return None
+
     def compute_value(self, source_values):
         source_values_length = len(source_values)
         if source_values_length > 0 and source_values_length >= self.required_source_count:
             self.value = self.compute(source_values, self.params)
             if self.is_numeric() and self.value is not None:
-                self.value = round(self.value, self.decimal_places)
+                self.value = round_half_up(self.value, self.decimal_places)
         else:
             self.value = None
 
+    # round a value to a number of decimal places, rounding halves away from zero
     def round(self, value, decimal_places):
-        # Convert decimal places, so quanitize can be used for accurate rounding
-        # 6 decimal places -> .000001 = decimal_exp
-        # 2 decimal places -> .01 = decimal_exp
-        decimal_exp = Decimal(10) ** (-1 * decimal_places)
-        return float(Decimal(str(value)).quantize(decimal_exp, rounding=ROUND_HALF_UP))
+        return round_half_up(value, decimal_places)
 
     # compute a new value for this block (assuming it has inputs/sources)
     def update(self):
@@ -115,11 +125,38 @@ class Block(object):
         # mark the block as non-stale, since we've updated the value or determined that no update is needed
         self.stale = False
 
+    # compute this block's values for n timesteps at once, starting from a freshly created block
+    # (the block's own runtime state is not used or modified);
+    # sources is a list of (values, decimal_places) array pairs, one per source block, with NaN for undefined values;
+    # returns a (values, decimal_places) pair of arrays for this block, following the same rules as update()
+    def update_batch(self, sources, n):
+        if not self.required_source_count:
+            value = self.value if self.value is not None and self.is_numeric() else np.nan
+            return np.full(n, value, dtype=float), np.full(n, self.decimal_places or 0, dtype=int)
+
+        # as in get_source_values, only defined source values count towards the inputs and decimal places
+        valid_count = np.zeros(n, dtype=int)
+        decimal_places = np.zeros(n, dtype=int)
+        for source_values, source_decimal_places in sources:
+            valid = ~np.isnan(source_values)
+            valid_count += valid
+            decimal_places = np.where(valid, np.maximum(decimal_places, source_decimal_places), decimal_places)
+        mask = (valid_count > 0) & (valid_count >= self.required_source_count)
+
+        values = self.compute_batch([source_values for source_values, _ in sources], self.params, mask)
+        if values is None:
+            values = np.full(n, np.nan)
+        else:
+            values = np.where(mask, values, np.nan)
+        if self.is_numeric():
+            values = round_batch(values, decimal_places)
+        return values, decimal_places
+
     # compute the number of decimal places present in a string
     # representation of a number.
     # examples: "1e-11" = 11, "10.0001" = 4
     def compute_decimal_places(self, num_str):
-        return abs(Decimal(str(num_str)).as_tuple().exponent)
+        return count_decimal_places(num_str)
 
     # a helper function for reading from a list of parameters
     def read_param(self, params, name, default=None):
@@ -1,13 +1,22 @@
 import abc
-import base64
-import cStringIO
-from PIL import Image
 from ..block import Block
+from ..image_value import ImageValue
+from ..memoize import params_key
 
 
 class Filter(Block):
     __metaclass__ = abc.ABCMeta
 
+    # true for image filters that are expensive enough to run in a worker process when an offload pool is available
+    cpu_heavy = False
+
+    # a ResultCache of process_image results for image filters (if any), keyed on the image digest and parameters;
+    # set in sub-classes whose process_image output depends only on the image and parameters
+    result_cache = None
+
+    # the FilterPool used to run process_image in worker processes (if any); see Diagram.set_offload_pool
+    offload_pool = None
+
     def __init__(self, block_spec):
         super(Filter, self).__init__(block_spec)
 
@@ -16,7 +25,35 @@ class Filter(Block):
         """Retrieve input(s) and return the output(s)."""
         return
 
-    def decode_image(self, image_string):
-        imageString = cStringIO.StringIO(base64.b64decode(image_string))
-        outImage = Image.open(imageString)
-        return outImage
+    # filters must explicitly support batch evaluation
+    def compute_batch(self, inputs, params, mask):
+        raise NotImplementedError('%s blocks do not support batch evaluation' % self.type)
+
+    # get a PIL image from an image input value (an ImageValue or a base64 encoded image string)
+    def decode_image(self, image_value):
+        if not isinstance(image_value, ImageValue):
+            image_value = ImageValue(encoded=image_value)
+        return image_value.image
+
+    # compute a new image from an image (for image filters); implemented in sub-class if needed;
+    # this must only depend on the image and params, since it may be run in a worker process
+    def process_image(self, image, params):
+        return image
+
+    # apply process_image to an image input value and return the resulting ImageValue;
+    # if an offload pool is set, the processing happens in a worker process and the latest available result is returned
+    def filter_image(self, image_value, params):
+        if not isinstance(image_value, ImageValue):
+            image_value = ImageValue(encoded=image_value)
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = (image_value.digest(), params_key(params))
+            result = self.result_cache.get(cache_key)
+            if result is not None:
+                return result
+        if self.offload_pool is not None:
+            return self.offload_pool.process(self, image_value, params, cache_key)
+        result = ImageValue(self.process_image(image_value.image, params))
+        if cache_key is not None:
+            self.result_cache.put(cache_key, result, result.byte_count())
+        return result
@@ -1,14 +1,19 @@
 from . import Filter
+from ..memoize import ResultCache
 from PIL import Image, ImageEnhance
-from rhizo.extensions.camera import encode_image
 
 
 class Brightness(Filter):
+
+    result_cache = ResultCache()
+
     def __init__(self, block_spec):
         super(Brightness, self).__init__(block_spec)
 
     def compute(self, inputs, params):
-        image_string = inputs[0]
+        return self.filter_image(inputs[0], params)
+
+    def process_image(self, image, params):
         brightness = self.read_param_obj(params, "brightness_adjustment")
         brightness_amount = brightness["value"]
         old_min = brightness["min"]
@@ -32,11 +37,10 @@ class Brightness(Filter):
             old_min, old_max,
             new_min, new_max)
 
-        image = self.decode_image(image_string)
         enhancer = ImageEnhance.Brightness(image)
         outImage = enhancer.enhance(brightness_amount)
 
-        return encode_image(outImage)
+        return outImage
 
     def convert_value_to_new_range(self, value,
                                    old_min, old_max,
@@ -1,25 +1,29 @@
+import numpy as np
+
 from . import Filter
 
+# scipy is optional; without it the batch recursive filter runs as a Python loop
+try:
+    from scipy.signal import lfilter
+except ImportError:
+    lfilter = None
+
 
 class ExponentialMovingAverage(Filter):
 
+    time_dependent = True
+
     def __init__(self, block_spec):
         super(ExponentialMovingAverage, self).__init__(block_spec)
         self.default_moving_average_periods = 10
-        self.period_history = []
         self.last_average = None
 
+    # the average only depends on the last average and the new value, so no history is kept
     def compute(self, inputs, params):
         new_average = 0
         result = inputs[0]
-        period_history_length = len(self.period_history)
         moving_average_periods = self.read_param(params, 'period',
                                                  self.default_moving_average_periods)
-        if (period_history_length > 0 and
-                period_history_length >= moving_average_periods):
-            self.period_history.pop(0)  # pop first item in the list
-            period_history_length = period_history_length - 1
-        self.period_history.append(result)
 
         if (self.last_average is not None):
             if(result is not None):
@@ -33,9 +37,26 @@ class ExponentialMovingAverage(Filter):
 
         self.last_average = new_average
 
-        # last_average = result
-        # alpha = 2.0 / (moving_average_periods + 1.0)
-        # for item in self.period_history:
-        #     last_average = (item * alpha) + (last_average * (1.0-alpha))
-
         return new_average
+
+    # vectorized version of compute over the masked timesteps, using a first-order recursive filter:
+    # average[i] = sample[i] * alpha + average[i - 1] * (1 - alpha), starting from the first sample
+    def compute_batch(self, inputs, params, mask):
+        moving_average_periods = self.read_param(params, 'period',
+                                                 self.default_moving_average_periods)
+        alpha = 2.0 / (moving_average_periods + 1.0)
+        samples = inputs[0][mask]
+        averages = np.empty(len(samples))
+        if len(samples):
+            averages[0] = samples[0]
+            if lfilter is not None:
+                averages[1:] = lfilter([alpha], [1.0, -(1 - alpha)], samples[1:],
+                                       zi=[averages[0] * (1 - alpha)])[0]
+            else:
+                last_average = averages[0]
+                for index in range(1, len(samples)):
+                    last_average = samples[index] * alpha + last_average * (1 - alpha)
+                    averages[index] = last_average
+        result = np.full(len(mask), np.nan)
+        result[mask] = averages
+        return result
@@ -0,0 +1,138 @@
+import os
+import mmap
+import shutil
+import logging
+import tempfile
+import multiprocessing
+from PIL import Image
+
+from ..image_value import ImageValue
+from ..memoize import params_key
+
+
+# the shared memory buffers mapped by a worker process: maps file paths to mmap objects
+worker_maps = {}
+
+
+# map a shared memory buffer in a worker process (once per buffer)
+def worker_map(path):
+    buffer = worker_maps.get(path)
+    if buffer is None:
+        for old_path in [old_path for old_path in worker_maps if not os.path.exists(old_path)]:
+            worker_maps.pop(old_path).close()  # the buffer has been replaced by a larger one
+        with open(path, 'r+b') as f:
+            buffer = worker_maps[path] = mmap.mmap(f.fileno(), 0)
+    return buffer
+
+
+# runs in a worker process: apply a filter's process_image to the raw image at the start of a shared buffer
+# and write the raw result after it; returns (mode, size, byte count) of the result
+def process_slot(path, filter_class, params, mode, size, byte_count):
+    buffer = worker_map(path)
+    image = Image.frombytes(mode, size, buffer[:byte_count])
+    result = filter_class(None).process_image(image, params)
+    data = result.tobytes()
+    if byte_count + len(data) > len(buffer):
+        raise ValueError('filter result (%d bytes) does not fit in the shared buffer' % len(data))
+    buffer[byte_count:byte_count + len(data)] = data
+    return result.mode, result.size, len(data)
+
+
+# a shared memory buffer backed by a file (in /dev/shm where available) that worker processes map by path,
+# so that buffers can be allocated (and replaced by larger ones) after the worker processes have started
+class SharedBuffer(object):
+
+    def __init__(self, directory, size):
+        fd, self.path = tempfile.mkstemp(dir=directory)
+        try:
+            os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.size = size
+
+    def close(self):
+        self.map.close()
+        os.remove(self.path)
+
+
+# runs image filters (Filter.process_image) in a pool of worker processes;
+# images are passed through shared memory buffers (one per slot, holding the input image followed by the result)
+# rather than being pickled; a slot's buffer is allocated when the slot is first used, sized for the image
+# (and replaced if a larger image comes along), so memory use follows the image sizes actually filtered;
+# each block has at most one job running at a time and process() never waits for a job to finish;
+# a job is not started again for an image (and parameters) the block's latest job was started for
+class FilterPool(object):
+
+    def __init__(self, processes=3, slots=None):
+        shm_directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        self.directory = tempfile.mkdtemp(prefix='flow-filters-', dir=shm_directory)
+        self.buffers = [None] * (slots or processes * 2)  # SharedBuffer objects for the slots used so far
+        self.free_slots = list(range(len(self.buffers)))
+        self.jobs = {}  # maps blocks to (slot, AsyncResult, job key, cache key, input byte count) for running jobs
+        self.results = {}  # maps blocks to their latest ImageValue results
+        self.job_keys = {}  # maps blocks to the job key (image digest and parameters) of their latest job
+        self.abandoned_jobs = []  # jobs (as in self.jobs) of blocks that are no longer used
+        self.pool = multiprocessing.Pool(processes)
+
+    # start processing an image (an ImageValue) for a block (unless the block already has a job running, or its latest
+    # job was for the same image and parameters) and return the block's latest completed result (or None if there
+    # isn't one yet); if cache_key is given, the result for this image is added to the block's result cache
+    # when it is collected
+    def process(self, block, image_value, params, cache_key=None):
+        self.collect(block)
+        for job in list(self.abandoned_jobs):
+            if job[1].ready():
+                self.abandoned_jobs.remove(job)
+                self.free_slots.append(job[0])
+        job_key = (image_value.digest(), params_key(params))
+        if block not in self.jobs and self.job_keys.get(block) != job_key:
+            if not self.free_slots:
+                return self.results.get(block)
+            image = image_value.image
+            data = image.tobytes()
+            slot = self.free_slots.pop()
+            buffer = self.buffers[slot]
+            size = len(data) + image.size[0] * image.size[1] * 4  # room for a result with up to 4 bytes per pixel
+            if buffer is None or buffer.size < size:
+                if buffer:
+                    buffer.close()
+                buffer = self.buffers[slot] = SharedBuffer(self.directory, size)
+            buffer.map[:len(data)] = data
+            result = self.pool.apply_async(process_slot, (buffer.path, type(block), params, image.mode, image.size,
+                                                          len(data)))
+            self.jobs[block] = (slot, result, job_key, cache_key, len(data))
+            self.job_keys[block] = job_key
+        return self.results.get(block)
+
+    # if the block's job has finished, keep its result and free its slot
+    def collect(self, block):
+        job = self.jobs.get(block)
+        if job and job[1].ready():
+            slot, result, job_key, cache_key, input_byte_count = job
+            del self.jobs[block]
+            try:
+                mode, size, byte_count = result.get()
+                data = self.buffers[slot].map[input_byte_count:input_byte_count + byte_count]
+                self.results[block] = ImageValue(Image.frombytes(mode, size, data))
+                if cache_key is not None:
+                    block.result_cache.put(cache_key, self.results[block], byte_count)
+            except Exception as err:
+                logging.error('filter pool error in %s: %s' % (block.name, err))
+                del self.job_keys[block]  # try again with the next image
+            self.free_slots.append(slot)
+
+    # forget all blocks and their results (e.g. when a new diagram is started);
+    # slots used by running jobs are freed once the jobs finish
+    def clear(self):
+        self.abandoned_jobs.extend(self.jobs.values())
+        self.jobs = {}
+        self.results = {}
+        self.job_keys = {}
+
+    def close(self):
+        self.pool.terminate()
+        for buffer in self.buffers:
+            if buffer:
+                buffer.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
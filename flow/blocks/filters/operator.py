@@ -1,38 +1,77 @@
+import numpy as np
+
 from . import Filter
 
 
+# operator block types: maps each type name to (arity, function, batch_function);
+# function takes arity input values and returns the block value (or None);
+# batch_function takes arity arrays of input values and returns an array of block values (with NaN for None)
+operators = {}
+
+
+# add an operator block type (or replace an existing one); batch_function is optional
+# (without it, diagrams using the operator can't be evaluated in batch mode)
+def register_operator(type_name, arity, function, batch_function=None):
+    operators[type_name] = (arity, function, batch_function)
+
+
+def register_unary_operator(type_name, function, batch_function=None):
+    register_operator(type_name, 1, function, batch_function)
+
+
+def register_binary_operator(type_name, function, batch_function=None):
+    register_operator(type_name, 2, function, batch_function)
+
+
+register_binary_operator('and', lambda a, b: int(a and b),
+                         lambda a, b: np.where(a != 0, np.trunc(b), np.trunc(a)))
+register_binary_operator('or', lambda a, b: int(a or b),
+                         lambda a, b: np.where(a != 0, np.trunc(a), np.trunc(b)))
+register_binary_operator('xor', lambda a, b: int((a > 0) != (b > 0)),
+                         lambda a, b: ((a > 0) != (b > 0)).astype(float))
+register_binary_operator('nand', lambda a, b: int(not (a and b)),
+                         lambda a, b: ((a == 0) | (b == 0)).astype(float))
+register_unary_operator('not', lambda a: int(not a),
+                        lambda a: (a == 0).astype(float))
+register_binary_operator('plus', lambda a, b: a + b, lambda a, b: a + b)
+register_binary_operator('minus', lambda a, b: a - b, lambda a, b: a - b)
+register_binary_operator('times', lambda a, b: a * b, lambda a, b: a * b)
+register_binary_operator('divided by', lambda a, b: a / b if abs(b) > 1e-8 else None,
+                         lambda a, b: np.where(np.abs(b) > 1e-8, a / b, np.nan))
+register_unary_operator('absolute value', abs, np.abs)
+register_binary_operator('equals', lambda a, b: int(a == b),
+                         lambda a, b: (a == b).astype(float))
+register_binary_operator('not equals', lambda a, b: int(a != b),
+                         lambda a, b: (a != b).astype(float))
+register_binary_operator('less than', lambda a, b: int(a < b),
+                         lambda a, b: (a < b).astype(float))
+register_binary_operator('greater than', lambda a, b: int(a > b),
+                         lambda a, b: (a > b).astype(float))
+
+
+# other block types handled by the Operator class (e.g. numbers, sensors, and actuators) pass their first input through
+def pass_through(a):
+    return a
+
+
 class Operator(Filter):
     def __init__(self, block_spec):
         super(Operator, self).__init__(block_spec)
+        if block_spec is not None:
+            self.arity, self.operation, self.batch_operation = operators.get(self.type, (1, pass_through, pass_through))
+            if self.type in operators and self.required_source_count != self.arity:
+                raise ValueError('%s blocks require %d inputs; block %s has input_count %s' %
+                                 (self.type, self.arity, self.name, self.required_source_count))
 
+    # the operation is looked up once (in the constructor) rather than on every call
     def compute(self, inputs, params):
-        result = inputs[0]
-        if self.type == 'and':
-            result = int(inputs[0] and inputs[1])
-        elif self.type == 'or':
-            result = int(inputs[0] or inputs[1])
-        elif self.type == 'xor':
-            result = int((inputs[0] > 0) != (inputs[1] > 0))
-        elif self.type == 'nand':
-            result = int(not (inputs[0] and inputs[1]))
-        elif self.type == 'not':
-            result = int(not inputs[0])
-        elif self.type == 'plus':
-            result = inputs[0] + inputs[1]
-        elif self.type == 'minus':
-            result = inputs[0] - inputs[1]
-        elif self.type == 'times':
-            result = inputs[0] * inputs[1]
-        elif self.type == 'divided by':
-            result = inputs[0] / inputs[1] if abs(inputs[1]) > 1e-8 else None
-        elif self.type == 'absolute value':
-            result = abs(inputs[0])
-        elif self.type == 'equals':
-            result = int(inputs[0] == inputs[1])
-        elif self.type == 'not equals':
-            result = int(inputs[0] != inputs[1])
-        elif self.type == 'less than':
-            result = int(inputs[0] < inputs[1])
-        elif self.type == 'greater than':
-            result = int(inputs[0] > inputs[1])
-        return result
+        if self.arity == 1:
+            return self.operation(inputs[0])
+        return self.operation(*inputs[:self.arity])
+
+    # vectorized version of compute
+    def compute_batch(self, inputs, params, mask):
+        if self.batch_operation is None:
+            raise NotImplementedError('%s blocks do not support batch evaluation' % self.type)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.batch_operation(*inputs[:self.arity])
@@ -0,0 +1,53 @@
+# a fixed-capacity buffer holding the most recent values added to it, along with their running sum
+class RingBuffer(object):
+
+    def __init__(self, capacity):
+        self.clear(capacity)
+
+    # remove all values (optionally changing the capacity)
+    def clear(self, capacity=None):
+        if capacity is not None:
+            self.capacity = max(int(capacity), 1)
+        self.values = [0.0] * self.capacity
+        self.start = 0  # index of the oldest value
+        self.count = 0
+        self.sum = 0.0
+        self.appends_since_sum = 0
+
+    def __len__(self):
+        return self.count
+
+    # iterate over the values from oldest to newest
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.values[(self.start + index) % self.capacity]
+
+    # add a value, replacing the oldest value if the buffer is full
+    def append(self, value):
+        if self.count < self.capacity:
+            self.values[(self.start + self.count) % self.capacity] = value
+            self.count += 1
+        else:
+            self.sum -= self.values[self.start]
+            self.values[self.start] = value
+            self.start = (self.start + 1) % self.capacity
+        self.sum += value
+
+        # recompute the sum from scratch once per capacity appends (amortized O(1)) so floating point error can't accumulate
+        self.appends_since_sum += 1
+        if self.appends_since_sum >= self.capacity:
+            self.sum = sum(iter(self))
+            self.appends_since_sum = 0
+
+    # change the capacity, keeping the newest values that fit
+    def resize(self, capacity):
+        self.reset(list(self), capacity)
+
+    # replace the contents of the buffer with the newest values from a list that fit
+    def reset(self, values, capacity=None):
+        self.clear(capacity)
+        for value in values[-self.capacity:]:
+            self.append(value)
+
+    def mean(self):
+        return self.sum / self.count if self.count else None
@@ -0,0 +1,7 @@
+from .rolling_minimum import RollingMinimum
+
+
+# the maximum of the most recent input values (the number of values is given by the window parameter)
+class RollingMaximum(RollingMinimum):
+
+    maximum = True
@@ -0,0 +1,8 @@
+from .rolling_percentile import RollingPercentile
+
+
+# the median of the most recent input values (the number of values is given by the window parameter)
+class RollingMedian(RollingPercentile):
+
+    def get_percentile(self, params):
+        return 50
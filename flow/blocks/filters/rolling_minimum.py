@@ -0,0 +1,18 @@
+from . import Filter
+from .windows import MonotonicDeque
+
+
+# the minimum of the most recent input values (the number of values is given by the window parameter)
+class RollingMinimum(Filter):
+
+    time_dependent = True
+    maximum = False
+
+    def __init__(self, block_spec):
+        super(RollingMinimum, self).__init__(block_spec)
+        self.default_window = 10
+        self.window_values = MonotonicDeque(self.maximum)
+
+    def compute(self, inputs, params):
+        window = max(int(self.read_param(params, 'window', self.default_window)), 1)
+        return self.window_values.append(inputs[0], window)
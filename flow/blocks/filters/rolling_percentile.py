@@ -0,0 +1,23 @@
+from . import Filter
+from .windows import SortedWindow
+
+
+# a percentile (0 to 100, given by the percentile parameter) of the most recent input values
+# (the number of values is given by the window parameter)
+class RollingPercentile(Filter):
+
+    time_dependent = True
+
+    def __init__(self, block_spec):
+        super(RollingPercentile, self).__init__(block_spec)
+        self.default_window = 10
+        self.default_percentile = 50
+        self.window_values = SortedWindow()
+
+    def compute(self, inputs, params):
+        window = max(int(self.read_param(params, 'window', self.default_window)), 1)
+        self.window_values.append(inputs[0], window)
+        return self.window_values.percentile(self.get_percentile(params))
+
+    def get_percentile(self, params):
+        return self.read_param(params, 'percentile', self.default_percentile)
@@ -0,0 +1,19 @@
+from . import Filter
+from .windows import WelfordWindow
+
+
+# the (population) standard deviation of the most recent input values
+# (the number of values is given by the window parameter)
+class RollingStandardDeviation(Filter):
+
+    time_dependent = True
+
+    def __init__(self, block_spec):
+        super(RollingStandardDeviation, self).__init__(block_spec)
+        self.default_window = 10
+        self.window_values = WelfordWindow()
+
+    def compute(self, inputs, params):
+        window = max(int(self.read_param(params, 'window', self.default_window)), 1)
+        self.window_values.append(inputs[0], window)
+        return self.window_values.standard_deviation()
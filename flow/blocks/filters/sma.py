@@ -1,22 +1,59 @@
+import numpy as np
+
 from . import Filter
+from .ring_buffer import RingBuffer
 
 
 class SimpleMovingAverage(Filter):
 
+    time_dependent = True
+
     def __init__(self, block_spec):
         super(SimpleMovingAverage, self).__init__(block_spec)
         self.default_moving_average_periods = 10
-        self.period_history = []
+        self.history = RingBuffer(self.default_moving_average_periods)
+
+    # the values currently being averaged, oldest first
+    @property
+    def period_history(self):
+        return list(self.history)
+
+    @period_history.setter
+    def period_history(self, values):
+        self.history.reset(values)
 
     def compute(self, inputs, params):
         result = inputs[0]
-        period_history_length = len(self.period_history)
-        moving_average_periods = self.read_param(params, 'period',
-                                                 self.default_moving_average_periods)
-        if (period_history_length > 0 and
-                period_history_length >= moving_average_periods):
-            self.period_history.pop(0)  # pop first item in the list
-            period_history_length = period_history_length - 1
-        self.period_history.append(result)
-        moving_average = sum(iter(self.period_history)) / (period_history_length + 1)
-        return moving_average
+        moving_average_periods = max(int(self.read_param(params, 'period',
+                                                         self.default_moving_average_periods)), 1)
+        if moving_average_periods != self.history.capacity:  # the period can be changed while running
+            self.history.resize(moving_average_periods)
+        self.history.append(result)
+        return self.history.mean()
+
+    # vectorized version of compute over the masked timesteps, using a cumulative-sum kernel
+    def compute_batch(self, inputs, params, mask):
+        moving_average_periods = max(int(self.read_param(params, 'period',
+                                                         self.default_moving_average_periods)), 1)
+        samples = inputs[0][mask]
+        counts = np.minimum(np.arange(1, len(samples) + 1), moving_average_periods)
+        result = np.full(len(mask), np.nan)
+        result[mask] = rolling_sum(samples, moving_average_periods) / counts
+        return result
+
+
+# compute the sum of each value and the (period - 1) values before it;
+# cumulative sums restart every period values so that rounding error does not grow with the length of the series
+def rolling_sum(samples, period):
+    count = len(samples)
+    padded = np.zeros(-(-count // period) * period)
+    padded[:count] = samples
+    block_prefix_sums = np.cumsum(padded.reshape(-1, period), axis=1)
+    block_totals = block_prefix_sums[:, -1]
+    prefix_sums = block_prefix_sums.ravel()[:count]
+
+    # a full window is the part of the current block up to the value plus the tail of the previous block
+    sums = prefix_sums.copy()
+    previous_blocks = np.arange(period, count) // period - 1
+    sums[period:] += block_totals[previous_blocks] - prefix_sums[:count - period]
+    return sums
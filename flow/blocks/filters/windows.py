@@ -0,0 +1,214 @@
+import math
+import random
+from collections import deque
+
+
+# tracks the minimum (or maximum) of the most recent values using a monotonic deque;
+# each value is added and removed at most once, so updates are amortized O(1)
+class MonotonicDeque(object):
+
+    def __init__(self, maximum=False):
+        self.maximum = maximum
+        self.entries = deque()  # (index, value) pairs; values increase from the front (decrease if maximum)
+        self.next_index = 0
+
+    # add a value and return the extreme of the last window values (including this one)
+    def append(self, value, window):
+        entries = self.entries
+        if self.maximum:
+            while entries and entries[-1][1] <= value:
+                entries.pop()
+        else:
+            while entries and entries[-1][1] >= value:
+                entries.pop()
+        entries.append((self.next_index, value))
+        self.next_index += 1
+        while entries[0][0] <= self.next_index - 1 - window:
+            entries.popleft()
+        return entries[0][1]
+
+
+# a node of an IndexableSkiplist: next_nodes[level] is the next node at each level,
+# and widths[level] is the number of nodes that link skips over (plus one)
+class SkiplistNode(object):
+    __slots__ = ('value', 'next_nodes', 'widths')
+
+    def __init__(self, value, next_nodes, widths):
+        self.value = value
+        self.next_nodes = next_nodes
+        self.widths = widths
+
+
+# a sorted collection of values (which may repeat) supporting insertion, removal, and lookup by rank
+# in expected O(log n) time: each node has a random number of levels and its links record how many nodes they skip,
+# so a rank is found by following the longest links whose widths add up to at most that rank
+class IndexableSkiplist(object):
+
+    max_levels = 24  # enough for millions of values
+
+    def __init__(self):
+        self.size = 0
+        self.levels = 1  # the number of levels in use (the most levels of any node so far)
+        self.end = SkiplistNode(None, [], [])  # terminates every level
+        self.head = SkiplistNode(None, [self.end] * self.max_levels, [1] * self.max_levels)
+
+    def __len__(self):
+        return self.size
+
+    # get the value with the given rank (0 for the smallest value)
+    def __getitem__(self, rank):
+        return self.node_at(rank).value
+
+    # get the node with the given rank; the node's next_nodes[0] has the next rank
+    def node_at(self, rank):
+        if not 0 <= rank < self.size:
+            raise IndexError('skiplist index out of range')
+        node = self.head
+        rank += 1
+        for level in range(self.levels - 1, -1, -1):
+            widths = node.widths
+            while widths[level] <= rank:
+                rank -= widths[level]
+                node = node.next_nodes[level]
+                widths = node.widths
+        return node
+
+    def insert(self, value):
+        # a node has k or more levels with probability 1 / 2 ** (k - 1), up to about log2(size) levels
+        max_levels = min(self.size.bit_length() + 1, self.max_levels)
+        level_count = 1
+        while level_count < max_levels and random.random() < 0.5:
+            level_count += 1
+        while self.levels < level_count:
+            self.head.widths[self.levels] = self.size + 1  # a new level's head link skips over all nodes
+            self.levels += 1
+
+        # find the last node before the new value at each level, and the number of nodes skipped at each level
+        levels = self.levels
+        end = self.end
+        previous_nodes = [None] * levels
+        steps_at_level = [0] * levels
+        node = self.head
+        for level in range(levels - 1, -1, -1):
+            next_node = node.next_nodes[level]
+            while next_node is not end and next_node.value <= value:
+                steps_at_level[level] += node.widths[level]
+                node = next_node
+                next_node = node.next_nodes[level]
+            previous_nodes[level] = node
+
+        new_node = SkiplistNode(value, [None] * level_count, [None] * level_count)
+        steps = 0
+        for level in range(level_count):
+            previous_node = previous_nodes[level]
+            new_node.next_nodes[level] = previous_node.next_nodes[level]
+            previous_node.next_nodes[level] = new_node
+            new_node.widths[level] = previous_node.widths[level] - steps
+            previous_node.widths[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(level_count, levels):
+            previous_nodes[level].widths[level] += 1
+        self.size += 1
+
+    # remove one occurrence of a value; raises ValueError if there isn't one
+    def remove(self, value):
+        # find the last node before the value at each level
+        levels = self.levels
+        end = self.end
+        previous_nodes = [None] * levels
+        node = self.head
+        for level in range(levels - 1, -1, -1):
+            next_node = node.next_nodes[level]
+            while next_node is not end and next_node.value < value:
+                node = next_node
+                next_node = node.next_nodes[level]
+            previous_nodes[level] = node
+        removed_node = previous_nodes[0].next_nodes[0]
+        if removed_node is end or removed_node.value != value:
+            raise ValueError('value not in skiplist')
+
+        removed_levels = len(removed_node.next_nodes)
+        for level in range(removed_levels):
+            previous_node = previous_nodes[level]
+            previous_node.widths[level] += removed_node.widths[level] - 1
+            previous_node.next_nodes[level] = removed_node.next_nodes[level]
+        for level in range(removed_levels, levels):
+            previous_nodes[level].widths[level] -= 1
+        self.size -= 1
+
+
+# keeps the most recent values in an order-statistics structure (an IndexableSkiplist) so that order statistics
+# (median, percentiles) can be read by rank; adding a value and dropping the oldest take expected O(log n) time
+class SortedWindow(object):
+
+    def __init__(self):
+        self.values = deque()  # in arrival order
+        self.sorted_values = IndexableSkiplist()
+
+    def __len__(self):
+        return len(self.values)
+
+    # add a value, dropping the oldest values so that at most window values are kept
+    def append(self, value, window):
+        self.values.append(value)
+        self.sorted_values.insert(value)
+        while len(self.values) > window:
+            self.sorted_values.remove(self.values.popleft())
+
+    # get a percentile (0 to 100) of the values, interpolating linearly between the closest ranks
+    def percentile(self, percent):
+        if not len(self.sorted_values):
+            return None
+        rank = (len(self.sorted_values) - 1) * min(max(percent, 0.0), 100.0) / 100.0
+        lower = int(math.floor(rank))
+        upper = min(lower + 1, len(self.sorted_values) - 1)
+        fraction = rank - lower
+        lower_node = self.sorted_values.node_at(lower)
+        upper_value = lower_node.next_nodes[0].value if upper > lower else lower_node.value
+        return lower_node.value + (upper_value - lower_node.value) * fraction
+
+
+# keeps the mean and sum of squared differences from the mean of the most recent values
+# using Welford's updates, adding the newest value and removing the oldest
+class WelfordWindow(object):
+
+    def __init__(self):
+        self.values = deque()
+        self.mean = 0.0
+        self.squared_differences = 0.0
+        self.appends_since_recompute = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    # add a value, dropping the oldest values so that at most window values are kept
+    def append(self, value, window):
+        self.values.append(value)
+        delta = value - self.mean
+        self.mean += delta / len(self.values)
+        self.squared_differences += delta * (value - self.mean)
+        while len(self.values) > window:
+            self.remove_oldest()
+
+        # recompute from scratch once per window appends (amortized O(1)) so floating point error can't accumulate
+        self.appends_since_recompute += 1
+        if self.appends_since_recompute >= window:
+            self.mean = math.fsum(self.values) / len(self.values)
+            self.squared_differences = math.fsum((v - self.mean) ** 2 for v in self.values)
+            self.appends_since_recompute = 0
+
+    def remove_oldest(self):
+        value = self.values.popleft()
+        if not self.values:
+            self.mean = 0.0
+            self.squared_differences = 0.0
+            return
+        delta = value - self.mean
+        self.mean -= delta / len(self.values)
+        self.squared_differences -= delta * (value - self.mean)
+
+    # the population standard deviation of the values
+    def standard_deviation(self):
+        if not self.values:
+            return None
+        return math.sqrt(max(self.squared_differences, 0.0) / len(self.values))
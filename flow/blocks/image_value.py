@@ -0,0 +1,52 @@
+import zlib
+import base64
+import cStringIO
+from PIL import Image
+from rhizo.extensions.camera import encode_image
+
+
+# an image value passed between blocks; it holds the decoded PIL image so that image blocks can be chained
+# without decoding and re-encoding at each step; the base64 JPEG encoding is only created (once) when it is
+# needed to send or store the value
+class ImageValue(object):
+
+    def __init__(self, image=None, encoded=None):
+        self._image = image
+        self._encoded = encoded
+        self._digest = None
+
+    # the decoded PIL image (decoded on first use if this value was created from an encoded image)
+    @property
+    def image(self):
+        if self._image is None and self._encoded is not None:
+            self._image = Image.open(cStringIO.StringIO(base64.b64decode(self._encoded)))
+        return self._image
+
+    # the image as a base64 encoded JPEG string
+    def encoded(self):
+        if self._encoded is None and self._image is not None:
+            self._encoded = encode_image(self._image)
+        return self._encoded
+
+    # a cheap digest of the image content (computed once), used to recognize repeated images;
+    # based on the raw pixels if available, otherwise on the encoded image
+    def digest(self):
+        if self._digest is None:
+            if self._image is not None:
+                data = self._image.tobytes()
+                self._digest = (self._image.mode, self._image.size, zlib.crc32(data), zlib.adler32(data))
+            else:
+                self._digest = (None, None, zlib.crc32(self._encoded), zlib.adler32(self._encoded))
+        return self._digest
+
+    # the approximate memory used by the decoded image
+    def byte_count(self):
+        image = self.image
+        return image.size[0] * image.size[1] * len(image.getbands())
+
+
+# get the form of a block value that can be sent to the server or stored (images are encoded; other values are unchanged)
+def encode_value(value):
+    if isinstance(value, ImageValue):
+        return value.encoded()
+    return value
@@ -0,0 +1,82 @@
+import json
+import functools
+from collections import OrderedDict
+
+from image_value import ImageValue
+
+
+# a bounded least-recently-used cache of block results, limited by entry count and (estimated) memory use
+class ResultCache(object):
+
+    def __init__(self, max_entries=16, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # maps keys to (value, byte count), least recently used first
+        self.total_bytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+    # get a cached value (or None if the key isn't in the cache)
+    def get(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return None
+        self.entries[key] = entry  # move to the most recently used end
+        return entry[0]
+
+    def put(self, key, value, byte_count=0):
+        if byte_count > self.max_bytes:
+            return
+        old_entry = self.entries.pop(key, None)
+        if old_entry:
+            self.total_bytes -= old_entry[1]
+        self.entries[key] = (value, byte_count)
+        self.total_bytes += byte_count
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            key, (value, byte_count) = self.entries.popitem(last=False)
+            self.total_bytes -= byte_count
+
+
+# get a hashable key for a block input value; images are represented by their digest
+def input_key(value):
+    if isinstance(value, ImageValue):
+        return value.digest()
+    return value
+
+
+# get a hashable key for a block's parameters
+def params_key(params):
+    return json.dumps(params, sort_keys=True)
+
+
+# estimate the memory used by a block value
+def value_byte_count(value):
+    if isinstance(value, ImageValue):
+        return value.byte_count()
+    return 0
+
+
+# a decorator for the compute method of a block class whose value depends only on its inputs and parameters;
+# results are kept in a ResultCache shared by all blocks of the class
+def memoize_compute(max_entries=16, max_bytes=32 * 1024 * 1024):
+    def decorator(compute):
+        cache = ResultCache(max_entries, max_bytes)
+
+        @functools.wraps(compute)
+        def memoized_compute(self, inputs, params):
+            key = (tuple(input_key(value) for value in inputs), params_key(params))
+            value = cache.get(key)
+            if value is None:
+                value = compute(self, inputs, params)
+                if value is not None:
+                    cache.put(key, value, value_byte_count(value))
+            return value
+
+        memoized_compute.cache = cache
+        return memoized_compute
+    return decorator
@@ -0,0 +1,65 @@
+import math
+
+import numpy as np
+
+
+# decimal places are tracked as plain integers and values are rounded with float arithmetic
+# (rather than using the decimal module), since this happens for every sensor sample and block value
+
+
+# compute the number of decimal places present in the string representation of a number,
+# matching the exponent of the corresponding decimal.Decimal;
+# examples: "1e-11" = 11, "10.0001" = 4, ".000" = 3
+def count_decimal_places(number):
+    mantissa, _, exponent = str(number).strip().lower().partition('e')
+    whole, _, fraction = mantissa.partition('.')
+    digits = whole.lstrip('+-') + fraction
+    if not digits.isdigit() or len(whole) - len(whole.lstrip('+-')) > 1:
+        raise ValueError('Not a number: %s' % number)
+    return abs(int(exponent or 0) - len(fraction))
+
+
+# relative tolerance used when rounding, so that values such as 2.675 (stored as 2.67499999...) round the way
+# their decimal representation suggests
+ROUNDING_EPSILON = 1e-12
+
+
+# round a value to a number of decimal places, rounding halves away from zero;
+# uses the same floating point operations as round_batch so that both give identical results
+def round_half_up(value, decimal_places):
+    scaled = abs(value) * 10.0 ** decimal_places
+    rounded = math.floor(scaled + 0.5 + scaled * ROUNDING_EPSILON) / 10.0 ** decimal_places
+    return -rounded if value < 0 else rounded
+
+
+# round an array of values to a number of decimal places (given per value); see round_half_up
+def round_batch(values, decimal_places):
+    scale = 10.0 ** decimal_places
+    with np.errstate(invalid='ignore'):
+        scaled = np.abs(values) * scale
+        rounded = np.floor(scaled + 0.5 + scaled * ROUNDING_EPSILON) / scale
+        return np.where(values < 0, -rounded, rounded)
+
+
+# estimate the number of decimal places of each value in an array (up to max_decimal_places),
+# for use when the original string representations of batch inputs are not available
+def infer_decimal_places(values, max_decimal_places=10):
+    decimal_places = np.zeros(len(values), dtype=int)
+    with np.errstate(invalid='ignore'):
+        for places in range(max_decimal_places, 0, -1):
+            scaled = np.abs(values) * 10.0 ** (places - 1)
+            inexact = np.abs(scaled - np.round(scaled)) > 1e-11 * np.maximum(scaled, 1.0)
+            decimal_places = np.where(inexact & (decimal_places == 0), places, decimal_places)
+    return decimal_places
+
+
+# format strings for each number of decimal places, created as needed
+value_formats = {}
+
+
+# format a value as a string with a given number of decimal places
+def format_value(value, decimal_places):
+    format = value_formats.get(decimal_places)
+    if format is None:
+        format = value_formats[decimal_places] = '%%.%df' % decimal_places
+    return format % value
@@ -1,9 +1,13 @@
+import numpy as np
+
 from block import Block
 
 
 # a basic timer block; turns on for a specified numbers of seconds then turns off for a specified number of seconds
 class Timer(Block):
 
+    time_dependent = True
+
     def __init__(self, block_spec):
         super(Timer, self).__init__(block_spec)
         self.counter = 0
@@ -25,3 +29,10 @@ class Timer(Block):
             self.value = 0
         self.stale = False
         #print('Timer update counter: %d, value: %d' % (self.counter, self.value))
+
+    # this overrides the update_batch function in the Block class; produces the square wave that
+    # a newly created timer would produce over n updates
+    def update_batch(self, sources, n):
+        counters = np.arange(1, n + 1) % max(self.seconds_on + self.seconds_off, 1)
+        values = (counters < self.seconds_on).astype(float)
+        return values, np.zeros(n, dtype=int)
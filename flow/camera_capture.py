@@ -0,0 +1,77 @@
+import time
+import logging
+
+import gevent
+from PIL import Image
+
+from blocks.image_value import ImageValue
+
+
+# a frame captured from a camera; reduced-size copies (renditions) are created on demand and cached
+class CameraFrame(object):
+
+    def __init__(self, image, timestamp):
+        self.image = image
+        self.timestamp = timestamp
+        self.renditions = {}  # maps (width, height) bounds to ImageValue objects
+
+    # get this frame scaled to fit within size (a (width, height) tuple) as an ImageValue
+    def rendition(self, size):
+        value = self.renditions.get(size)
+        if value is None:
+
+            # shrink the smallest existing rendition that is still big enough, rather than the full frame
+            source = self.image
+            for cached_size, cached_value in self.renditions.items():
+                if cached_size[0] >= size[0] and cached_size[1] >= size[1] and cached_size[0] < source.size[0]:
+                    source = cached_value.image
+            image = source.copy()
+            image.thumbnail(size, Image.ANTIALIAS)
+            value = ImageValue(image)
+            self.renditions[size] = value
+        return value
+
+
+# captures frames from a camera device in the background and keeps the most recent one;
+# capturing, resizing, and encoding run in gevent's thread pool so they don't block the main loop
+class CameraCapture(object):
+
+    # sizes is a list of rendition sizes (largest first) to create and encode for each frame as it is captured
+    def __init__(self, device, interval=1.0, sizes=None):
+        self.device = device
+        self.interval = interval
+        self.sizes = sizes or []
+        self.latest_frame = None  # the most recent CameraFrame (if any)
+        self.greenlet = None
+
+    def start(self):
+        if not self.greenlet:
+            self.greenlet = gevent.spawn(self.run)
+
+    def stop(self):
+        if self.greenlet:
+            self.greenlet.kill()
+            self.greenlet = None
+
+    # capture frames until stopped
+    def run(self):
+        threadpool = gevent.get_hub().threadpool
+        while True:
+            start_time = time.time()
+            try:
+                self.latest_frame = threadpool.apply(self.capture_frame)
+            except Exception as err:
+                logging.warning('camera capture failed: %s' % err)
+            gevent.sleep(max(self.interval - (time.time() - start_time), 0))
+
+    # capture an image and prepare its renditions; this runs in a worker thread
+    def capture_frame(self):
+        frame = CameraFrame(self.device.capture_image(), time.time())
+        for size in self.sizes:
+            frame.rendition(size).encoded()
+        return frame
+
+
+# get an encoded rendition of a frame without blocking the main loop (for infrequent, larger renditions)
+def encode_rendition(frame, size):
+    return gevent.get_hub().threadpool.apply(lambda: frame.rendition(size).encoded())
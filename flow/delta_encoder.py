@@ -0,0 +1,64 @@
+from collections import OrderedDict
+
+
+# encodes update_diagram values as deltas: each frame (a dictionary mapping block IDs to formatted values) gets an ID,
+# and only the values that differ from the last keyframe acknowledged by a client are sent;
+# a full keyframe is sent until a client acknowledges a keyframe, every keyframe_interval frames, and on request,
+# so clients that never acknowledge frames always receive complete values;
+# update_diagram messages are received by every client, so deltas are only ever based on keyframes (which every client
+# has received): a client that missed the base keyframe of a delta should request a keyframe
+class DeltaEncoder(object):
+
+    # max_pending is the number of unacknowledged keyframes kept to match acknowledgements against
+    def __init__(self, keyframe_interval=30, max_pending=10):
+        self.keyframe_interval = keyframe_interval
+        self.max_pending = max_pending
+        self.reset()
+
+    # forget all frames (e.g. when a new diagram is started); the next frame will be a keyframe
+    def reset(self):
+        self.frame_id = 0
+        self.pending_keyframes = OrderedDict()  # maps frame IDs to values for keyframes sent but not yet acknowledged
+        self.acked_frame_id = None
+        self.acked_values = None
+        self.frames_since_keyframe = 0
+        self.keyframe_requested = False
+
+    # get the parameters of an update_diagram message for a new frame of values
+    def encode(self, values):
+        self.frame_id += 1
+        keyframe = (self.acked_values is None or self.keyframe_requested or
+                    self.frames_since_keyframe >= self.keyframe_interval)
+        if keyframe:
+            changed_values = dict(values)
+            base_frame_id = None
+            self.frames_since_keyframe = 0
+            self.keyframe_requested = False
+            self.pending_keyframes[self.frame_id] = dict(values)
+            while len(self.pending_keyframes) > self.max_pending:
+                self.pending_keyframes.popitem(last=False)
+        else:
+            changed_values = {}
+            for block_id, value in values.iteritems():
+                if block_id not in self.acked_values or self.acked_values[block_id] != value:
+                    changed_values[block_id] = value
+            base_frame_id = self.acked_frame_id
+        self.frames_since_keyframe += 1
+        return {'values': changed_values, 'frame': self.frame_id, 'base': base_frame_id, 'keyframe': keyframe}
+
+    # record that a client has received a keyframe; later deltas are relative to this keyframe;
+    # returns False if the frame is not a pending keyframe (e.g. a delta, too old, or from before a reset)
+    def acknowledge(self, frame_id):
+        values = self.pending_keyframes.get(frame_id)
+        if values is None:
+            return False
+        self.acked_frame_id = frame_id
+        self.acked_values = values
+        for pending_frame_id in list(self.pending_keyframes):
+            if pending_frame_id <= frame_id:
+                del self.pending_keyframes[pending_frame_id]
+        return True
+
+    # send a keyframe next (e.g. when a client has lost track of the values)
+    def request_keyframe(self):
+        self.keyframe_requested = True
@@ -1,15 +1,25 @@
+import heapq
+
+import numpy as np
+
 from blocks import create_block
+from blocks.precision import infer_decimal_places
 
 
 # represents a data flow diagram
 class Diagram(object):
 
-    # create a data flow diagram using a spec dictionary
-    def __init__(self, name, diagram_spec):
+    # create a data flow diagram using a spec dictionary;
+    # if incremental is true, update() only recomputes blocks downstream of changed values
+    def __init__(self, name, diagram_spec, incremental=False):
         self.name = name
+        self.incremental = incremental
         self.blocks = []
+        self.blocks_by_id = {}
         for block_spec in diagram_spec['blocks']:
-            self.blocks.append(create_block(block_spec))
+            block = create_block(block_spec)
+            self.blocks.append(block)
+            self.blocks_by_id.setdefault(block.id, block)
 
         # set source and destination blocks for each block using source_ids
         for block in self.blocks:
@@ -18,6 +28,14 @@ class Diagram(object):
                 source_block.dest_ids.append(block.id)
                 block.sources.append(source_block)
 
+        # compile the blocks into a flat list ordered so that each block comes after all of its sources
+        self.execution_plan = self.compile_execution_plan()
+        self.plan_positions = dict((block, index) for index, block in enumerate(self.execution_plan))
+        self.time_dependent_blocks = [block for block in self.execution_plan if block.time_dependent]
+
+        # blocks whose values have been set from outside since the last update; initially everything needs computing
+        self.dirty_blocks = set(self.blocks)
+
         # For now set the original diagram here. This might need to
         # change if we are updating the diagram on the controller.
         # Perhaps dynamically recreate this json from the
@@ -26,10 +44,7 @@ class Diagram(object):
 
     # get a block by ID; returns None if none found
     def find_block_by_id(self, id):
-        for block in self.blocks:
-            if block.id == id:
-                return block
-        return None
+        return self.blocks_by_id.get(id)
 
     # get a block by name; returns None if none found
     # (note: names may not be unique; will return first match)
@@ -39,15 +54,105 @@ class Diagram(object):
                 return block
         return None
 
+    # order the blocks topologically (Kahn's algorithm) so that update() can compute them in a single pass;
+    # raises a ValueError if the diagram contains a cycle
+    def compile_execution_plan(self):
+        pending_source_counts = {}
+        ready = []
+        for block in self.blocks:
+            pending_source_counts[block] = len(block.sources)
+            if not block.sources:
+                ready.append(block)
+        plan = []
+        while ready:
+            block = ready.pop()
+            plan.append(block)
+            for dest_id in block.dest_ids:
+                dest_block = self.find_block_by_id(dest_id)
+                pending_source_counts[dest_block] -= 1
+                if pending_source_counts[dest_block] == 0:
+                    ready.append(dest_block)
+        if len(plan) < len(self.blocks):
+            cycle_names = [block.name for block in self.blocks if pending_source_counts[block] > 0]
+            raise ValueError('Diagram %s contains a cycle involving blocks: %s' % (self.name, ', '.join(cycle_names)))
+        return plan
+
+    # run CPU-heavy image filters in the given FilterPool (or in the main process if pool is None)
+    def set_offload_pool(self, pool):
+        for block in self.blocks:
+            if getattr(block, 'cpu_heavy', False):
+                block.offload_pool = pool
+
+    # set the value of a block from outside the diagram (e.g. a sensor reading or camera image);
+    # in incremental mode, the block's downstream blocks are recomputed on the next update only if the value changed
+    def set_block_value(self, block, value, decimal_places=None):
+        if decimal_places is None:
+            decimal_places = block.decimal_places
+        if value != block.value or decimal_places != block.decimal_places:
+            block.value = value
+            block.decimal_places = decimal_places
+            self.dirty_blocks.add(block)
+
     # compute new values for all blocks
     def update(self):
+        if self.incremental:
+            self.update_incremental()
+        else:
+            self.update_all()
+        self.dirty_blocks.clear()
+
+    # compute new values for every block in the diagram
+    def update_all(self):
 
         # mark all blocks as having a stale value
         for block in self.blocks:
             block.stale = True
 
-        # update blocks without destinations;
-        # others will get updated recursively
-        for block in self.blocks:
-            if not block.dest_ids:
-                block.update()
+        # sources always precede their destinations in the plan,
+        # so each block is computed exactly once from up-to-date inputs
+        for block in self.execution_plan:
+            block.update()
+
+    # compute new values only for dirty and time-dependent blocks, then for blocks whose inputs changed as a result;
+    # blocks are visited in plan order (via a heap of plan positions) so each one is computed at most once per update
+    def update_incremental(self):
+        positions = set(self.plan_positions[block] for block in self.dirty_blocks)
+        positions.update(self.plan_positions[block] for block in self.time_dependent_blocks)
+        heap = list(positions)
+        heapq.heapify(heap)
+        while heap:
+            block = self.execution_plan[heapq.heappop(heap)]
+            old_value = block.value
+            old_decimal_places = block.decimal_places
+            block.update()
+            if block in self.dirty_blocks or block.value != old_value or block.decimal_places != old_decimal_places:
+                for dest_id in block.dest_ids:
+                    position = self.plan_positions[self.find_block_by_id(dest_id)]
+                    if position not in positions:
+                        positions.add(position)
+                        heapq.heappush(heap, position)
+
+    # evaluate the diagram over many timesteps at once, as if update() were called once per timestep
+    # on a newly created diagram (block state is not used or modified);
+    # inputs is a dictionary mapping block names to arrays of values (NaN for no value), one per timestep;
+    # decimal_places optionally maps input block names to the decimal places of their values (a number or an array);
+    # by default these are inferred from the values;
+    # returns a dictionary mapping block IDs to arrays of values, with NaN where a block has no value
+    def evaluate_batch(self, inputs, decimal_places=None):
+        lengths = set(len(values) for values in inputs.values())
+        if len(lengths) > 1:
+            raise ValueError('All batch inputs must have the same length')
+        n = lengths.pop() if lengths else 1
+        decimal_places = decimal_places or {}
+        results = {}
+        for block in self.execution_plan:
+            if block.name in inputs:
+                values = np.asarray(inputs[block.name], dtype=float)
+                if block.name in decimal_places:
+                    places = np.zeros(n, dtype=int) + decimal_places[block.name]
+                else:
+                    places = infer_decimal_places(values)
+                results[block.id] = (values, places)
+            else:
+                results[block.id] = block.update_batch([results[source.id] for source in block.sources], n)
+        return dict((id, values) for id, (values, places) in results.items())
@@ -0,0 +1,112 @@
+import numbers
+
+import numpy as np
+
+
+# convert (time string, value, ...) rows into an array of times (seconds since the epoch) and an array per value,
+# a chunk at a time so that a long series is never held as a list of Python objects
+def to_arrays(rows, value_count, chunk_size=4096):
+    chunks = []
+    rows_chunk = []
+    for row in rows:
+        rows_chunk.append(row)
+        if len(rows_chunk) >= chunk_size:
+            chunks.append(chunk_arrays(rows_chunk, value_count))
+            rows_chunk = []
+    chunks.append(chunk_arrays(rows_chunk, value_count))
+    return tuple(np.concatenate([chunk[column] for chunk in chunks]) for column in range(value_count + 1))
+
+
+def chunk_arrays(rows, value_count):
+    times = np.array([row[0].rstrip('Z') for row in rows], dtype='datetime64[us]').astype(np.int64) / 1e6
+    return [times] + [np.array([row[column] for row in rows], dtype=float) for column in range(1, value_count + 1)]
+
+
+# read the times and values of a field from a sequence of query result points into arrays;
+# times are returned as seconds since the epoch; points without a numeric value are skipped
+def read_series(points, field='mean', chunk_size=4096):
+    rows = ((point['time'], point.get(field)) for point in points if isinstance(point.get(field), numbers.Number))
+    return to_arrays(rows, 1, chunk_size)
+
+
+# read the times, minimums, and maximums of a series (e.g. sensor_mean) into arrays, using the min and max fields
+# where present (so that spikes within each point are kept) and the given field otherwise;
+# points without numeric values are skipped
+def read_bounds(points, field='mean', chunk_size=4096):
+    def bounds(point):
+        value = point.get(field)
+        minimum = point.get('min')
+        maximum = point.get('max')
+        minimum = minimum if isinstance(minimum, numbers.Number) else value
+        maximum = maximum if isinstance(maximum, numbers.Number) else value
+        return point['time'], minimum, maximum
+
+    rows = (bounds(point) for point in points)
+    rows = (row for row in rows if isinstance(row[1], numbers.Number) and isinstance(row[2], numbers.Number))
+    return to_arrays(rows, 2, chunk_size)
+
+
+# select up to budget points (as an array of indices) using the largest-triangle-three-buckets algorithm:
+# the first and last points are kept and each bucket in between contributes the point forming the largest triangle
+# with the previously selected point and the average of the next bucket, which preserves peaks
+def lttb(times, values, budget):
+    count = len(values)
+    if count <= budget or count <= 2:
+        return np.arange(count)
+    if budget < 3:
+        return np.array([0, count - 1])[:budget]
+    edges = np.linspace(1, count - 1, budget - 1).astype(int)  # bounds of the budget - 2 buckets between the ends
+    selected = np.empty(budget, dtype=int)
+    selected[0] = 0
+    selected[-1] = count - 1
+    previous = 0
+    for bucket in range(budget - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else count
+        next_time = times[end:next_end].mean()
+        next_value = values[end:next_end].mean()
+        areas = np.abs((times[previous] - next_time) * (values[start:end] - values[previous]) -
+                       (times[previous] - times[start:end]) * (next_value - values[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+# select up to budget points (as an array of indices) by keeping the minimum and maximum of budget / 2 equal-sized buckets
+def min_max_envelope(times, values, budget):
+    count = len(values)
+    if count <= budget:
+        return np.arange(count)
+    bucket_count = max(budget // 2, 1)
+    edges = np.linspace(0, count, bucket_count + 1).astype(int)
+    selected = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            minimum = start + int(np.argmin(values[start:end]))
+            maximum = start + int(np.argmax(values[start:end]))
+            selected.extend(sorted(set([minimum, maximum])))
+    return np.array(selected[:budget], dtype=int)
+
+
+# build a min/max envelope of up to budget points from per-point minimums and maximums (see read_bounds):
+# each of budget / 2 equal-sized buckets contributes its lowest minimum and highest maximum (at their times);
+# returns arrays of the times and values of the envelope points
+def min_max_envelope_bounds(times, minimums, maximums, budget):
+    count = len(times)
+    bucket_count = min(max(budget // 2, 1), count)
+    edges = np.linspace(0, count, bucket_count + 1).astype(int)
+    envelope = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            minimum = start + int(np.argmin(minimums[start:end]))
+            maximum = start + int(np.argmax(maximums[start:end]))
+            envelope.extend(sorted(set([(minimum, minimums[minimum]), (maximum, maximums[maximum])])))
+    envelope = envelope[:budget]
+    return (np.array([times[index] for index, value in envelope], dtype=float),
+            np.array([value for index, value in envelope], dtype=float))
+
+
+downsamplers = {
+    'lttb': lttb,
+    'minmax': min_max_envelope,
+}
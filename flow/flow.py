@@ -4,6 +4,7 @@ import time
 import json
 import logging
 import datetime
+import math
 import subprocess
 from dateutil.parser import parse
 import numbers
@@ -11,15 +12,23 @@ import numbers
 # external imports
 import hjson
 import gevent
-from PIL import Image
 from rhizo.main import c
-from rhizo.extensions.camera import encode_image
 import requests
 
 # our own imports
 from sim_devices import simulate, add_sim_sensor, add_sim_actuator, remove_sim_device
 from diagram_storage import list_diagrams, load_diagram, save_diagram, rename_diagram, delete_diagram
 from diagram import Diagram
+from blocks.precision import format_value
+from blocks.image_value import encode_value
+from blocks.filters.offload import FilterPool
+from camera_capture import CameraCapture, encode_rendition
+from delta_encoder import DeltaEncoder
+from outbound import OutboundPipeline, encoders
+from spool import Spool
+from rollup import RollupAggregator
+from history_cache import HistoryCache, format_time
+from downsample import downsamplers, read_series, read_bounds, min_max_envelope_bounds
 
 from git_tools                          import git_base_command
 
@@ -46,6 +55,20 @@ except ImportError:
 # threshold for idle use messages indicating to stop sending update messages
 IDLE_STOP_UPDATE_THRESHOLD = 5 * 60.0
 
+# maximum number of history points sent in response to a history message (so that they fit in a BLE packet)
+HISTORY_POINT_BUDGET = 120
+
+# maximum number of spooled recording records uploaded at once
+SPOOL_UPLOAD_RECORDS = 500
+
+# convert a value for the store: numbers are stored as floats (so that the field type doesn't change
+# when a block's value switches between ints and floats); None (no value) is returned as is, to be skipped
+def store_value(value):
+    if isinstance(value, numbers.Number):
+        return float(value)
+    return value
+
+
 # The Flow class holds the state and control code for the data flow client program (running on a RasPi or similar).
 class Flow(object):
 
@@ -90,11 +113,33 @@ class Flow(object):
         self.sensaur_hub = None
         self.last_user_message_time = None  # the last user message time (if any)
         self.last_camera_store_time = None  # the last camera sequence update time (if any)
+        self.camera_capture = None  # captures camera frames in the background while a diagram uses the camera
         self.last_record_timestamp = None  # datetime object of last values recorded to long-term storage
         self.recording_interval = None  # number of seconds between storing values in long-term storage
         self.run_name = "Noname"  # name of run for which recording is being saved
         self.sequence_names = {}  # a dictionary mapping block IDs to sequence names (when recording to server)
 
+        # if delta_diagram_updates is set in the config, update_diagram messages only include values that have changed
+        # since the last keyframe (containing all values) acknowledged by a client
+        self.delta_encoder = None
+        if c.config.get('delta_diagram_updates', False):
+            self.delta_encoder = DeltaEncoder(keyframe_interval=c.config.get('diagram_keyframe_interval', 30))
+
+        # outgoing messages are collected and sent together once per tick; clients can select a binary encoding
+        # for MQTT (BLE) messages and batching of messages using a set_message_encoding message;
+        # up to outbound_queue_size messages wait while the connection is slow (newer values replace older ones),
+        # and up to outbound_queue_size messages wait to be written to a slow MQTT broker connection (see init_mqtt)
+        self.outbound = OutboundPipeline(c.send_message,
+                                         encoding=c.config.get('outbound_message_encoding', 'json'),
+                                         batching=c.config.get('batch_outbound_messages', False),
+                                         max_queued=c.config.get('outbound_queue_size', 100))
+
+        # worker processes for CPU-heavy image filters (if enabled); started before any diagram is created,
+        # while their shared image buffers are allocated as images are filtered
+        self.filter_pool = None
+        if c.config.get('image_filter_processes', 0):
+            self.filter_pool = FilterPool(processes=c.config['image_filter_processes'])
+
         c.add_message_handler(self)  # register to receive messages from server/websocket
         c.auto_devices.add_input_handler(self)
 
@@ -112,7 +157,7 @@ class Flow(object):
             name = c.config.startup_diagram
             diagram_spec = load_diagram(name)
             logging.debug("Flow.__init__: loading diagram: %s" % name)
-            self.diagram = Diagram(name, diagram_spec)
+            self.diagram = self.create_diagram(name, diagram_spec)
 
 
         # call init functions. if they fail, mqtt, store resp. will be noop
@@ -151,12 +196,37 @@ class Flow(object):
                         try:
                             diagram_spec = load_diagram(name)
                             logging.debug("Flow.__init__: loading diagram: %s" % name)
-                            self.diagram = Diagram(name, diagram_spec)
+                            self.diagram = self.create_diagram(name, diagram_spec)
                         except Exception as err:
                             logging.warning("Flow.__init__: can't load diagram %s: %s" % (name, err))
         else:
             logging.debug("Store disabled.")
 
+        # if recording_spool_path is configured, recorded data is written to an on-disk spool in that directory
+        # and uploaded to the store and server by drain_spool, so that data recorded while they are unreachable
+        # is not lost; otherwise recorded data is sent directly
+        self.spool = None
+        spool_path = c.config.get('recording_spool_path')
+        if spool_path:
+            consumers = ['server', 'store'] if self.store else ['server']
+            try:
+                self.spool = Spool(spool_path, consumers,
+                                   max_bytes=c.config.get('recording_spool_max_bytes', 64 * 1024 * 1024))
+            except (IOError, OSError) as err:
+                logging.error("Can't open recording spool; recorded data will be sent directly: %s" % err)
+
+        # downsampled history is cached for repeated history requests
+        self.history_cache = None
+        if self.store:
+            self.history_cache = HistoryCache(lambda query: list(self.store.query(query).get_points()))
+
+        # if rollup_intervals is configured (e.g. [60]), sensor inputs and recorded block values are aggregated
+        # into per-minute (and any coarser) rollups in the store's sensor_mean measurements;
+        # this is off by default, since sensor_mean is usually computed by a continuous query in the database
+        self.rollup = None
+        if self.store and c.config.get('rollup_intervals', []):
+            self.rollup = RollupAggregator(self.save_rollup, intervals=c.config.get('rollup_intervals', []))
+
 
         self.operational_status     = self.OP_STATUS_READY
 
@@ -191,8 +261,9 @@ class Flow(object):
             #TODO: load mq_topic from config. It has to be the same
             # --- as in gattserver/hpserver.py
             mq_topic = "flow/ble"
-            self.publisher = MqttPublisher(mq_topic)
+            self.publisher = MqttPublisher(mq_topic, max_queued_messages=c.config.get('outbound_queue_size', 100))
             self.publisher.start()
+            self.outbound.publish = self.publisher.publish
             #print("MQTT Initialized.")
             logging.info("MQTT Initialized.")
         except:
@@ -203,11 +274,21 @@ class Flow(object):
     def init_store(self):
         """Initialize store."""
         try:
-            from influxstore import Store
             # TODO load pin for this device
             my_pin = '2671'
+            if c.config.get('store_backend', 'influxdb') == 'sqlite':
+                # local store for controllers without enough memory for influxdb
+                from sqlitestore import SqliteStore
+                self.store = SqliteStore(c.config.get('store_path', 'flow.db'), pin=my_pin,
+                                         batch_size=c.config.get('store_batch_size', 100),
+                                         flush_interval=c.config.get('store_flush_interval', 5.0))
+                logging.info("SQLite store Initialized.")
+                return
+            from influxstore import Store
             # open store to flow database
-            self.store = Store(database="flow", pin=my_pin)
+            self.store = Store(database="flow", pin=my_pin,
+                               batch_size=c.config.get('store_batch_size', 100),
+                               flush_interval=c.config.get('store_flush_interval', 5.0))
             logging.info("Influxdb store Initialized.")
         except Exception as err:
             logging.error("Can't initialize store. Probably influxdb library not installed or influxdb not running. Store will be disabled: %s" % \
@@ -231,6 +312,10 @@ class Flow(object):
         # launch a greenlet to send watchdog messages to server
         gevent.spawn(self.send_watchdog)
 
+        # launch a greenlet to upload recorded data
+        if self.spool:
+            gevent.spawn(self.drain_spool)
+
         # launch sensaur greenlets if enabled
         if self.sensaur_hub:
             self.sensaur_hub.start_greenlets()
@@ -243,6 +328,8 @@ class Flow(object):
             if datetime.datetime.utcnow() > timestamp:
                 if self.diagram:
                     self.update_diagram_and_send_values(timestamp)
+                if self.rollup:
+                    self.rollup.flush(timestamp)
 
                 # the processing could have taken more than a second, so update the target timestamp as many times as needed (by an integer amount) to be in the future
                 # alternative: could compute timedelta and do some math to do this in a single step
@@ -268,11 +355,10 @@ class Flow(object):
             #logging.debug('flow.start loop: block=%s' % block)
             if block.output_type == 'i':  # only send camera/image updates if recent message from user
                 if self.last_user_message_time and time.time() < self.last_user_message_time + 300:
-                    value = block.value
+                    value = encode_value(block.value)  # images are only encoded when sent
             else:
                 if block.value is not None:
-                    format = '%' + '.%df' % block.decimal_places
-                    value = format % block.value
+                    value = format_value(block.value, block.decimal_places)
             values[block.id] = value
 
             # send values to actuators
@@ -292,7 +378,10 @@ class Flow(object):
         #logging.debug('flow.start loop: values=%s' % values)
         if self.last_user_message_time and (time.time() - self.last_user_message_time < IDLE_STOP_UPDATE_THRESHOLD):
             #logging.debug("IDLE_STOP_UPDATE_THRESHOLD passed")
-            self.send_message('update_diagram', {'values': values})
+            if self.delta_encoder:
+                self.send_message('update_diagram', self.delta_encoder.encode(values))
+            else:
+                self.send_message('update_diagram', {'values': values})
         else:
             pass
             #logging.debug("IDLE_STOP_UPDATE_THRESHOLD failed")
@@ -343,6 +432,11 @@ class Flow(object):
                 # > 7d and < 30d
                 # 120 records max
                 ret = "8h"
+            else:
+                # > 30d
+                # 120 records max: the range usually spans one more bucket than it has intervals,
+                # once the first and last buckets are aligned to the interval
+                ret = "%dh" % math.ceil(total_seconds / ((HISTORY_POINT_BUDGET - 1) * 3600.0))
         except Exception as err:
             # Can't parse: return default (None)
             ret = None
@@ -364,6 +458,19 @@ class Flow(object):
             'list_software_versions':       ListVersionsCommand,
             'update_software_version':      UpdateSoftwareCommand }
 
+        #
+        # Delta update acknowledgements are sent automatically by clients,
+        # so they are handled here and do not count as user activity.
+        #
+        if type == 'update_diagram_ack':
+            if self.delta_encoder:
+                self.delta_encoder.acknowledge(params.get('frame'))
+            return True
+        if type == 'request_keyframe':
+            if self.delta_encoder:
+                self.delta_encoder.request_keyframe()
+            return True
+
         #
         # Messages allowed when in recording mode
         #
@@ -474,7 +581,7 @@ class Flow(object):
 
             logging.debug("handle_message: start_diagram - loading diagram: %s" % params['name'])
             diagram_spec = load_diagram(params['name'])
-            self.diagram = Diagram(params['name'], diagram_spec)
+            self.diagram = self.create_diagram(params['name'], diagram_spec)
             #local_config = hjson.loads(open('local.hjson').read())  # save name of diagram to load when start script next time
             #local_config['startup_diagram'] = params['name']
             #open('local.hjson', 'w').write(hjson.dumps(local_config))
@@ -692,6 +799,17 @@ class Flow(object):
             remove_sim_device()
         elif type == 'request_status':
             self.send_status()
+        elif type == 'set_message_encoding':
+            encoding = params.get('encoding', self.outbound.encoding)
+            success = self.outbound.set_encoding(encoding)
+            if success and 'batch' in params:
+                self.outbound.batching = bool(params['batch'])
+            self.send_message(  type + '_response',
+                                {   'success':      success,
+                                    'encoding':     self.outbound.encoding,
+                                    'batch':        self.outbound.batching,
+                                    'available':    sorted(encoders)
+                                })
 
         elif type in [  'download_software_updates',
                         'list_software_versions',
@@ -724,8 +842,10 @@ class Flow(object):
          - websocket
          - websocket plus ble
 
-        if elable_ble is set in config, we send to both ble (via mqtt) and websocket (via c._send_message).
+        if elable_ble is set in config, we send to both ble (via mqtt) and websocket (via c.send_message).
         Otherwise, we send to websocket only via c.send_message
+
+        Messages are queued in the outbound pipeline and sent when the current greenlet yields.
         """
         #logging.debug('send_message type=%s' % type)
 
@@ -737,20 +857,9 @@ class Flow(object):
         own_path = c.path_on_server()
         parameters['src_folder'] = own_path
 
-        if c.config.get('enable_ble', False) and self.publisher:
-            # update_sequence not needed by ble, only by store
-            if type != "update_sequence":
-                jsonobj = {"type": type, "parameters": parameters}
-                #jsonmsg = '{"type":"sensor_update","parameters":{"values":[388.0],"name":"light"}}'
-                jsonmsg = json.dumps(jsonobj)
-                #logging.debug('mqtt published : %s' % jsonmsg)
-                #if not self.integ_test:
-                self.publisher.publish(jsonmsg)
-            # also send message to websocket
-            c.send_message(type, parameters)
-        else:
-            # send message to websocket
-            c.send_message(type, parameters)
+        # the pipeline publishes to ble (except update_sequence messages, which are only needed by the store)
+        # if MQTT has been initialized
+        self.outbound.send(type, parameters)
 
     #
     # Handle an incoming value from a sensor device (connected via USB)
@@ -785,20 +894,12 @@ class Flow(object):
                     self.store.save('sensor', name, value)
                 except Exception as err:
                     logging.error("store.save error: %s" % err)
-            # simulate update_diagram when it was not requested by flow-server
-            #  i.e. when flow-server is not reachable after flow restart
-            #if self.publisher:
-            #    jsonobj = {"type": "update_diagram", "parameters": {'values': { '1': value}}}
-            #    jsonmsg = json.dumps(jsonobj)
-            #    #logging.debug('mqtt published : %s' % jsonmsg)
-            #    self.publisher.publish(jsonmsg)
         # ---- end of of send_message replacement
 
         if self.diagram:
             block = self.diagram.find_block_by_name(name)
             if block:
-                block.decimal_places = block.compute_decimal_places(values[0])
-                block.value = float(values[0])
+                self.diagram.set_block_value(block, float(values[0]), block.compute_decimal_places(values[0]))
 
         #
         # Store last read sensor data associated with a physical sensor.
@@ -806,10 +907,22 @@ class Flow(object):
         now     = datetime.datetime.utcnow()
         value   = float(values[0])
         self.sensor_data_latest[name] = (now, value)
+        if self.rollup:
+            self.rollup.add(name, value, now)
 
     # record data by sending it to the server and/or storing it locally
     def record_data(self, blocks, timestamp):
 
+        # sensor values are already included in the rollups by handle_input
+        if self.rollup:
+            for block in blocks:
+                if block.name not in self.sensor_data_latest and block.is_numeric():
+                    self.rollup.add(block.name, block.value, timestamp)
+
+        if self.spool:
+            self.spool_data(blocks, timestamp)
+            return
+
         # publish to recording queue to be saved by storage service or save directly
         # store block_name and value into 'sensor' measurement
         # perform store only if store has been initialized properly
@@ -818,9 +931,11 @@ class Flow(object):
                 for block in blocks:
                     try:
                         logging.debug("record_data: %s=%s" % (block.name, block.value))
-                        self.store.save('sensor', block.name, block.value)
+                        self.store.save('sensor', block.name, encode_value(block.value), timestamp=timestamp)
                     except Exception as err:
                         logging.error("store.save error: %s" % err)
+                    if self.history_cache:
+                        self.history_cache.invalidate(block.name, timestamp)
 
         # store blocks on server
         sequence_prefix = self.recording_location + '/'
@@ -829,11 +944,81 @@ class Flow(object):
             id_str = str(b.id)
             if id_str in self.sequence_names:
                 seq_name = sequence_prefix + self.sequence_names[id_str]
-                values[seq_name] = b.value
+                values[seq_name] = encode_value(b.value)
         logging.debug('c.update_sequences %s' % (values))
         if values:
             c.update_sequences(values, timestamp)
 
+    # add recorded data to the spool, to be uploaded by drain_spool
+    def spool_data(self, blocks, timestamp):
+        record = {'timestamp': timestamp.isoformat()}
+        if self.store and not self.integ_test:
+            values = dict((block.name, store_value(encode_value(block.value))) for block in blocks)
+            record['store'] = dict((name, value) for name, value in values.iteritems() if value is not None)
+        sequence_prefix = self.recording_location + '/'
+        sequences = {}
+        for block in blocks:
+            id_str = str(block.id)
+            if id_str in self.sequence_names:
+                sequences[sequence_prefix + self.sequence_names[id_str]] = encode_value(block.value)
+        if sequences:
+            record['sequences'] = sequences
+        try:
+            self.spool.append(record)
+        except (IOError, OSError) as err:
+            logging.error("spool error: %s" % err)
+
+    # upload spooled data to the store and server; records stay in the spool until they have been uploaded
+    def drain_spool(self):
+        uploaders = {'store': self.upload_to_store, 'server': self.upload_to_server}
+        while True:
+            backlog = False
+            for consumer in self.spool.consumers:
+                try:
+                    records, position = self.spool.read(consumer, SPOOL_UPLOAD_RECORDS)
+                    if records:
+                        uploaders[consumer](records)
+                        self.spool.commit(consumer, position)
+                        backlog = backlog or len(records) == SPOOL_UPLOAD_RECORDS
+                except Exception as err:
+                    logging.error("error uploading spooled data to %s: %s" % (consumer, err))
+            c.sleep(0.1 if backlog else 5)
+
+    # write spooled records to the store (in gevent's thread pool, since the influxdb client blocks);
+    # points the store rejects are dropped (so that they don't hold up the rest), while other errors are raised
+    # so that the records are retried; the cached history of the uploaded values is invalidated
+    def upload_to_store(self, records):
+        points = []
+        time_ranges = {}  # maps names to the first and last timestamps of their values
+        for record in records:
+            timestamp = parse(record['timestamp'])
+            for name, value in record.get('store', {}).iteritems():
+                value = store_value(value)
+                if value is not None:
+                    points.append(self.store.point('sensor', name, value, timestamp=timestamp))
+                    first, last = time_ranges.get(name, (timestamp, timestamp))
+                    time_ranges[name] = (min(first, timestamp), max(last, timestamp))
+        if points:
+            gevent.get_hub().threadpool.apply(self.store.save_many, (points, True))
+        if self.history_cache:
+            for name, (first, last) in time_ranges.iteritems():
+                self.history_cache.invalidate(name, first, last)
+
+    def upload_to_server(self, records):
+        for record in records:
+            if 'sequences' in record:
+                logging.debug('c.update_sequences %s' % (record['sequences']))
+                c.update_sequences(record['sequences'], parse(record['timestamp']))
+
+    # write a rollup (see RollupAggregator) to the store
+    def save_rollup(self, measurement, name, fields, timestamp):
+        try:
+            self.store.save(measurement, name, fields, timestamp=timestamp)
+        except Exception as err:
+            logging.error("store.save error: %s" % err)
+        if self.history_cache and measurement == self.history_cache.measurement:
+            self.history_cache.invalidate(name, timestamp)
+
     # send locally recorded time series data to browser
     def send_history(self, params):
 
@@ -841,7 +1026,6 @@ class Flow(object):
         #  over ble
         #  Sample parameters for type history: {u'count': 100000, u'start_timestamp': u'2017-06-15T23:50:19.567Z',
         #    u'name': u'temperature', u'end_timestamp': u'2017-06-16T00:00:19.567Z'}
-        history = []
         if self.store:
             name = params.get("name")
             start = params.get("start_timestamp")
@@ -857,23 +1041,38 @@ class Flow(object):
                 #
                 interval = self.calc_auto_interval(start, end)
                 #
+            # downsample (from the message or config) selects how history is reduced to fit the budget:
+            #   mean: the mean of each interval (if there is an interval)
+            #   lttb: largest-triangle-three-buckets point selection, which preserves peaks
+            #   minmax: the lowest min and highest max (of the min and max fields) of each of budget / 2 buckets
+            downsample = params.get("downsample", c.config.get('history_downsample', 'mean'))
+            budget = min(int(count), HISTORY_POINT_BUDGET) if count else HISTORY_POINT_BUDGET
             try:
-                if interval:
-                    query = \
-                      """SELECT mean(mean) from sensor_mean where "name"='%s' and time > '%s' and time <= '%s' group by time(%s) limit %s""" % \
-                      (name, start, end, interval, count)
+                if interval and downsample not in downsamplers:
+                    # downsampled history comes from the cache (which only queries buckets it doesn't have)
+                    logging.debug("interval=%s, cached history for %s" % (interval, name))
+                    points = self.history_cache.get(name, start, end, interval, budget)
                 else:
+                    fields = 'mean, min, max' if downsample == 'minmax' else 'mean'
                     query = \
-                      """SELECT mean from sensor_mean where "name"='%s' and time > '%s' and time <= '%s' limit %s""" % \
-                      (name, start, end, count)
-                logging.debug("interval=%s, query=%s" % (interval, query))
-                rs = self.store.query(query)
-
-                # sample data:
-                # points: [{u'count': 60, u'name': u'light', u'pin': u'2671', u'min': 242,
-                #  u'max': 245, u'time': u'2017-06-16T20:42:00Z', u'mean': 244.8}, ...
-
-                points = list(rs.get_points())
+                      """SELECT %s from sensor_mean where "name"='%s' and time > '%s' and time <= '%s'""" % \
+                      (fields, name, start, end)
+                    logging.debug("downsample=%s, query=%s" % (downsample, query))
+                    rs = self.store.query(query)
+
+                    # sample data:
+                    # points: [{u'count': 60, u'name': u'light', u'pin': u'2671', u'min': 242,
+                    #  u'max': 245, u'time': u'2017-06-16T20:42:00Z', u'mean': 244.8}, ...
+
+                    # the points are read into arrays and reduced to the budget
+                    if downsample == 'minmax':
+                        # the envelope uses the min and max of each minute, so short spikes are kept
+                        times, values = min_max_envelope_bounds(*read_bounds(rs.get_points()), budget=budget)
+                        selected = range(len(times))
+                    else:
+                        times, values = read_series(rs.get_points())
+                        selected = downsamplers.get(downsample, downsamplers['lttb'])(times, values, budget)
+                    points = [{'time': format_time(int(times[i])), 'mean': values[i]} for i in selected]
                 #logging.debug("%d points: first 10: %s" % (len(points), points[:10]))
 
                 if c.config.get('enable_ble', False) and self.publisher:
@@ -883,16 +1082,10 @@ class Flow(object):
                     if not values:
                         values = [0,0]
                         timestamps = [start, end]
-                    jsonobj = {"type": type, "parameters": { "name": name,
-                      "values": values, "timestamps": timestamps }
-                    }
-                    #jsonmsg = '{"type":"sensor_update","parameters":{"values":[388.0],"name":"light"}}'
-                    jsonmsg = json.dumps(jsonobj)
-                    #logging.debug('mqtt published : %s' % jsonmsg)
-                    self.publisher.publish(jsonmsg)
+                    # sent through the outbound pipeline (in the client's selected encoding) to BLE clients only
+                    self.send_message('history', {'name': name, 'values': values, 'timestamps': timestamps})
             except Exception as err:
                 logging.error("store.query error: %s" % err)
-        #self.send_message('history', {'values': history})
 
     #
     # send client info to server/browser
@@ -930,6 +1123,8 @@ class Flow(object):
             'recording_interval':   self.recording_interval,
             'ip_addresses':         ip_map,
             'mac_address':          mac_addr,
+            'outbound_queue_depth': self.outbound.queue_depth(),
+            'outbound_dropped':     self.outbound.dropped_counts,
         }
 
         if self.diagram:
@@ -1112,7 +1307,7 @@ class Flow(object):
             #
             # Send all sensor data.
             #
-            c.send_message('send_sensor_data_response',
+            self.outbound.send('send_sensor_data_response',
                             {   'success':      True,
                                 'data':         self.get_sensor_data(),
                                 'src_folder':   c.path_on_server()  } )
@@ -1140,7 +1335,7 @@ class Flow(object):
             minutes += 1
 
             self.send_status()
-            c.send_message('watchdog', {})
+            self.outbound.send('watchdog', {})
             c.sleep(60)
 
     # start capturing from a camera
@@ -1159,7 +1354,7 @@ class Flow(object):
         else:
             logging.warning('camera extension not added')
 
-    # get a new image for the camera block and store it as a base64 encoded value;
+    # set the camera blocks to the latest frame captured in the background (by self.camera_capture);
     # for now we'll support just one physical camera (though it can feed into multiple camera blocks)
     def update_camera_blocks(self):
         if hasattr(c, 'camera') and c.camera.device and c.camera.device.is_connected():
@@ -1167,23 +1362,38 @@ class Flow(object):
             for block in self.diagram.blocks:
                 if block.type == 'camera':
                     camera_block_defined = True
-            if camera_block_defined:
-                image = c.camera.device.capture_image()
-
-                # store camera image once a minute
-                current_time = time.time()
-                if not self.last_camera_store_time or current_time > self.last_camera_store_time + 60:
-                    image.thumbnail((720, 540), Image.ANTIALIAS)
-                    self.send_message('update_sequence', {'sequence': 'image', 'value': encode_image(image)})
-                    self.last_camera_store_time = current_time
-                    logging.debug('updating image sequence')
-
-                # create small thumbnail to send to UI
-                image.thumbnail((320, 240), Image.ANTIALIAS)
-                data = encode_image(image)
-                for block in self.diagram.blocks:
-                    if block.type == 'camera':
-                        block.value = data
+            if not camera_block_defined:
+                if self.camera_capture:
+                    self.camera_capture.stop()
+                    self.camera_capture = None
+                return
+
+            # start capturing; the small thumbnail for the UI is prepared along with each frame
+            if not self.camera_capture or self.camera_capture.device is not c.camera.device:
+                if self.camera_capture:
+                    self.camera_capture.stop()
+                self.camera_capture = CameraCapture(c.camera.device, sizes=[(320, 240)])
+                self.camera_capture.start()
+            frame = self.camera_capture.latest_frame
+            if not frame:
+                return
+
+            # store camera image once a minute
+            current_time = time.time()
+            if not self.last_camera_store_time or current_time > self.last_camera_store_time + 60:
+                gevent.spawn(self.store_camera_frame, frame)
+                self.last_camera_store_time = current_time
+
+            data = frame.rendition((320, 240))
+            for block in self.diagram.blocks:
+                if block.type == 'camera':
+                    self.diagram.set_block_value(block, data)
+
+    # send a larger version of a camera frame to the server's image sequence
+    def store_camera_frame(self, frame):
+        data = encode_rendition(frame, (720, 540))
+        self.send_message('update_sequence', {'sequence': 'image', 'value': data})
+        logging.debug('updating image sequence')
 
     #
     # Get user friendly controller display name
@@ -1192,6 +1402,21 @@ class Flow(object):
         parts = c.path_on_server().split('/')
         return parts[-1]
 
+    #
+    # Create a diagram from a spec; if incremental_diagram_update is set in
+    # the config, each update only recomputes blocks affected by changed values.
+    # CPU-heavy image filters run in a pool of image_filter_processes worker
+    # processes if that is set. Delta updates restart with a keyframe.
+    #
+    def create_diagram(self, name, diagram_spec):
+        diagram = Diagram(name, diagram_spec, incremental=c.config.get('incremental_diagram_update', False))
+        if self.delta_encoder:
+            self.delta_encoder.reset()
+        if self.filter_pool:
+            self.filter_pool.clear()
+            diagram.set_offload_pool(self.filter_pool)
+        return diagram
+
     #
     # Set the currently running diagram
     #
@@ -1213,7 +1438,7 @@ class Flow(object):
                 return
 
             name            = diagram_spec['name']
-            self.diagram    = Diagram(name, diagram_spec)
+            self.diagram    = self.create_diagram(name, diagram_spec)
             self.username   = params['username']
 
             self.send_message(
@@ -1237,7 +1462,7 @@ class Flow(object):
             logging.debug(
                 "handle_message: set_diagram name %s" % (name))
 
-            self.diagram = Diagram(name, diagram_spec)
+            self.diagram = self.create_diagram(name, diagram_spec)
 
 
 # ======== UTILITY FUNCTIONS ========
@@ -0,0 +1,116 @@
+import datetime
+import calendar
+from collections import OrderedDict
+
+from dateutil.parser import parse
+
+
+# seconds per unit for influxdb group by intervals
+INTERVAL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 24 * 3600, 'w': 7 * 24 * 3600}
+
+
+def interval_seconds(interval):
+    return int(interval[:-1]) * INTERVAL_UNITS[interval[-1]]
+
+
+def to_seconds(timestamp):
+    if isinstance(timestamp, basestring):
+        timestamp = parse(timestamp)
+    return calendar.timegm(timestamp.utctimetuple())
+
+
+def format_time(seconds):
+    return datetime.datetime.utcfromtimestamp(seconds).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+# caches downsampled sensor history (the mean of sensor_mean values per interval) for send_history;
+# values are cached per (name, interval) for buckets aligned to the interval (as with influxdb's group by time),
+# so a request only queries the buckets that aren't cached: typically just the most recent one;
+# buckets are only cached once they end settle_seconds in the past, and invalidate() drops buckets with new data
+# (which the store calls for each write, since sensor_mean is computed from the stored values by the database);
+# invalidated buckets are also not cached again for settle_seconds, so that they aren't cached before the database
+# has updated them; query(querystr) runs a query and returns a list of points
+class HistoryCache(object):
+
+    def __init__(self, query, measurement='sensor_mean', max_series=32, max_buckets=10000, settle_seconds=120):
+        self.query = query
+        self.measurement = measurement
+        self.max_series = max_series
+        self.max_buckets = max_buckets
+        self.settle_seconds = settle_seconds
+        self.series = OrderedDict()  # maps (name, interval) to dictionaries mapping bucket start times to mean values
+        self.unsettled = {}  # maps names to (first timestamp, last timestamp, time settled) for recently written data
+
+    # get a list of {'time': ..., 'mean': ...} points for the buckets from start to end (strings or datetimes);
+    # the first and last buckets cover their whole interval (rather than just the part within the range);
+    # if there are more than limit buckets, the most recent limit buckets are returned
+    def get(self, name, start, end, interval, limit=None):
+        seconds = interval_seconds(interval)
+        first = to_seconds(start) // seconds * seconds
+        last = to_seconds(end) // seconds * seconds
+        if limit is not None:
+            first = max(first, last - (int(limit) - 1) * seconds)
+        key = (name, interval)
+        buckets = self.series.pop(key, {})
+        self.series[key] = buckets  # most recently used
+        while len(self.series) > self.max_series:
+            self.series.popitem(last=False)
+        if len(buckets) > self.max_buckets:
+            buckets.clear()
+
+        # query each run of missing buckets
+        values = {}
+        now = to_seconds(datetime.datetime.utcnow())
+        closed_before = now - self.settle_seconds
+        unsettled = self.unsettled.get(name)
+        if unsettled and unsettled[2] <= now:
+            del self.unsettled[name]
+            unsettled = None
+        time = first
+        while time <= last:
+            if time in buckets:
+                time += seconds
+                continue
+            run_start = time
+            while time <= last and time not in buckets:
+                time += seconds
+            query = """SELECT mean(mean) from %s where "name"='%s' and time >= '%s' and time < '%s' group by time(%s)""" % \
+                    (self.measurement, name.replace("'", "\\'"), format_time(run_start), format_time(time), interval)
+            for bucket_start in range(run_start, time, seconds):
+                values[bucket_start] = None
+            for point in self.query(query):
+                values[to_seconds(point['time'])] = point.get('mean')
+            for bucket_start in range(run_start, time, seconds):
+                if bucket_start + seconds <= closed_before and \
+                        not (unsettled and unsettled[0] < bucket_start + seconds and bucket_start <= unsettled[1]):
+                    buckets[bucket_start] = values[bucket_start]
+
+        points = []
+        for bucket_start in range(first, last + 1, seconds):
+            value = buckets[bucket_start] if bucket_start in buckets else values.get(bucket_start)
+            points.append({'time': format_time(bucket_start), 'mean': value})
+        return points
+
+    # drop cached buckets containing the timestamps (datetimes) from start to end (or just start) for a name
+    # (e.g. when new values have been stored)
+    def invalidate(self, name, start, end=None):
+        first = to_seconds(start)
+        last = to_seconds(end) if end is not None else first
+        now = to_seconds(datetime.datetime.utcnow())
+        unsettled = self.unsettled.get(name)
+        if unsettled and unsettled[2] > now:  # a single range per name, so that frequent writes don't add up
+            first, last = min(first, unsettled[0]), max(last, unsettled[1])
+        self.unsettled[name] = (first, last, now + self.settle_seconds)
+        for (series_name, interval), buckets in self.series.items():
+            if series_name == name:
+                interval_length = interval_seconds(interval)
+                first_bucket = first // interval_length * interval_length
+                if (last - first_bucket) // interval_length < len(buckets):
+                    bucket_starts = range(first_bucket, last + 1, interval_length)
+                else:
+                    bucket_starts = [bucket_start for bucket_start in buckets if first_bucket <= bucket_start <= last]
+                for bucket_start in bucket_starts:
+                    buckets.pop(bucket_start, None)
+
+    def clear(self):
+        self.series.clear()
@@ -10,6 +10,9 @@ mypin = '2671'
 store = Store(database="flow", pin=mypin)
 store.save('sensor', 'light', 212.22)
 
+Points are written in batches by a background thread (see batch_writer);
+call store.close() to write any remaining points.
+
 # --- read
 
 TODO: implement
@@ -55,18 +58,33 @@ time                           name     pin  value
 
 """
 import datetime
+import logging
 # start influxdb client
 from influxdb import InfluxDBClient
 from influxdb.client import InfluxDBClientError
 
+# flow imports this module as influxstore; hissync.py (python 3) imports it as flow.influxstore
+try:
+    from batch_writer import BatchWriter, write_valid
+except ImportError:
+    from flow.batch_writer import BatchWriter, write_valid
+
+
+def is_rejected(err):
+    """True for errors writing points that retrying won't fix (e.g. a field type conflict)."""
+    return isinstance(err, InfluxDBClientError) and err.code == 400
 
 
 class Store(object):
     """Encapsulates influxdb store.
+
+    Saved points are buffered and written in batches of batch_size points
+    or every flush_interval seconds; a batch_size of 0 writes each save
+    immediately.
     """
 
     def __init__(self, database, pin, hostname="localhost", port=None, username=None,
-          password=None):
+          password=None, batch_size=100, flush_interval=5.0):
         self.pin = pin
         self.hostname = hostname
         self.port = port if port else 8086
@@ -76,9 +94,18 @@ class Store(object):
         self.pin = pin
         print("connecting to %s:%s; username=%s, password=%s" % (self.hostname, self.port, self.username, self.password))
         self.dbclient = InfluxDBClient(self.hostname, self.port, self.username, self.password, database=self.database)
-
-    def save(self, measurement, name, value, extra_tags = {}):
-        dt = datetime.datetime.utcnow()
+        self.writer = None
+        if batch_size:
+            self.writer = BatchWriter(self.dbclient.write_points, batch_size=batch_size, flush_interval=flush_interval,
+                                      is_rejected=is_rejected)
+
+    def save(self, measurement, name, value, extra_tags = {}, timestamp=None):
+        """Save a value; the point's time is the given timestamp (a datetime) or now."""
+        self.save_many([self.point(measurement, name, value, extra_tags, timestamp)])
+
+    def point(self, measurement, name, value, extra_tags = {}, timestamp=None):
+        """Create an influxdb point dictionary for a value (or for a dictionary of field values)."""
+        dt = timestamp or datetime.datetime.utcnow()
         tags = extra_tags.copy()
         tags.update({
                     "name": name,
@@ -89,19 +116,33 @@ class Store(object):
             "time": dt,
             # "time": int(past_date.strftime('%s')),
             "measurement": measurement,
-            'fields':  {
+            'fields':  value if isinstance(value, dict) else {
                 'value': value,
                 },
             'tags': tags,
             }
-        self.dbclient.write_points([point])
-
-    def save_many(self, points):
-        self.write_points(points)
-
-    def query(self, querystr):
-        return self.dbclient.query(querystr)
-
-    def close():
-        pass
+        return point
+
+    def save_many(self, points, wait=False):
+        """Save a list of influxdb point dictionaries; if wait is true, the points are
+        written before returning: points the server rejects are logged and dropped
+        (see write_valid), and other errors are raised to the caller."""
+        if self.writer and not wait:
+            self.writer.add(points)
+        else:
+            rejected = write_valid(self.dbclient.write_points, points, is_rejected)
+            if rejected:
+                logging.error("Store: dropped %d points rejected by the server, e.g. %s" % (len(rejected), rejected[0]))
+
+    def query(self, querystr, **kwargs):
+        """Run a query; waiting points are written first so that queries see all saved values.
+        Other arguments (e.g. chunked=True) are passed to the influxdb client."""
+        if self.writer:
+            self.writer.flush()
+        return self.dbclient.query(querystr, **kwargs)
+
+    def close(self):
+        """Write any waiting points."""
+        if self.writer:
+            self.writer.close()
 
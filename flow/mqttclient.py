@@ -25,6 +25,7 @@ p.publish('test 123')
 """
 import paho.mqtt.client as mqtt  
 import time
+from collections import deque
 
 def on_connect(client, userdata, flags, rc):
     m="Connected flags"+str(flags)+"; result code="\
@@ -63,8 +64,27 @@ class MqttBrokerClient(object):
 
 class MqttPublisher(MqttBrokerClient):
 
+    # max_queued_messages limits the messages waiting to be written to the broker connection while it is slow
+    # (0 for no limit); paho's own limit only applies to QoS>0 messages, so it is enforced here
+    def __init__(self, topic, client_id=None, hostname="localhost", max_queued_messages=100):
+        MqttBrokerClient.__init__(self, topic, client_id, hostname)
+        self.max_queued_messages = max_queued_messages
+        self.unsent = deque()  # MQTTMessageInfo objects of the published messages not yet written (oldest first)
+        self.dropped_count = 0
+
+    # returns False if the message was dropped (because max_queued_messages are waiting or the client is disconnected)
     def publish(self, msg):
-        self.client.publish(self.topic, msg) 
+        while self.unsent and self.unsent[0].is_published():
+            self.unsent.popleft()
+        if self.max_queued_messages and len(self.unsent) >= self.max_queued_messages:
+            self.dropped_count += 1
+            return False
+        info = self.client.publish(self.topic, msg)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self.dropped_count += 1
+            return False
+        self.unsent.append(info)
+        return True
         
 class MqttSubscriber(MqttBrokerClient):
 
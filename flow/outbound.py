@@ -0,0 +1,153 @@
+import json
+import logging
+from collections import deque
+
+import gevent
+import gevent.event
+
+# optional compact binary encodings for messages published over MQTT (BLE)
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor
+except ImportError:
+    cbor = None
+
+
+# maps encoding names to functions that serialize a message dictionary
+encoders = {'json': json.dumps}
+if msgpack:
+    encoders['msgpack'] = lambda message: msgpack.packb(message, use_bin_type=True)
+if cbor:
+    encoders['cbor'] = cbor.dumps
+
+
+# collects outgoing messages and sends them from a sender greenlet once the current greenlet yields,
+# so that messages emitted during the same tick go out together;
+# send_websocket(type, parameters) sends a message to the server and publish(payload) (if given) sends a payload to MQTT
+# (except for websocket_only_types, while mqtt_only_types are not sent to the server);
+# if batching is enabled, the collected messages are sent as a single message_batch message on each channel;
+# each MQTT payload is serialized once using the selected encoding (the websocket connection always uses JSON);
+# while the sender is blocked by a slow connection, messages wait in a bounded queue: only the latest unsent message
+# of each coalesced type is kept (except keyframes), responses are never dropped, and the oldest other messages
+# are dropped beyond max_queued
+class OutboundPipeline(object):
+
+    # message types for which only the latest unsent message is kept
+    coalesced_types = ('update_diagram', 'send_sensor_data_response', 'watchdog', 'status')
+
+    # update_sequence messages are only needed by the server (for the store), not by BLE clients;
+    # sensor data and watchdog messages are for the server
+    websocket_only_types = ('update_sequence', 'send_sensor_data_response', 'watchdog')
+
+    # history is only sent to BLE clients
+    mqtt_only_types = ('history',)
+
+    def __init__(self, send_websocket, publish=None, encoding='json', batching=False, max_queued=100):
+        self.send_websocket = send_websocket
+        self.publish = publish
+        self.encoding = 'json'
+        self.batching = batching
+        self.max_queued = max_queued
+        self.queue = deque()  # [type, parameters] entries for messages waiting to be sent (oldest first)
+        self.coalesced_entries = {}  # maps coalesced message types to their entries in the queue
+        self.droppable_count = 0  # the number of queued messages that may be dropped
+        self.dropped_counts = {}  # maps message types to the number of messages replaced or dropped before being sent
+        self.ready = gevent.event.Event()
+        self.sender_greenlet = None
+        self.set_encoding(encoding)
+
+    # select the MQTT payload encoding; returns False if the encoding is not available
+    def set_encoding(self, encoding):
+        if encoding not in encoders:
+            logging.warning('message encoding %s not available' % encoding)
+            return False
+        self.encoding = encoding
+        return True
+
+    # the number of messages waiting to be sent
+    def queue_depth(self):
+        return len(self.queue)
+
+    # responses to client requests are never dropped
+    def is_critical(self, type):
+        return (type.endswith('_response') or type == 'history') and type not in self.coalesced_types
+
+    # an unsent keyframe (a complete set of update_diagram values) is never replaced by a delta
+    def send(self, type, parameters):
+        entry = self.coalesced_entries.get(type)
+        if entry and not (entry[1].get('keyframe') and not parameters.get('keyframe')):
+            entry[1] = parameters  # replace the unsent message, keeping its place in the queue
+            self.count_dropped(type)
+            return
+        entry = [type, parameters]
+        self.queue.append(entry)
+        if type in self.coalesced_types:
+            self.coalesced_entries[type] = entry
+        elif not self.is_critical(type):
+            self.droppable_count += 1
+            if self.droppable_count > self.max_queued:
+                self.drop_oldest()
+        if self.sender_greenlet is None:
+            self.sender_greenlet = gevent.spawn(self.run)
+        self.ready.set()
+
+    def drop_oldest(self):
+        for entry in self.queue:
+            type = entry[0]
+            if type not in self.coalesced_types and not self.is_critical(type):
+                self.queue.remove(entry)
+                self.droppable_count -= 1
+                self.count_dropped(type)
+                return
+
+    def count_dropped(self, type):
+        self.dropped_counts[type] = self.dropped_counts.get(type, 0) + 1
+
+    # the sender greenlet: sends waiting messages whenever there are any
+    def run(self):
+        while True:
+            self.ready.wait()
+            self.ready.clear()
+            self.flush()
+
+    # send all waiting messages
+    def flush(self):
+        messages = [(type, parameters) for type, parameters in self.queue]
+        self.queue.clear()
+        self.coalesced_entries = {}
+        self.droppable_count = 0
+        if not messages:
+            return
+        if self.batching and len(messages) > 1:
+            batch = [{'type': type, 'parameters': parameters} for type, parameters in messages]
+            src_folder = messages[0][1].get('src_folder')
+            websocket_batch = [message for message in batch if message['type'] not in self.mqtt_only_types]
+            if websocket_batch:
+                self.send_to_websocket('message_batch', {'messages': websocket_batch, 'src_folder': src_folder})
+            if self.publish:
+                batch = [message for message in batch if message['type'] not in self.websocket_only_types]
+                if batch:
+                    self.send_to_mqtt({'type': 'message_batch', 'parameters': {'messages': batch, 'src_folder': src_folder}})
+        else:
+            for type, parameters in messages:
+                if type not in self.mqtt_only_types:
+                    self.send_to_websocket(type, parameters)
+                if self.publish and type not in self.websocket_only_types:
+                    self.send_to_mqtt({'type': type, 'parameters': parameters})
+
+    def send_to_websocket(self, type, parameters):
+        try:
+            self.send_websocket(type, parameters)
+        except Exception as err:
+            logging.error('error sending %s message: %s' % (type, err))
+
+    # publish returns False if it dropped the message (e.g. while the broker connection is backed up)
+    def send_to_mqtt(self, message):
+        try:
+            if self.publish(encoders[self.encoding](message)) is False:
+                self.count_dropped(message['type'])
+        except Exception as err:
+            logging.error('error publishing %s message: %s' % (message['type'], err))
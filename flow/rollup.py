@@ -0,0 +1,78 @@
+import datetime
+import numbers
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+# the min/max/mean/count of the samples of one name within one interval
+class Rollup(object):
+
+    def __init__(self, start, value):
+        self.start = start  # the interval start time (seconds since the epoch)
+        self.minimum = value
+        self.maximum = value
+        self.total = value
+        self.count = 1
+
+    def add(self, value):
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+        self.total += value
+        self.count += 1
+
+    def fields(self):
+        # min and max are always floats, so that their field types don't depend on whether the samples were ints
+        return {'min': float(self.minimum), 'max': float(self.maximum), 'mean': float(self.total) / self.count,
+                'count': self.count}
+
+
+# aggregates numeric samples into fixed intervals (e.g. minutes) as they arrive;
+# each completed rollup is passed to emit(measurement, name, fields, timestamp),
+# where fields has min, max, mean, and count, and timestamp (a datetime) is the interval start;
+# the rollups for an interval of 60 seconds use the given measurement name; others use measurement_<seconds>s
+class RollupAggregator(object):
+
+    def __init__(self, emit, intervals=(60,), measurement='sensor_mean'):
+        self.emit = emit
+        self.intervals = intervals
+        self.measurement = measurement
+        self.rollups = {}  # maps (interval, name) to the open Rollup
+
+    def measurement_name(self, interval):
+        if interval == 60:
+            return self.measurement
+        return '%s_%ds' % (self.measurement, interval)
+
+    # add a sample; timestamp is a UTC datetime; non-numeric values are ignored
+    def add(self, name, value, timestamp):
+        if not isinstance(value, numbers.Number):
+            return
+        seconds = (timestamp - EPOCH).total_seconds()
+        for interval in self.intervals:
+            start = int(seconds // interval) * interval
+            key = (interval, name)
+            rollup = self.rollups.get(key)
+            if rollup and rollup.start != start:
+                if start < rollup.start:  # a late sample for an interval that has already been emitted
+                    continue
+                self.emit_rollup(interval, name, rollup)
+                rollup = None
+            if rollup:
+                rollup.add(value)
+            else:
+                self.rollups[key] = Rollup(start, value)
+
+    # emit the rollups of intervals that have ended by the given time (a UTC datetime), or all rollups if it is None
+    def flush(self, timestamp=None):
+        seconds = (timestamp - EPOCH).total_seconds() if timestamp else None
+        for (interval, name), rollup in self.rollups.items():
+            if seconds is None or seconds >= rollup.start + interval:
+                self.emit_rollup(interval, name, rollup)
+
+    def emit_rollup(self, interval, name, rollup):
+        del self.rollups[(interval, name)]
+        timestamp = EPOCH + datetime.timedelta(seconds=rollup.start)
+        self.emit(self.measurement_name(interval), name, rollup.fields(), timestamp)
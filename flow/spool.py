@@ -0,0 +1,119 @@
+import os
+import json
+import logging
+
+
+# an append-only on-disk queue of JSON records, stored as a series of segment files (one record per line);
+# each consumer reads records from its own offset, which is saved atomically when the consumer commits it,
+# so records are delivered at least once even if the program stops unexpectedly;
+# segments are deleted once all consumers have passed them, and the oldest segments are deleted (losing their records)
+# if the spool grows beyond max_bytes
+class Spool(object):
+
+    def __init__(self, path, consumers, segment_bytes=1024 * 1024, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.consumers = consumers
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        # always start a new segment, so that a partial record written before a crash is never appended to
+        segments = self.segments()
+        self.segment = segments[-1] + 1 if segments else 1
+        self.file = open(self.segment_path(self.segment), 'ab')
+        self.remove_consumed_segments()
+
+    # get a sorted list of the numbers of the existing segments
+    def segments(self):
+        numbers = []
+        for file_name in os.listdir(self.path):
+            if file_name.endswith('.jsonl'):
+                numbers.append(int(file_name.split('.')[0]))
+        return sorted(numbers)
+
+    def segment_path(self, segment):
+        return os.path.join(self.path, '%012d.jsonl' % segment)
+
+    def offset_path(self, consumer):
+        return os.path.join(self.path, consumer + '.offset')
+
+    # add a record (a JSON-serializable object) to the spool
+    def append(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        if self.file.tell() >= self.segment_bytes:
+            self.file.close()
+            self.segment += 1
+            self.file = open(self.segment_path(self.segment), 'ab')
+            self.limit_size()
+
+    # get the (segment, byte offset) position of a consumer
+    def offset(self, consumer):
+        try:
+            with open(self.offset_path(consumer)) as input_file:
+                return tuple(json.loads(input_file.read()))
+        except (IOError, ValueError):
+            return (0, 0)
+
+    # read up to max_records records for a consumer, starting at its committed offset;
+    # returns a list of records and the position to commit once they have been handled
+    def read(self, consumer, max_records=500):
+        segment, offset = self.offset(consumer)
+        records = []
+        for number in self.segments():
+            if number < segment:
+                continue
+            if number > segment:
+                segment, offset = number, 0
+            with open(self.segment_path(number), 'rb') as input_file:
+                input_file.seek(offset)
+                while len(records) < max_records:
+                    line = input_file.readline()
+                    if not line.endswith('\n'):  # end of segment (or a partial record written before a crash)
+                        if line and number != self.segment:
+                            logging.warning('spool: skipping partial record in segment %d' % number)
+                            offset += len(line)
+                        break
+                    offset += len(line)
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        logging.warning('spool: skipping invalid record in segment %d' % number)
+            if len(records) >= max_records:
+                break
+        return records, (segment, offset)
+
+    # save a consumer's position (as returned by read); the offset file is replaced atomically
+    def commit(self, consumer, position):
+        temp_path = self.offset_path(consumer) + '.tmp'
+        with open(temp_path, 'w') as output_file:
+            output_file.write(json.dumps(list(position)))
+            output_file.flush()
+            os.fsync(output_file.fileno())
+        os.rename(temp_path, self.offset_path(consumer))
+        self.remove_consumed_segments()
+
+    # the number of bytes in all segments
+    def size(self):
+        return sum(os.path.getsize(self.segment_path(number)) for number in self.segments())
+
+    # delete segments (other than the current one) that every consumer has read past
+    def remove_consumed_segments(self):
+        first_needed = min(self.offset(consumer)[0] for consumer in self.consumers) if self.consumers else self.segment
+        for number in self.segments():
+            if number < first_needed and number != self.segment:
+                os.remove(self.segment_path(number))
+
+    # delete the oldest segments while the spool is larger than max_bytes
+    def limit_size(self):
+        segments = self.segments()
+        total = self.size()
+        while total > self.max_bytes and len(segments) > 1:
+            number = segments.pop(0)
+            total -= os.path.getsize(self.segment_path(number))
+            os.remove(self.segment_path(number))
+            logging.warning('spool: size limit reached; discarded segment %d' % number)
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,377 @@
+"""SQLite store
+
+A local time-series store with the same interface as influxstore.Store,
+for controllers without enough memory to run an influxdb daemon.
+
+Usage:
+
+from sqlitestore import SqliteStore
+
+store = SqliteStore('flow.db', pin='2671')
+store.save('sensor', 'light', 212.22)
+rs = store.query('select * from sensor where "name"=\'light\' order by time desc limit 10')
+list(rs.get_points())
+
+Queries support the subset of InfluxQL used by flow:
+
+ select * | field, ... | function(field), ... from measurement
+   [where condition and ...]
+   [group by time(interval) [fill(null|none|number)]]
+   [order by time [asc|desc]]
+   [limit n]
+
+where conditions compare a tag or field to a quoted string or number,
+or compare time to a quoted timestamp or now() [- duration];
+functions are mean, min, max, sum, count, first, and last.
+
+"""
+import re
+import json
+import datetime
+import threading
+import sqlite3
+
+from dateutil.parser import parse
+
+from batch_writer import BatchWriter
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# multipliers for converting influxdb duration units to microseconds
+DURATION_UNITS = {
+    'u': 1,
+    'ms': 1000,
+    's': 1000000,
+    'm': 60 * 1000000,
+    'h': 3600 * 1000000,
+    'd': 24 * 3600 * 1000000,
+    'w': 7 * 24 * 3600 * 1000000,
+}
+
+
+def parse_duration(text):
+    """Convert an influxdb duration (e.g. 30m) to microseconds."""
+    match = re.match(r'^(\d+)(u|ms|s|m|h|d|w)$', text.strip())
+    if not match:
+        raise ValueError('invalid duration: %s' % text)
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def to_microseconds(dt):
+    """Convert a datetime (naive UTC or timezone-aware) to microseconds since the epoch."""
+    if dt.tzinfo is not None:
+        dt = dt.replace(tzinfo=None) - dt.utcoffset()
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def format_time(microseconds):
+    """Format a time as an RFC3339 string, as returned by influxdb."""
+    dt = EPOCH + datetime.timedelta(microseconds=microseconds)
+    if dt.microsecond:
+        return dt.strftime('%Y-%m-%dT%H:%M:%S.%f').rstrip('0') + 'Z'
+    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def aggregate_mean(values):
+    return float(sum(values)) / len(values) if values else None
+
+
+AGGREGATES = {
+    'mean': aggregate_mean,
+    'min': lambda values: min(values) if values else None,
+    'max': lambda values: max(values) if values else None,
+    'sum': lambda values: sum(values) if values else None,
+    'count': len,
+    'first': lambda values: values[0] if values else None,
+    'last': lambda values: values[-1] if values else None,
+}
+
+QUERY_PATTERN = re.compile(
+    r'^\s*select\s+(?P<fields>.+?)\s+from\s+"?(?P<measurement>[\w.]+)"?'
+    r'(?:\s+where\s+(?P<where>.+?))?'
+    r'(?:\s+group\s+by\s+time\(\s*(?P<interval>\w+)\s*\)(?:\s*fill\(\s*(?P<fill>[\w.-]+)\s*\))?)?'
+    r'(?:\s+order\s+by\s+time(?:\s+(?P<order>asc|desc))?)?'
+    r'(?:\s+limit\s+(?P<limit>\d+))?\s*;?\s*$', re.IGNORECASE | re.DOTALL)
+
+CONDITION_PATTERN = re.compile(
+    r'^\s*"?(?P<key>\w+)"?\s*(?P<op>>=|<=|!=|<>|=|>|<)\s*(?P<value>.+?)\s*$', re.DOTALL)
+
+NOW_PATTERN = re.compile(r'^now\(\)\s*(?:(?P<sign>[-+])\s*(?P<duration>\w+))?$', re.IGNORECASE)
+
+# tags stored in their own (indexed) columns, so that conditions on them are applied in SQL
+INDEXED_TAGS = ('name', 'pin')
+
+OPERATORS = {
+    '=': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<>': lambda a, b: a != b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+}
+
+
+class QueryResult(object):
+    """Query results, with the same get_points() method as an influxdb ResultSet."""
+
+    def __init__(self, points):
+        self.points = points
+
+    def get_points(self):
+        return iter(self.points)
+
+
+class Query(object):
+    """A parsed query."""
+
+    def __init__(self, querystr):
+        match = QUERY_PATTERN.match(querystr)
+        if not match:
+            raise ValueError('unsupported query: %s' % querystr)
+        self.measurement = match.group('measurement')
+        self.descending = (match.group('order') or '').lower() == 'desc'
+        self.limit = int(match.group('limit')) if match.group('limit') else None
+        self.interval = parse_duration(match.group('interval')) if match.group('interval') else None
+        self.fill = self.parse_fill(match.group('fill'))
+
+        # fields is a list of (function name or None, field name, column name)
+        self.select_all = match.group('fields').strip() == '*'
+        self.fields = []
+        if not self.select_all:
+            for field in match.group('fields').split(','):
+                field_match = re.match(r'^\s*(?:(\w+)\(\s*"?(\w+)"?\s*\)|"?(\w+)"?)(?:\s+as\s+"?(\w+)"?)?\s*$',
+                                       field, re.IGNORECASE)
+                if not field_match:
+                    raise ValueError('unsupported field: %s' % field)
+                function, function_field, plain_field, alias = field_match.groups()
+                if function:
+                    function = function.lower()
+                    if function not in AGGREGATES:
+                        raise ValueError('unsupported function: %s' % function)
+                    self.fields.append((function, function_field, alias or function))
+                else:
+                    self.fields.append((None, plain_field, alias or plain_field))
+        self.aggregate = any(function for function, field, column in self.fields)
+        if self.interval and not self.aggregate:
+            raise ValueError('group by time requires an aggregate function')
+
+        # conditions is a list of (key, operator function, value); time values are in microseconds
+        self.start_time = None  # the lower bound of the time conditions (if any)
+        self.end_time = None  # the upper bound of the time conditions (if any)
+        self.indexed_tags = {}  # maps indexed tags (see INDEXED_TAGS) to the values they must equal (if any)
+        self.conditions = []
+        if match.group('where'):
+            for condition in re.split(r'\s+and\s+', match.group('where'), flags=re.IGNORECASE):
+                self.add_condition(condition)
+
+    def parse_fill(self, fill):
+        if fill is None or fill.lower() == 'null':
+            return None
+        if fill.lower() == 'none':
+            return 'none'
+        return float(fill)
+
+    def add_condition(self, condition):
+        condition_match = CONDITION_PATTERN.match(condition)
+        if not condition_match:
+            raise ValueError('unsupported condition: %s' % condition)
+        key, op, value = condition_match.group('key', 'op', 'value')
+        if key.lower() == 'time':
+            value = self.parse_time(value)
+            if op in ('>', '>='):
+                self.start_time = value if op == '>=' else value + 1
+            elif op in ('<', '<='):
+                self.end_time = value if op == '<=' else value - 1
+            key = 'time'
+        elif value.startswith("'") and value.endswith("'"):
+            value = value[1:-1].replace("\\'", "'")
+            if key in INDEXED_TAGS and op == '=':
+                self.indexed_tags[key] = value
+        else:
+            value = float(value)
+        self.conditions.append((key, OPERATORS[op], value))
+
+    def parse_time(self, value):
+        now_match = NOW_PATTERN.match(value)
+        if now_match:
+            time = to_microseconds(datetime.datetime.utcnow())
+            if now_match.group('duration'):
+                offset = parse_duration(now_match.group('duration'))
+                time += offset if now_match.group('sign') == '+' else -offset
+            return time
+        if value.startswith("'") and value.endswith("'"):
+            return to_microseconds(parse(value[1:-1]))
+        raise ValueError('unsupported time value: %s' % value)
+
+    def matches(self, time, tags, fields):
+        for key, op, value in self.conditions:
+            if key == 'time':
+                actual = time
+            elif key in tags:
+                actual = tags[key]
+            else:
+                actual = fields.get(key)
+            if actual is None or not op(actual, value):
+                return False
+        return True
+
+    def run(self, rows):
+        """Compute the result points from (time, tags, fields) rows in time order."""
+        rows = [row for row in rows if self.matches(*row)]
+        if self.aggregate:
+            points = self.aggregate_rows(rows)
+        else:
+            points = []
+            for time, tags, fields in rows:
+                point = {'time': format_time(time)}
+                if self.select_all:
+                    point.update(tags)
+                    point.update(fields)
+                else:
+                    for function, field, column in self.fields:
+                        point[column] = tags.get(field, fields.get(field))
+                points.append(point)
+        if self.descending:
+            points.reverse()
+        if self.limit is not None:
+            points = points[:self.limit]
+        return points
+
+    def aggregate_rows(self, rows):
+        if not self.interval:
+            return [self.aggregate_point(self.start_time or 0, rows)]
+
+        # as with influxdb, buckets are aligned to the epoch and every bucket in the time range is included
+        start_time = self.start_time if self.start_time is not None else (rows[0][0] if rows else None)
+        end_time = self.end_time if self.end_time is not None else (rows[-1][0] if rows else None)
+        if start_time is None or end_time is None:
+            return []
+        buckets = {}
+        for row in rows:
+            buckets.setdefault(row[0] // self.interval, []).append(row)
+        points = []
+        for bucket in range(start_time // self.interval, end_time // self.interval + 1):
+            bucket_rows = buckets.get(bucket)
+            if bucket_rows is None and self.fill == 'none':
+                continue
+            point = self.aggregate_point(bucket * self.interval, bucket_rows or [])
+            if bucket_rows is None and self.fill is not None:
+                for function, field, column in self.fields:
+                    point[column] = self.fill
+            points.append(point)
+        return points
+
+    def aggregate_point(self, time, rows):
+        point = {'time': format_time(time)}
+        for function, field, column in self.fields:
+            values = [fields.get(field) for row_time, tags, fields in rows]
+            values = [value for value in values if value is not None]
+            if function in ('mean', 'min', 'max', 'sum'):
+                values = [value for value in values if isinstance(value, (int, long, float))]
+            point[column] = AGGREGATES[function or 'last'](values)
+        return point
+
+
+class SqliteStore(object):
+    """Stores points in an SQLite database, with the same interface as influxstore.Store."""
+
+    def __init__(self, path, pin, batch_size=100, flush_interval=5.0):
+        self.path = path
+        self.pin = pin
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            self.connection.execute('create table if not exists points '
+                                    '(measurement text, time integer, tags text, fields text, name text, pin text)')
+            self.add_indexed_tag_columns()
+            self.connection.execute('create index if not exists points_time on points (measurement, time)')
+            self.connection.execute('create index if not exists points_name_time on points (measurement, name, time)')
+            self.connection.commit()
+        self.writer = None
+        if batch_size:
+            self.writer = BatchWriter(self.write_points, batch_size=batch_size, flush_interval=flush_interval)
+
+    def add_indexed_tag_columns(self):
+        """Add the indexed tag columns to a database created without them, filling them in from the tags."""
+        columns = [row[1] for row in self.connection.execute('pragma table_info(points)')]
+        missing = [tag for tag in INDEXED_TAGS if tag not in columns]
+        if not missing:
+            return
+        for tag in missing:
+            self.connection.execute('alter table points add column %s text' % tag)
+        updates = []
+        for rowid, tags in self.connection.execute('select rowid, tags from points').fetchall():
+            tags = json.loads(tags)
+            updates.append(tuple(tags.get(tag) for tag in INDEXED_TAGS) + (rowid,))
+        self.connection.executemany('update points set %s where rowid = ?' %
+                                    ', '.join('%s = ?' % tag for tag in INDEXED_TAGS), updates)
+
+    def save(self, measurement, name, value, extra_tags = {}, timestamp=None):
+        """Save a value; the point's time is the given timestamp (a datetime) or now."""
+        self.save_many([self.point(measurement, name, value, extra_tags, timestamp)])
+
+    def point(self, measurement, name, value, extra_tags = {}, timestamp=None):
+        """Create a point dictionary for a value (or for a dictionary of field values)."""
+        tags = extra_tags.copy()
+        tags.update({
+                    "name": name,
+                    "pin": self.pin,
+                })
+        return {
+            "time": timestamp or datetime.datetime.utcnow(),
+            "measurement": measurement,
+            "fields": value if isinstance(value, dict) else {'value': value},
+            "tags": tags,
+            }
+
+    def save_many(self, points, wait=False):
+        """Save a list of point dictionaries; if wait is true, the points are
+        written before returning (and errors are raised to the caller)."""
+        if self.writer and not wait:
+            self.writer.add(points)
+        else:
+            self.write_points(points)
+
+    def write_points(self, points):
+        rows = [(point['measurement'], to_microseconds(point['time']),
+                 json.dumps(point.get('tags', {}), sort_keys=True), json.dumps(point['fields'], sort_keys=True)) +
+                tuple(point.get('tags', {}).get(tag) for tag in INDEXED_TAGS)
+                for point in points]
+        with self.lock:
+            self.connection.executemany('insert into points (measurement, time, tags, fields, %s) values (?, ?, ?, ?, %s)' %
+                                        (', '.join(INDEXED_TAGS), ', '.join('?' for tag in INDEXED_TAGS)), rows)
+            self.connection.commit()
+
+    def query(self, querystr):
+        """Run an InfluxQL query (see module documentation); returns a QueryResult."""
+        if self.writer:
+            self.writer.flush()
+        query = Query(querystr)
+
+        # time bounds and indexed tags are applied in SQL (using the indexes); other conditions are applied by the query
+        sql = 'select time, tags, fields from points where measurement = ?'
+        args = [query.measurement]
+        for tag, value in sorted(query.indexed_tags.items()):
+            sql += ' and %s = ?' % tag
+            args.append(value)
+        if query.start_time is not None:
+            sql += ' and time >= ?'
+            args.append(query.start_time)
+        if query.end_time is not None:
+            sql += ' and time <= ?'
+            args.append(query.end_time)
+        sql += ' order by time, rowid'
+        with self.lock:
+            rows = [(time, json.loads(tags), json.loads(fields))
+                    for time, tags, fields in self.connection.execute(sql, args)]
+        return QueryResult(query.run(rows))
+
+    def close(self):
+        """Write any waiting points and close the database."""
+        if self.writer:
+            self.writer.close()
+        with self.lock:
+            self.connection.close()
@@ -7,16 +7,209 @@ Can be used from crontab, e.g. like this every 5 minutes or every minute:
 *   * * * * PYTHONPATH=/Users/peter/git-clones/flow /opt/venv/flow3/bin/python /Users/peter/git-clones/flow/hissync.py localhost influxdb_main.example.com flow sensor_mean,run,diagram >> /tmp/hissync.out 2>&1
 */5 * * * * PYTHONPATH=/Users/peter/git-clones/flow /opt/venv/flow3/bin/python /Users/peter/git-clones/flow/hissync.py localhost influxdb_main.example.com flow sensor_mean --verbose 2>&1
 
+or as a long-running process that replicates new records within a few seconds (e.g. from a systemd service):
+
+PYTHONPATH=/Users/peter/git-clones/flow /opt/venv/flow3/bin/python /Users/peter/git-clones/flow/hissync.py localhost influxdb_main.example.com flow sensor_mean,run,diagram --follow
+
+Each run resumes from a checkpoint file (see Checkpoints). The destination isn't checked once a checkpoint exists,
+so if the destination is wiped or restored from a backup, resynchronize it with --start (e.g. --start 1970-01-01T00:00:00Z)
+or repair it with --reconcile.
 
 """
+import os
 import sys
+import json
+import signal
+import hashlib
+import time
+import queue
 import argparse
 import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dateutil.parser import parse
 from flow.influxstore import Store
 
 
-def perform_bulk_transfer(from_store, to_store, measurement, sync_start, chunk_size, verbose=False):
+class ChunkSizer(object):
+    """Adapts the number of records per chunk to the observed latency of reading chunks from the source.
+
+    read_points asks the source for chunks of this size and reports how long each took to arrive
+    (including the query time for a window's first chunk); perform_bulk_transfer also writes
+    chunks of this size. The chunk size doubles while chunks take less than half of target_seconds
+    and halves while they take longer than target_seconds, so that few round trips are needed on
+    slow links without making any single response too large.
+    """
+
+    def __init__(self, size=100, minimum=10, maximum=10000, target_seconds=1.0):
+        self.size = size
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+
+    def update(self, count, seconds):
+        """Record that reading count records took seconds; returns the next chunk size."""
+        if count >= self.size and seconds < self.target_seconds / 2:
+            self.size = min(self.size * 2, self.maximum)
+        elif seconds > self.target_seconds:
+            self.size = max(self.size // 2, self.minimum)
+        return self.size
+
+
+class Checkpoints(object):
+    """Stores the time of the last record committed to the destination for each sync (source, destination,
+    database, and measurement) in a local JSON file, so that later runs can resume without querying the destination.
+
+    A checkpoint only moves past records once they have been written to the destination.
+    The file is replaced atomically after each update, so it is never left partially written.
+    Since a checkpoint is trusted over the destination, a destination that loses records (e.g. one restored
+    from a backup) has to be resynchronized from an earlier time with --start.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.times = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.times = json.load(f)
+
+    @staticmethod
+    def key(from_db, to_db, dbname, measurement):
+        return "%s|%s|%s|%s" % (from_db, to_db, dbname, measurement)
+
+    def get(self, key):
+        """Get the last committed time (an influxdb time string) or None."""
+        with self.lock:
+            return self.times.get(key)
+
+    def set(self, key, timestamp):
+        with self.lock:
+            self.times[key] = timestamp
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump(self.times, f, indent=2, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+
+
+# functions converting field values read from a store to their field types (from "show field keys")
+FIELD_TYPES = {
+    'float': float,
+    'integer': int,
+    'boolean': bool,
+    'string': str,
+}
+
+
+def get_field_types(store, measurement):
+    """Get a dictionary mapping the field keys of a measurement to their types (e.g. 'float')."""
+    rs = store.query("show field keys from %s" % measurement)
+    return dict((p['fieldKey'], p.get('fieldType', 'float')) for p in rs.get_points())
+
+
+def convert_point(measurement, p, field_types):
+    """Convert a point read from the source into a point to write to the destination.
+
+    field_types maps the measurement's field keys to their types (see get_field_types);
+    all other keys (except time) are tags. Fields without a value are left out
+    (influxdb returns None for fields a point doesn't have); tags are passed on as they are
+    (the influxdb client leaves out tags without a value).
+    Raises ValueError if the point has no field values, since it couldn't be written.
+    """
+    tags = dict((k, v) for k, v in p.items() if k not in field_types and k != 'time')
+    fields = dict((k, FIELD_TYPES.get(field_types[k], float)(p[k])) for k in field_types if p.get(k) is not None)
+    if not fields:
+        raise ValueError("%s record has no values for fields %s: %s" % (measurement, ", ".join(sorted(field_types)), p))
+    return {
+        "time": p['time'],
+        "measurement": measurement,
+        "fields": fields,
+        "tags": tags
+    }
+
+
+def format_time(dt):
+    """Format a datetime (UTC if it has no timezone) as an influxdb time string."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def first_record_time(store, measurement, since):
+    """Get the time (a datetime) of the first record at or after since, or None if there isn't one."""
+    rs = store.query("select * from %s where time >= '%s' order by time limit 1" % (measurement, format_time(since)))
+    points = list(rs.get_points())
+    return parse(points[0]["time"]) if points else None
+
+
+def read_points(from_store, measurement, start, end, window, chunk_size, sizer=None):
+    """Generate the records of a measurement from start (inclusive) to end (exclusive) as dictionaries.
+
+    Records are read one time window at a time using the client's chunked response mode,
+    so memory use does not depend on the number of records. The windows partition the time range,
+    so no records are skipped or repeated at window boundaries. When a window has no records,
+    the next window starts at the next record's time.
+
+    If a sizer (a ChunkSizer) is given, each window's chunk size is sizer.size (rather than chunk_size),
+    and the time each chunk takes to arrive is reported to the sizer.
+    """
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + window, end)
+        read_start = time.time()
+        results = from_store.query("select * from %s where time >= '%s' and time < '%s'" % \
+                                   (measurement, format_time(window_start), format_time(window_end)),
+                                   chunked=True, chunk_size=sizer.size if sizer else chunk_size)
+        if hasattr(results, "get_points"):  # older clients return a single result set
+            results = [results]
+        found = False
+        for rs in results:
+            points = list(rs.get_points())
+            if sizer:
+                sizer.update(len(points), time.time() - read_start)
+            for p in points:
+                found = True
+                yield p
+            read_start = time.time()
+        window_start = window_end
+        if not found:
+            next_time = first_record_time(from_store, measurement, window_start)
+            if next_time is None:
+                break
+            window_start = max(window_start, next_time)
+
+
+def read_chunks(records, measurement, sizer, field_types, chunks, stop):
+    """Reader thread for perform_bulk_transfer: converts records (from read_points) into chunks in the chunks queue.
+
+    Each chunk is a (points, time of the last record read) tuple of sizer.size records (the last may have fewer).
+    Puts None after the last chunk, or the exception if reading fails.
+    """
+    def put_chunk(points):
+        target_points = [convert_point(measurement, p, field_types) for p in points]
+        chunks.put((target_points, points[-1].get("time")))
+
+    try:
+        points = []
+        for p in records:
+            if stop.is_set():
+                return
+            points.append(p)
+            if len(points) >= sizer.size:
+                put_chunk(points)
+                points = []
+        if points:
+            put_chunk(points)
+        chunks.put(None)
+    except Exception as err:
+        chunks.put(err)
+
+
+def perform_bulk_transfer(from_store, to_store, measurement, sync_start, chunk_size, verbose=False, queue_size=4,
+                          on_commit=None, window=datetime.timedelta(days=1), sync_end=None, stop=None,
+                          skip_keys=None, on_write=None, field_types=None):
     """Performs bulk transfer from source to destination.
 
     This assumes that we are performing bulk transfer/sync of a series that looks like this:
@@ -35,101 +228,103 @@ def perform_bulk_transfer(from_store, to_store, measurement, sync_start, chunk_s
     :param from_store:
     :param to_store:
     :param measurement:
-    :param sync_start:
-    :param chunk_size: chunk size (number of records transferred at the same time) to use during read/write operations
+    :param sync_start: time (a datetime) of the first record to transfer; records at this time are transferred again,
+                       which is harmless since influxdb replaces points with the same time and tags
+    :param chunk_size: initial chunk size (number of records transferred at the same time) to use during read/write operations;
+                       the chunk size then adapts to the source's response time
     :param verbose: if True, print progress of transfer
+    :param queue_size: number of chunks read ahead while the previous chunks are written
+    :param on_commit: if given, called with the time of the last record of each chunk once the chunk has been written
+    :param window: length (a timedelta) of the time windows in which records are read
+    :param sync_end: time (a datetime) at which to stop; defaults to now
+    :param stop: if given, a threading.Event; the transfer stops after the chunk being written when it is set
+    :param skip_keys: if given, keys (see written_point_key) of records not to write again (e.g. the records at
+                      sync_start written by a previous transfer); these records are not counted
+    :param on_write: if given, called with the points of each chunk once the chunk has been written
+    :param field_types: if given, the measurement's field types (see get_field_types), rather than looking them up
     :return: number of records transferred
 
+    Records are read in a reader thread while the previous chunks are being written,
+    so the source and destination round trips overlap.
+
     """
     # limit max_count transferred when testing/developing
     #max_count = 1000
     max_count = 0
-    current_start = sync_start.isoformat()
-
-    # calculate number of points
-    rs = from_store.query(
-        "select count(*) from %s where time > '%s'" % (measurement, current_start))
-    points = list(rs.get_points())
-
-    # get count value from any items other than time
-    #   this is needed for generic ount retrieval instead of doing this:
-    #   count = points[0]['count'] if points else 0
-    count_points = list(rs.get_points())
-    if not count_points:
+    if sync_end is None:
+        sync_end = datetime.datetime.now(datetime.timezone.utc)
+    if sync_start.tzinfo is None:
+        sync_start = sync_start.replace(tzinfo=datetime.timezone.utc)
+
+    # start at the first record (rather than reading empty windows up to it)
+    first_time = first_record_time(from_store, measurement, sync_start)
+    if first_time is None or first_time >= sync_end:
         if verbose:
-            print("%s: no new records to sync since %s." % (measurement, current_start))
+            print("%s: no new records to sync since %s." % (measurement, format_time(sync_start)))
         return 0
 
-    count_dict = count_points[0]
-    # any item name other than time
-    item_name = list(filter(lambda x: x != 'time', count_dict.keys()))[0]
-    count = count_dict[item_name]
+    count = None
     if verbose:
-        print("%s: performing bulk transfer of about %d records in chunks of max %d records." % \
+        # calculate number of points
+        rs = from_store.query(
+            "select count(*) from %s where time >= '%s'" % (measurement, format_time(first_time)))
+        # get count value from any items other than time
+        #   this is needed for generic count retrieval instead of doing this:
+        #   count = points[0]['count'] if points else 0
+        count_dict = next(rs.get_points(), {})
+        count = max([v for k, v in count_dict.items() if k != 'time'] or [0])
+        print("%s: performing bulk transfer of about %d records in chunks of initially %d records." % \
               (measurement, count, chunk_size))
     start = datetime.datetime.now()
     total = 0
-    # TODO: unhardcode fields via:
-    #   query("show field keys from sensor_mean", database="flow")
-    field_keys = ['min', 'max', 'mean', 'count']
-    non_tag_keys = field_keys + ['time']
-    while True:
-        rs = from_store.query(
-            "select * from %s where time > '%s' limit %s" % (measurement, current_start, chunk_size))
-        if not rs:
-            break
-        points = list(rs.get_points())
-        last_record = points[-1]
-        current_start = last_record.get("time")
-        target_points = []
-        for p in points:
-            """
-            each point looks like this:
-            [{'max': 148,
-              'mean': 147.88333333333333,
-              'min': 145,
-              'count': 60,
-              'name': 'light',
-              'pin': '2671',
-              'time': '2017-06-13T21:00:00Z'},
-            """
-            #vmin, vmax, vmean = p['min'], p['max'], p['mean']
-            tag_keys = p.keys() - non_tag_keys
-            tags = dict((k, p[k]) for k in tag_keys)
-            #if verbose:
-            #    print("perform_bulk_transfer: p=%s" % p)
-            # TODO: fix this error:
-            """
-sensor_mean: performing bulk transfer of about 30759 records in chunks of max 100 records.
-perform_bulk_transfer: p={'min': 17, 'mean': 20.466666666666665, 'pin': None, 'count': None, 'max': 21, 'name': None, 'time': '2017-06-01T00:00:00Z'}
-Traceback (most recent call last):
-  File "/home/pi/flow/hissync.py", line 246, in <module>
-    rc = do_hissync(from_db, from_credentials, to_db, to_credentials, dbname, measurements, verbose=verbose)
-  File "/home/pi/flow/hissync.py", line 180, in do_hissync
-    sync_count += perform_bulk_transfer(from_store, to_store, measurement, sync_start, 100, verbose)
-  File "/home/pi/flow/hissync.py", line 99, in perform_bulk_transfer
-    fields = dict((k, float(p[k])) for k in field_keys)
-  File "/home/pi/flow/hissync.py", line 99, in <genexpr>
-    fields = dict((k, float(p[k])) for k in field_keys)
-TypeError: float() argument must be a string or a number, not 'NoneType'
-            """
-
-            fields = dict((k, float(p[k])) for k in field_keys)
-            target_point = {
-                "time": p['time'],
-                "measurement": measurement,
-                "fields": fields,
-                "tags": tags
-            }
-            target_points.append(target_point)
-        to_store.dbclient.write_points(target_points)
-        total += len(points)
-        if verbose:
-            print("%s: transferring: %d out of %d" % (measurement, total, count))
-        if max_count > 0 and total > max_count:
+    if field_types is None:
+        field_types = get_field_types(from_store, measurement)
+
+    # each point looks like this:
+    #   {'max': 148, 'mean': 147.88333333333333, 'min': 145, 'count': 60,
+    #    'name': 'light', 'pin': '2671', 'time': '2017-06-13T21:00:00Z'}
+    # some older points have None for some fields and tags (None fields are left out when writing)
+    sizer = ChunkSizer(chunk_size)
+    chunks = queue.Queue(maxsize=queue_size)
+    done = threading.Event()
+    records = read_points(from_store, measurement, first_time, sync_end, window, chunk_size, sizer)
+    reader = threading.Thread(target=read_chunks,
+                              args=(records, measurement, sizer, field_types, chunks, done))
+    reader.daemon = True
+    reader.start()
+    try:
+        while stop is None or not stop.is_set():
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            target_points, last_time = chunk
+            if skip_keys:
+                target_points = [point for point in target_points if written_point_key(point) not in skip_keys]
+            if not target_points:
+                continue
+            to_store.dbclient.write_points(target_points)
+            # only records that have been written are checkpointed
+            if on_commit:
+                on_commit(last_time)
+            if on_write:
+                on_write(target_points)
+            total += len(target_points)
             if verbose:
-                print("max_count of %d reached: exiting transfer loop" % max_count)
-            break
+                print("%s: transferring: %d out of %d (chunk size %d)" % (measurement, total, count, sizer.size))
+            if max_count > 0 and total > max_count:
+                if verbose:
+                    print("max_count of %d reached: exiting transfer loop" % max_count)
+                break
+    finally:
+        # stop the reader (which may be waiting to add a chunk to the queue)
+        done.set()
+        while reader.is_alive():
+            try:
+                chunks.get_nowait()
+            except queue.Empty:
+                reader.join(0.1)
 
 
     if verbose:
@@ -138,14 +333,258 @@ TypeError: float() argument must be a string or a number, not 'NoneType'
     return total
 
 
+def transfer_new_records(from_store, to_store, measurement, since, field_types, columns, chunk_size, stop=None,
+                         skip_keys=None, on_commit=None, on_write=None):
+    """Transfer the records of a measurement from since (a datetime, inclusive) on, using a single chunked query.
+
+    This is the incremental read of each poll of follow_measurement: unlike perform_bulk_transfer, it doesn't look up
+    the first record or the field keys, or start a reader thread, so a poll without new records is a single query.
+    field_types (see get_field_types) is only looked up again (and updated in place) when a record has a key that
+    isn't in columns (the set of record keys seen so far, also updated in place), i.e. when a field or tag is added.
+    stop, skip_keys, on_commit, and on_write are as for perform_bulk_transfer; chunks of chunk_size records are read
+    and written.
+
+    :return: number of records transferred
+    """
+    results = from_store.query("select * from %s where time >= '%s'" % (measurement, format_time(since)),
+                               chunked=True, chunk_size=chunk_size)
+    if hasattr(results, "get_points"):  # older clients return a single result set
+        results = [results]
+    total = 0
+    for rs in results:
+        if stop is not None and stop.is_set():
+            break
+        records = list(rs.get_points())
+        if not records:
+            continue
+        keys = set().union(*records)
+        if not keys <= columns:
+            if columns:
+                updated_field_types = get_field_types(from_store, measurement)
+                field_types.clear()
+                field_types.update(updated_field_types)
+            columns.update(keys)
+        points = [convert_point(measurement, p, field_types) for p in records]
+        if skip_keys:
+            points = [point for point in points if written_point_key(point) not in skip_keys]
+        if not points:
+            continue
+        to_store.dbclient.write_points(points)
+        if on_commit:
+            on_commit(records[-1]["time"])
+        if on_write:
+            on_write(points)
+        total += len(points)
+    return total
+
+
+def follow_measurement(from_store, to_store, measurement, sync_start, stop, interval=5.0, report_interval=60.0,
+                       chunk_size=100, on_commit=None, verbose=False):
+    """Continuously replicate new records of a measurement until stop (a threading.Event) is set.
+
+    First transfers the records since sync_start (see perform_bulk_transfer); then every interval seconds,
+    transfers the records written to the source since the last committed record (see transfer_new_records),
+    reusing the same stores (and so their pooled connections) and field types for every poll. Records are written
+    to the destination as soon as a chunk is read, so a record reaches the destination within about interval
+    seconds (plus the query time) of being written to the source.
+
+    Each poll starts at the time of the last committed record, in case more records with that time were written
+    to the source after the previous poll; the records at that time that have already been written are skipped
+    (and not counted again).
+
+    Every report_interval seconds, prints the number of records written and the lag: the time since the
+    last committed record (which includes any time in which the source had no new records).
+    Failed polls are reported and retried at the next interval.
+
+    :return: number of records written
+    """
+    if sync_start.tzinfo is None:
+        sync_start = sync_start.replace(tzinfo=datetime.timezone.utc)
+    last_time = sync_start
+    total = 0
+    reported = time.time()
+    reported_total = 0
+    written_time = None
+    written_keys = set()  # keys of the written records at written_time
+    field_types = None
+    columns = set()  # the record keys known to field_types
+    caught_up = False  # whether the records since sync_start have been transferred
+
+    def commit(record_time):
+        nonlocal last_time
+        last_time = parse(record_time)
+        if on_commit:
+            on_commit(record_time)
+
+    def written(points):
+        nonlocal written_time, written_keys
+        for point in points:  # in time order
+            if point['time'] != written_time:
+                written_time = point['time']
+                written_keys = set()
+            written_keys.add(written_point_key(point))
+
+    while not stop.is_set():
+        poll_start = time.time()
+        try:
+            poll_start_time = last_time
+            if field_types is None:
+                field_types = get_field_types(from_store, measurement)
+            if caught_up:
+                total += transfer_new_records(from_store, to_store, measurement, last_time, field_types, columns,
+                                              chunk_size, stop=stop, skip_keys=set(written_keys), on_commit=commit,
+                                              on_write=written)
+            else:
+                total += perform_bulk_transfer(from_store, to_store, measurement, last_time, chunk_size,
+                                               on_commit=commit, stop=stop, skip_keys=set(written_keys),
+                                               on_write=written, field_types=field_types)
+                caught_up = not stop.is_set()
+            if verbose and last_time > poll_start_time:
+                print("%s: synchronized up to %s" % (measurement, format_time(last_time)), flush=True)
+        except Exception as err:
+            print("%s: sync failed (retrying in %.0f seconds): %s" % (measurement, interval, err), flush=True)
+        now = time.time()
+        if now - reported >= report_interval:
+            lag = (datetime.datetime.now(datetime.timezone.utc) - last_time).total_seconds()
+            print("%s: wrote %d records in the last %.0f seconds (%d in total); lag %.1f seconds (last record %s)" % \
+                  (measurement, total - reported_total, now - reported, total, lag, format_time(last_time)), flush=True)
+            reported = now
+            reported_total = total
+        stop.wait(max(interval - (now - poll_start), 0))
+    return total
+
+def written_point_key(point):
+    """Get a string identifying a point (as converted by convert_point) by its time, tags, and field values."""
+    tags = [(k, v) for k, v in point['tags'].items() if v is not None]
+    return json.dumps([point['time'], sorted(tags), sorted(point['fields'].items())])
+
+
+def point_key(measurement, p, field_keys):
+    """Get a string identifying a record read from a store by its time, tags, and field values."""
+    return written_point_key(convert_point(measurement, p, field_keys))
+
+
+def range_fingerprint(store, measurement, start, end, field_keys, leaf_size):
+    """Get the number of records of a measurement from start (inclusive) to end (exclusive) and a fingerprint of them.
 
-def do_hissync(from_db, from_credentials, to_db, to_credentials, dbname, measurements, verbose=False):
+    The fingerprint has the count, sum, integral (the area under the values over time), and sum of the cumulative
+    sums of each field for each series (set of tag values), computed by the database. The integral depends on the
+    times of the values, so it differs when a record is shifted in time (unless it is a series' only record in the
+    range), and the sum of the cumulative sums weights each value by its position, so it differs when the values of
+    two records are swapped; these differences are found in ranges of any size. Ranges of at most leaf_size records
+    are read, and their fingerprint also has a hash of the records, so that any difference is told apart.
+    """
+    series = {}  # maps the tags of each series to its aggregates
+    for querystr in ("select count(*), sum(*), integral(*) from %s where time >= '%s' and time < '%s' group by *",
+                     "select sum(*) from (select cumulative_sum(*) from %s where time >= '%s' and time < '%s' "
+                     "group by *) group by *"):
+        rs = store.query(querystr % (measurement, format_time(start), format_time(end)))
+        for (_, tags), points in rs.items():
+            series.setdefault(tuple(sorted((tags or {}).items())), {}).update(next(points, {}))
+    count = 0
+    fingerprint = []
+    for tags, aggregates in sorted(series.items()):
+        count += max([v for k, v in aggregates.items() if k.startswith('count_') and v] or [0])
+        # sums and integrals are rounded since they may be added up in a different order by each database
+        fingerprint.append((tags, sorted((k, float('%.10g' % v)) for k, v in aggregates.items()
+                                         if k != 'time' and v is not None)))
+    if 0 < count <= leaf_size:
+        keys = [point_key(measurement, p, field_keys)
+                for p in read_points(store, measurement, start, end, end - start, leaf_size)]
+        fingerprint.append(hashlib.sha1("\n".join(sorted(keys)).encode()).hexdigest())
+    return count, fingerprint
+
+
+def repair_range(from_store, to_store, measurement, start, end, field_keys, chunk_size):
+    """Write the records of the source from start (inclusive) to end (exclusive) that the destination doesn't have.
+
+    Records that only the destination has are left as they are.
+    :return: number of records written
+    """
+    existing = set(point_key(measurement, p, field_keys)
+                   for p in read_points(to_store, measurement, start, end, end - start, chunk_size))
+    points = [convert_point(measurement, p, field_keys)
+              for p in read_points(from_store, measurement, start, end, end - start, chunk_size)
+              if point_key(measurement, p, field_keys) not in existing]
+    for i in range(0, len(points), chunk_size):
+        to_store.dbclient.write_points(points[i:i + chunk_size])
+    return len(points)
+
+
+def reconcile_measurement(from_store, to_store, measurement, start, end=None, leaf_size=1000, chunk_size=1000,
+                          verbose=False):
+    """Find and transfer the records of a measurement that the destination is missing (or has different values for),
+    without transferring all of them.
+
+    Compares the fingerprints (see range_fingerprint) of the time range on both sides. If they differ,
+    the range is split in half and each half is compared in turn, down to ranges of at most leaf_size records,
+    whose missing records are then transferred. Only ranges that differ are read, so repairing a few gaps
+    (e.g. records that were skipped by an earlier failed sync) takes a number of aggregate queries that grows
+    with the number of gaps and the logarithm of the time range, rather than a full transfer.
+    Records that only the destination has are left as they are (so ranges with such records are compared
+    down to leaf_size records every time).
+
+    :param start: time (a datetime) from which to reconcile
+    :param end: time (a datetime) at which to stop; defaults to now
+    :return: number of records transferred
+    """
+    field_keys = get_field_types(from_store, measurement)
+    if end is None:
+        end = datetime.datetime.now(datetime.timezone.utc)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=datetime.timezone.utc)
+    start = first_record_time(from_store, measurement, start)
+    if start is None or start >= end:
+        return 0
+    stats = {'ranges': 0, 'repaired': 0}
+
+    def reconcile(range_start, range_end):
+        stats['ranges'] += 1
+        source_count, source_fingerprint = range_fingerprint(from_store, measurement, range_start, range_end,
+                                                             field_keys, leaf_size)
+        if source_count == 0:  # nothing to transfer
+            return 0
+        _, destination_fingerprint = range_fingerprint(to_store, measurement, range_start, range_end,
+                                                       field_keys, leaf_size)
+        if source_fingerprint == destination_fingerprint:
+            return 0
+        middle = range_start + (range_end - range_start) / 2
+        if source_count <= leaf_size or middle <= range_start:
+            count = repair_range(from_store, to_store, measurement, range_start, range_end, field_keys, chunk_size)
+            stats['repaired'] += 1
+            if verbose:
+                print("%s: %s to %s differs: transferred %d records" % \
+                      (measurement, format_time(range_start), format_time(range_end), count))
+            return count
+        return reconcile(range_start, middle) + reconcile(middle, range_end)
+
+    total = reconcile(start, end)
+    if verbose:
+        print("%s: reconciled %s to %s: compared %d ranges, repaired %d, transferred %d records" % \
+              (measurement, format_time(start), format_time(end), stats['ranges'], stats['repaired'], total))
+    return total
+
+
+def do_hissync(from_db, from_credentials, to_db, to_credentials, dbname, measurements, verbose=False, workers=4,
+               checkpoint_file=None, start=None, follow=False, interval=5.0, report_interval=60.0,
+               reconcile=False, leaf_size=1000):
     """Do history sync.
 
     :param from_db: source db host/port as host[:port]
     :param to_db: destination db host/port  url  as host[:port]
     :param measurements: measurements to synchronize
     :param verbose: if True, print progress of transfer
+    :param workers: number of measurements synchronized in parallel
+    :param checkpoint_file: if given, path of a file recording how far each measurement has been synchronized
+    :param start: if given, time (a string) to synchronize from, overriding checkpoints;
+                  otherwise the sync resumes from the checkpoint, or from the destination's latest record
+                  if there is no checkpoint
+    :param follow: if True, keep replicating new records (see follow_measurement) until interrupted
+    :param interval: seconds between polls for new records when following
+    :param report_interval: seconds between lag reports when following
+    :param reconcile: if True, compare the measurements from start (or the beginning) on both sides and transfer
+                      just the records missing from the destination (see reconcile_measurement)
+    :param leaf_size: number of records below which reconciled ranges are compared record by record
     :return: number of records transferred
 
     Examples:
@@ -179,28 +618,57 @@ def do_hissync(from_db, from_credentials, to_db, to_credentials, dbname, measure
     if to_credentials:
         to_username, to_password = to_credentials.split(":")
 
-    from_store = Store(dbname, "", fhost, fport, from_username, from_password)
-    to_store = Store(dbname, "", dhost, dport, to_username, to_password)
-
     # TODO: create db if it doesn't exist
     #  to_store.dbclient.create_database('flow')
 
-    sync_count = 0
-    for measurement in measurements:
-        # get last record timestamp
-        # TODO: fix start default time after null tag sync fixed
-        #sync_start = parse("1970-01-01T00:00:00Z")
-        sync_start = parse("2017-06-20T00:00:00Z")
-        rs = to_store.query("select * from %s order by time desc limit 1" % measurement)
-        if rs:
-            last_record = list(rs.get_points())[0]
-            ts = last_record.get("time")
-            if not ts:
-                raise Exception("Can't retrieve timestamp from %s" % last_record)
-            sync_start = parse(ts)
+    checkpoints = Checkpoints(checkpoint_file) if checkpoint_file else None
+    stop = threading.Event()
+
+    def sync_measurement(measurement):
+        # each measurement is synchronized in its own thread with its own connections
+        from_store = Store(dbname, "", fhost, fport, from_username, from_password, batch_size=0)
+        to_store = Store(dbname, "", dhost, dport, to_username, to_password, batch_size=0)
+        if reconcile:
+            return reconcile_measurement(from_store, to_store, measurement,
+                                         parse(start or "1970-01-01T00:00:00Z"), leaf_size=leaf_size, verbose=verbose)
+        key = Checkpoints.key(from_db, to_db, dbname, measurement)
+
+        # get last record timestamp: from the command line, the checkpoint, or the destination
+        sync_start = parse("1970-01-01T00:00:00Z")
+        checkpoint = checkpoints.get(key) if checkpoints else None
+        if start:
+            sync_start = parse(start)
+        elif checkpoint:
+            sync_start = parse(checkpoint)
+        else:
+            rs = to_store.query("select * from %s order by time desc limit 1" % measurement)
+            if rs:
+                last_record = list(rs.get_points())[0]
+                ts = last_record.get("time")
+                if not ts:
+                    raise Exception("Can't retrieve timestamp from %s" % last_record)
+                sync_start = parse(ts)
+        if verbose:
+            print("%s: synchronizing from %s" % (measurement, sync_start.isoformat()))
+
         # perform sync, starting at last record that has already been synced
-        sync_count += perform_bulk_transfer(from_store, to_store, measurement, sync_start, 100, verbose)
-    return sync_count
+        on_commit = (lambda last_time: checkpoints.set(key, last_time)) if checkpoints else None
+        if follow:
+            return follow_measurement(from_store, to_store, measurement, sync_start, stop, interval, report_interval,
+                                      on_commit=on_commit, verbose=verbose)
+        return perform_bulk_transfer(from_store, to_store, measurement, sync_start, 100, verbose, on_commit=on_commit,
+                                     stop=stop)
+
+    if follow:
+        workers = len(measurements)  # each measurement is followed in its own thread
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(measurements)))) as executor:
+        futures = [executor.submit(sync_measurement, measurement) for measurement in measurements]
+        try:
+            return sum(future.result() for future in futures)
+        except KeyboardInterrupt:
+            # let the transfers finish writing their current chunk
+            stop.set()
+            return sum(future.result() for future in futures)
 
 def valid_credentials(s):
     if s:
@@ -219,6 +687,7 @@ if __name__ == '__main__':
 
     python3 hissync.py rpi localhost flow sensor_mean
     python3 hissync.py localhost influxdb_main.example.com flow sensor_mean,run,diagram --verbose
+    python3 hissync.py localhost influxdb_main.example.com flow sensor_mean --reconcile --verbose
 
     """
     parser = argparse.ArgumentParser(description="Synchronize/replicate history/time series of an influxdb database.")
@@ -238,6 +707,24 @@ if __name__ == '__main__':
     parser.add_argument("-tc", "--to_credentials", 
       type=valid_credentials,
       help="destination db username:password" )
+    parser.add_argument("-w", "--workers", type=int, default=4,
+      help="number of measurements synchronized in parallel (default 4)")
+    parser.add_argument("-c", "--checkpoint_file", type=str, default=os.path.expanduser("~/.hissync_checkpoints.json"),
+      help="file recording how far each measurement has been synchronized (default ~/.hissync_checkpoints.json)")
+    parser.add_argument("-s", "--start", type=str,
+      help="time to synchronize from (e.g. 2017-06-20T00:00:00Z), instead of resuming from the checkpoint; "
+           "use this to resynchronize a destination that has lost records")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("-f", "--follow", help="keep running, replicating new records as they are written",
+      action="store_true")
+    mode.add_argument("-R", "--reconcile", action="store_true",
+      help="compare the databases (from --start if given) and transfer only the records missing from the destination")
+    parser.add_argument("-i", "--interval", type=float, default=5.0,
+      help="seconds between polls for new records with --follow (default 5)")
+    parser.add_argument("-r", "--report_interval", type=float, default=60.0,
+      help="seconds between lag reports with --follow (default 60)")
+    parser.add_argument("-l", "--leaf_size", type=int, default=1000,
+      help="number of records below which --reconcile compares records one by one (default 1000)")
 
     args = parser.parse_args()
 
@@ -261,7 +748,12 @@ if __name__ == '__main__':
     #verbose = True
     if verbose:
         print("from_credentials=%s, to_credentials=%s" % (from_credentials, to_credentials))
-    rc = do_hissync(from_db, from_credentials, to_db, to_credentials, dbname, measurements, verbose=verbose)
+    # stop cleanly (after writing the current chunks) when the process is stopped, as with Ctrl-C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    rc = do_hissync(from_db, from_credentials, to_db, to_credentials, dbname, measurements, verbose=verbose,
+                    workers=args.workers, checkpoint_file=args.checkpoint_file, start=args.start,
+                    follow=args.follow, interval=args.interval, report_interval=args.report_interval,
+                    reconcile=args.reconcile, leaf_size=args.leaf_size)
     if rc > 0:
         ret = 0
     else:
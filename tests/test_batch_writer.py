@@ -0,0 +1,86 @@
+import time
+
+from flow.batch_writer import BatchWriter
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_writes_full_batches():
+    batches = []
+    writer = BatchWriter(batches.append, batch_size=3, flush_interval=60)
+    writer.add([1, 2])
+    time.sleep(0.05)
+    assert batches == []
+    writer.add([3])
+    assert wait_for(lambda: batches == [[1, 2, 3]])
+    writer.add([4])
+    writer.close()
+    assert batches == [[1, 2, 3], [4]]
+
+
+def test_writes_after_flush_interval():
+    batches = []
+    writer = BatchWriter(batches.append, batch_size=100, flush_interval=0.05)
+    writer.add([1])
+    assert wait_for(lambda: batches == [[1]])
+    writer.close()
+
+
+def test_failed_writes_retried_and_capped():
+    batches = []
+    failing = [True]
+
+    def write(points):
+        if failing[0]:
+            raise IOError('no connection')
+        batches.append(points)
+
+    writer = BatchWriter(write, batch_size=100, flush_interval=60, max_buffered=3)
+    writer.add([1, 2])
+    assert not writer.flush()
+    writer.add([3, 4])
+    assert writer.pending_count() == 3 and writer.dropped_count == 1
+    failing[0] = False
+    writer.close()
+    assert batches == [[2, 3, 4]]
+
+
+class Rejected(Exception):
+    pass
+
+
+def test_rejected_points_dropped():
+    written = []
+
+    def write(points):
+        if 'bad' in points:
+            raise Rejected('field type conflict')
+        written.extend(points)
+
+    writer = BatchWriter(write, batch_size=100, flush_interval=60, is_rejected=lambda err: isinstance(err, Rejected))
+    writer.add(['bad', 1, 2, 3, 4])
+    assert writer.flush()
+    writer.add([5, 6])
+    assert writer.flush()
+    writer.close()
+    assert written == [1, 2, 3, 4, 5, 6]
+    assert writer.dropped_count == 1 and writer.pending_count() == 0
+
+
+def test_failed_writes_dropped_after_max_retries():
+    def write(points):
+        raise IOError('no connection')
+
+    writer = BatchWriter(write, batch_size=100, flush_interval=60, max_retries=2)
+    writer.add([1, 2])
+    assert not writer.flush()
+    assert not writer.flush()
+    assert writer.pending_count() == 2
+    assert not writer.flush()
+    assert writer.pending_count() == 0 and writer.dropped_count == 2
+    writer.close()
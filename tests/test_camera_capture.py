@@ -0,0 +1,92 @@
+import gevent
+from PIL import Image
+
+from flow.camera_capture import CameraFrame, CameraCapture, encode_rendition
+
+
+# a camera that captures solid gray images, one shade brighter each time
+class FakeCamera(object):
+
+    def __init__(self, size=(640, 480)):
+        self.size = size
+        self.capture_count = 0
+
+    def capture_image(self):
+        self.capture_count += 1
+        return Image.new('L', self.size, self.capture_count)
+
+
+def test_renditions_created_on_demand_and_cached():
+    frame = CameraFrame(Image.new('RGB', (1296, 972)), 0)
+    assert frame.renditions == {}
+    medium = frame.rendition((640, 480))
+    assert medium.image.size == (640, 480)
+    assert frame.rendition((640, 480)) is medium
+    assert list(frame.renditions) == [(640, 480)]
+
+    # smaller renditions are made from the cached rendition rather than the full frame
+    def copy_full_frame():
+        raise AssertionError('full frame copied')
+    frame.image.copy = copy_full_frame
+    small = frame.rendition((320, 320))
+    assert small.image.size == (320, 240)
+    assert len(frame.renditions) == 2
+
+    assert encode_rendition(frame, (320, 320)) == small.encoded()
+
+
+def test_latest_frame_wins():
+    camera = FakeCamera()
+    capture = CameraCapture(camera, interval=0.01, sizes=[(320, 240)])
+    assert capture.latest_frame is None
+    capture.start()
+    gevent.sleep(0.2)
+    capture.stop()
+    assert camera.capture_count > 1
+
+    # only the most recent frame is kept (a capture may have been interrupted by stop),
+    # with its renditions already encoded
+    frame = capture.latest_frame
+    assert frame.image.getpixel((0, 0)) >= camera.capture_count - 1
+    assert frame.renditions[(320, 240)]._encoded is not None
+
+
+def test_stop_and_restart():
+    camera = FakeCamera()
+    capture = CameraCapture(camera, interval=0.01)
+    capture.start()
+    greenlet = capture.greenlet
+    capture.start()  # already started
+    assert capture.greenlet is greenlet
+    gevent.sleep(0.05)
+    capture.stop()
+    assert capture.greenlet is None and greenlet.dead
+    count = camera.capture_count
+    gevent.sleep(0.05)
+    assert camera.capture_count == count
+
+    capture.start()
+    gevent.sleep(0.05)
+    capture.stop()
+    assert camera.capture_count > count
+    assert capture.latest_frame.image.getpixel((0, 0)) > count
+
+
+def test_capture_errors_do_not_stop_capture():
+    camera = FakeCamera()
+    capture_image = camera.capture_image
+    calls = []
+
+    def failing_capture_image():
+        calls.append(1)
+        if len(calls) == 1:
+            raise IOError('camera busy')
+        return capture_image()
+
+    camera.capture_image = failing_capture_image
+    capture = CameraCapture(camera, interval=0.01)
+    capture.start()
+    gevent.sleep(0.1)
+    capture.stop()
+    assert len(calls) > 1
+    assert capture.latest_frame is not None
@@ -0,0 +1,55 @@
+from flow.delta_encoder import DeltaEncoder
+
+
+def test_keyframes_until_acknowledged():
+    encoder = DeltaEncoder()
+    for i in range(3):
+        message = encoder.encode({1: '1.5', 2: '3'})
+        assert message['keyframe'] is True
+        assert message['values'] == {1: '1.5', 2: '3'}
+    assert message['frame'] == 3
+
+
+def test_deltas_relative_to_acknowledged_keyframe():
+    encoder = DeltaEncoder()
+    first = encoder.encode({1: '1.5', 2: '3', 3: None})
+    assert encoder.acknowledge(first['frame'])
+
+    message = encoder.encode({1: '1.5', 2: '4', 3: None})
+    assert message == {'values': {2: '4'}, 'frame': 2, 'base': 1, 'keyframe': False}
+
+    # deltas stay relative to the keyframe: an acknowledgement of a delta (e.g. by one of several clients) is ignored
+    message = encoder.encode({1: '1.6', 2: '4', 3: None})
+    assert message['values'] == {1: '1.6', 2: '4'}
+    assert not encoder.acknowledge(3)
+    message = encoder.encode({1: '1.6', 2: '4', 3: None})
+    assert message['values'] == {1: '1.6', 2: '4'} and message['base'] == 1
+
+    # frames that were never sent are not accepted
+    assert not encoder.acknowledge(100)
+
+
+def test_base_changes_when_new_keyframe_acknowledged():
+    encoder = DeltaEncoder(keyframe_interval=3)
+    encoder.acknowledge(encoder.encode({1: '1'})['frame'])
+    assert [encoder.encode({1: '2'})['base'] for i in range(2)] == [1, 1]
+    keyframe = encoder.encode({1: '3'})
+    assert keyframe['keyframe'] is True
+
+    # until the new keyframe is acknowledged, deltas are relative to the old one
+    assert encoder.encode({1: '3'}) == {'values': {1: '3'}, 'frame': 5, 'base': 1, 'keyframe': False}
+    assert encoder.acknowledge(keyframe['frame'])
+    assert not encoder.acknowledge(1)
+    assert encoder.encode({1: '3'}) == {'values': {}, 'frame': 6, 'base': 4, 'keyframe': False}
+
+
+def test_periodic_and_requested_keyframes():
+    encoder = DeltaEncoder(keyframe_interval=3)
+    values = {1: '1', 2: '2'}
+    encoder.acknowledge(encoder.encode(values)['frame'])
+    assert [encoder.encode(values)['keyframe'] for i in range(4)] == [False, False, True, False]
+    encoder.request_keyframe()
+    assert encoder.encode(values)['values'] == values
+    encoder.reset()
+    message = encoder.encode(values)
+    assert message['keyframe'] is True and message['frame'] == 1
@@ -0,0 +1,168 @@
+import numpy as np
+import pytest
+from flow.diagram import Diagram
+
+
+def block_spec(id, type, sources=[], value=None, input_count=None, params=None):
+    spec = {
+        'id': id,
+        'name': '%s %d' % (type, id),
+        'type': type,
+        'sources': sources,
+        'input_count': len(sources) if input_count is None else input_count,
+        'output_count': 1,
+        'input_type': 'n',
+        'output_type': 'n',
+        'params': params or [],
+    }
+    if value is not None:
+        spec['value'] = value
+    return spec
+
+
+def test_update_computes_chain():
+    diagram = Diagram('chain', {'blocks': [
+        block_spec(3, 'plus', [1, 2]),
+        block_spec(1, 'number', value=1.5),
+        block_spec(2, 'number', value=2.25),
+        block_spec(4, 'times', [3, 2]),
+    ]})
+    diagram.update()
+    assert diagram.find_block_by_id(3).value == 3.75
+    assert diagram.find_block_by_id(4).value == 8.44
+
+
+def test_execution_plan_orders_sources_first():
+    diagram = Diagram('order', {'blocks': [
+        block_spec(4, 'times', [3, 2]),
+        block_spec(3, 'plus', [1, 2]),
+        block_spec(2, 'number', value=2),
+        block_spec(1, 'number', value=1),
+    ]})
+    positions = dict((block.id, index) for index, block in enumerate(diagram.execution_plan))
+    assert len(positions) == 4
+    for block in diagram.blocks:
+        for source in block.sources:
+            assert positions[source.id] < positions[block.id]
+
+
+def test_long_chain_does_not_recurse():
+    blocks = [block_spec(0, 'number', value=1)]
+    for id in range(1, 5000):
+        blocks.append(block_spec(id, 'absolute value', [id - 1]))
+    diagram = Diagram('long', {'blocks': blocks})
+    diagram.update()
+    assert diagram.find_block_by_id(4999).value == 1
+
+
+def test_cycle_rejected():
+    with pytest.raises(ValueError):
+        Diagram('cycle', {'blocks': [
+            block_spec(1, 'number', value=1),
+            block_spec(2, 'plus', [1, 3]),
+            block_spec(3, 'absolute value', [2]),
+        ]})
+
+
+def count_updates(block, counts):
+    update = block.update
+
+    def counting_update():
+        counts[block.id] = counts.get(block.id, 0) + 1
+        update()
+    block.update = counting_update
+
+
+def test_incremental_update_only_recomputes_changed_cone():
+    diagram = Diagram('incremental', {'blocks': [
+        block_spec(1, 'temperature'),
+        block_spec(2, 'number', value=10),
+        block_spec(3, 'plus', [1, 2]),
+        block_spec(4, 'number', value=3),
+        block_spec(5, 'absolute value', [4]),
+    ]}, incremental=True)
+    diagram.set_block_value(diagram.find_block_by_id(1), 1.5, 1)
+    diagram.update()
+    assert diagram.find_block_by_id(3).value == 11.5
+    assert diagram.find_block_by_id(5).value == 3
+
+    counts = {}
+    for block in diagram.blocks:
+        count_updates(block, counts)
+    diagram.update()
+    assert counts == {}
+
+    diagram.set_block_value(diagram.find_block_by_id(1), 2.5, 1)
+    diagram.update()
+    assert counts == {1: 1, 3: 1}
+    assert diagram.find_block_by_id(3).value == 12.5
+
+    # writing an unchanged value does not dirty anything
+    diagram.set_block_value(diagram.find_block_by_id(1), 2.5, 1)
+    diagram.update()
+    assert counts == {1: 1, 3: 1}
+
+
+def test_incremental_update_matches_full_update():
+    params = [{'name': 'seconds_on', 'value': 2}, {'name': 'seconds_off', 'value': 3}]
+    blocks = [
+        block_spec(1, 'temperature'),
+        block_spec(2, 'timer', params=params),
+        block_spec(3, 'times', [1, 2]),
+        block_spec(4, 'simple moving average', [1]),
+    ]
+    full = Diagram('full', {'blocks': blocks})
+    incremental = Diagram('incremental', {'blocks': blocks}, incremental=True)
+    samples = [1.0, 1.0, 2.0, 2.0, 2.0, 3.5, 3.5, 1.0, 1.0, 1.0]
+    for sample in samples:
+        for diagram in (full, incremental):
+            diagram.set_block_value(diagram.find_block_by_id(1), sample, 1)
+            diagram.update()
+        for id in (2, 3, 4):
+            assert full.find_block_by_id(id).value == incremental.find_block_by_id(id).value
+
+
+def test_evaluate_batch_matches_update():
+    timer_params = [{'name': 'seconds_on', 'value': 3}, {'name': 'seconds_off', 'value': 4}]
+    period_params = [{'name': 'period', 'value': 5}]
+    blocks = [
+        block_spec(1, 'temperature'),
+        block_spec(2, 'humidity'),
+        block_spec(3, 'timer', params=timer_params),
+        block_spec(4, 'plus', [1, 2]),
+        block_spec(5, 'divided by', [4, 2]),
+        block_spec(6, 'simple moving average', [1], params=period_params),
+        block_spec(7, 'exponential moving average', [5], params=period_params),
+        block_spec(8, 'and', [3, 6]),
+        block_spec(9, 'greater than', [6, 7]),
+    ]
+    temperature = [21.5, 22.25, None, 23.0, 22.75, 21.0, 20.5, None, 24.125, 23.5, 22.0, 21.25]
+    humidity = [40.0, 0.0, 41.5, 42.0, None, 39.5, 38.0, 37.5, 40.25, 0.0, 41.0, 43.5]
+
+    diagram = Diagram('tick', {'blocks': blocks})
+    block = diagram.find_block_by_id(1)
+
+    def decimal_places(values):
+        return np.array([block.compute_decimal_places(value) if value is not None else 0 for value in values])
+
+    expected = dict((id, []) for id in range(1, 10))
+    for t, h in zip(temperature, humidity):
+        for id, value in ((1, t), (2, h)):
+            diagram.set_block_value(diagram.find_block_by_id(id), value, decimal_places([value])[0])
+        diagram.update()
+        for id in expected:
+            expected[id].append(diagram.find_block_by_id(id).value)
+
+    def to_array(values):
+        return np.array([np.nan if value is None else value for value in values])
+
+    results = Diagram('batch', {'blocks': blocks}).evaluate_batch({
+        'temperature 1': to_array(temperature),
+        'humidity 2': to_array(humidity),
+    }, decimal_places={
+        'temperature 1': decimal_places(temperature),
+        'humidity 2': decimal_places(humidity),
+    })
+    for id in expected:
+        assert np.array_equal(np.isnan(results[id]), np.isnan(to_array(expected[id])))
+        assert np.allclose(results[id], to_array(expected[id]), rtol=0, atol=1e-12, equal_nan=True)
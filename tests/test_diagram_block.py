@@ -1,4 +1,7 @@
 import pytest
+from decimal import Decimal, ROUND_HALF_UP
+
+from flow.blocks.precision import format_value
 from flow.blocks.block import Block
 
 temperature_block = Block({
@@ -45,3 +48,29 @@ def test_compute_decimal_places():
     assert numeric_block.compute_decimal_places("1e-11") == 11
     assert temperature_block.compute_decimal_places("12341.9201") == 4
     assert numeric_block.compute_decimal_places(".000") == 3
+
+
+def test_compute_decimal_places_matches_decimal():
+    for num_str in ["10", "-2.50", "1.5e3", "1E-4", "+0.125", 24.12, 3, 1e-05]:
+        assert numeric_block.compute_decimal_places(num_str) == abs(Decimal(str(num_str)).as_tuple().exponent)
+    with pytest.raises(ValueError):
+        numeric_block.compute_decimal_places("n/a")
+
+
+def test_round():
+    assert numeric_block.round(2.675, 2) == 2.68
+    assert numeric_block.round(-2.675, 2) == -2.68
+    assert numeric_block.round(1.005, 2) == 1.01
+    assert numeric_block.round(2.5, 0) == 3.0
+    assert numeric_block.round(2.674999, 2) == 2.67
+    for value in [0.125, 13.687499, 14.409, 1234.5678, -0.0449]:
+        for decimal_places in range(5):
+            decimal_exp = Decimal(10) ** -decimal_places
+            expected = float(Decimal(str(value)).quantize(decimal_exp, rounding=ROUND_HALF_UP))
+            assert numeric_block.round(value, decimal_places) == expected
+
+
+def test_format_value():
+    assert format_value(1.5, 0) == '2'
+    assert format_value(24.12, 3) == '24.120'
+    assert format_value(-0.25, 1) == '-0.2'
@@ -0,0 +1,51 @@
+import numpy as np
+
+from flow.downsample import lttb, min_max_envelope, min_max_envelope_bounds, read_bounds, read_series
+
+
+def test_read_series():
+    points = [{'time': '2017-06-16T20:%02d:00Z' % minute, 'mean': float(minute)} for minute in range(50)]
+    points.insert(3, {'time': '2017-06-16T19:00:00Z', 'mean': None})
+    times, values = read_series(iter(points), chunk_size=7)
+    assert len(times) == 50 and len(values) == 50
+    assert times[1] - times[0] == 60
+    assert times[0] == 1497643200
+    assert list(values) == list(range(50))
+
+
+def test_lttb_keeps_ends_and_peaks():
+    times = np.arange(10000, dtype=float)
+    values = np.sin(times / 500.0)
+    values[5000] = 50.0
+    values[7000] = -50.0
+    selected = lttb(times, values, 120)
+    assert len(selected) == 120
+    assert selected[0] == 0 and selected[-1] == 9999
+    assert np.all(np.diff(selected) > 0)
+    assert 5000 in selected and 7000 in selected
+    assert list(lttb(times[:50], values[:50], 120)) == list(range(50))
+
+
+def test_min_max_envelope_keeps_extremes():
+    times = np.arange(1000, dtype=float)
+    values = np.zeros(1000)
+    values[123] = 5.0
+    values[876] = -5.0
+    selected = min_max_envelope(times, values, 120)
+    assert len(selected) <= 120
+    assert 123 in selected and 876 in selected
+    assert np.all(np.diff(selected) > 0)
+
+
+def test_min_max_envelope_uses_min_and_max_fields():
+    points = [{'time': '2017-06-16T20:%02d:00Z' % minute, 'mean': 1.0, 'min': 0.5, 'max': 1.5} for minute in range(60)]
+    points[10]['max'] = 9.0  # a short spike within a minute, hidden by the mean
+    points[40]['min'] = -9.0
+    points[50] = {'time': points[50]['time'], 'mean': 2.0}  # without min and max
+    times, minimums, maximums = read_bounds(iter(points), chunk_size=7)
+    assert len(times) == 60 and minimums[50] == maximums[50] == 2.0
+    times, values = min_max_envelope_bounds(times, minimums, maximums, 20)
+    assert len(values) <= 20
+    assert 9.0 in values and -9.0 in values and 2.0 in values
+    assert times[list(values).index(9.0)] - times[0] == 600
+    assert np.all(np.diff(times) >= 0)
@@ -1,11 +1,27 @@
+import os
+import time
+import random
+
+import numpy as np
 import pytest
 import PIL
 from rhizo.extensions.camera import encode_image
 
+from flow.blocks.image_value import ImageValue
+from flow.blocks.memoize import ResultCache, memoize_compute
 from flow.blocks.filters.brightness import Brightness
 from flow.blocks.filters.blur import Blur
 from flow.blocks.filters.sma import SimpleMovingAverage
 from flow.blocks.filters.ema import ExponentialMovingAverage
+from flow.blocks.filters.offload import FilterPool
+from flow.blocks.filters.operator import Operator, operators, register_binary_operator
+from flow.blocks.filters.ring_buffer import RingBuffer
+from flow.blocks.filters.rolling_minimum import RollingMinimum
+from flow.blocks.filters.rolling_maximum import RollingMaximum
+from flow.blocks.filters.rolling_median import RollingMedian
+from flow.blocks.filters.rolling_percentile import RollingPercentile
+from flow.blocks.filters.rolling_standard_deviation import RollingStandardDeviation
+from flow.blocks.filters.windows import IndexableSkiplist
 
 brightness = Brightness(None)
 blur = Blur(None)
@@ -38,8 +54,9 @@ def test_brightness_pillow_image_returned():
               'value': 50.0, 'min': -100, 'max': 100}]
 
     image = brightness.compute(inputs, params)
-    assert isinstance(image, PIL.Image.Image) is False
-    assert isinstance(image, (str, unicode)) is True
+    assert isinstance(image, ImageValue) is True
+    assert isinstance(image.image, PIL.Image.Image) is True
+    assert isinstance(image.encoded(), (str, unicode)) is True
 
 
 def test_blur_pillow_image_returned():
@@ -48,8 +65,61 @@ def test_blur_pillow_image_returned():
               'value': 50.0, 'min': -100, 'max': 100}]
 
     image = blur.compute(inputs, params)
-    assert isinstance(image, PIL.Image.Image) is False
-    assert isinstance(image, (str, unicode)) is True
+    assert isinstance(image, ImageValue) is True
+    assert isinstance(image.image, PIL.Image.Image) is True
+    assert isinstance(image.encoded(), (str, unicode)) is True
+
+
+def test_image_values_chain_without_encoding():
+    inputs = [ImageValue(PIL.Image.new('RGB', (100, 100), color=(50, 50, 50)))]
+    blur_params = [{'name': 'blur_amount', 'value': 2.0}]
+    brightness_params = [{'name': 'brightness_adjustment',
+                         'value': 50.0, 'min': -100, 'max': 100}]
+
+    image = brightness.compute([blur.compute(inputs, blur_params)], brightness_params)
+    assert image._encoded is None
+    assert image.image.getpixel((50, 50))[0] > 50
+
+
+def test_image_filter_results_memoized():
+    Blur.result_cache.clear()
+    params = [{'name': 'blur_amount', 'value': 2.0}]
+    first = blur.compute([ImageValue(PIL.Image.new('RGB', (100, 100), color=(10, 20, 30)))], params)
+    # an identical frame in a new ImageValue hits the cache
+    second = blur.compute([ImageValue(PIL.Image.new('RGB', (100, 100), color=(10, 20, 30)))], params)
+    assert second is first
+    # a different frame or different params miss
+    assert blur.compute([ImageValue(PIL.Image.new('RGB', (100, 100), color=(10, 20, 31)))], params) is not first
+    assert blur.compute([second], [{'name': 'blur_amount', 'value': 3.0}]) is not first
+    assert len(Blur.result_cache) == 3
+
+
+def test_result_cache_limits():
+    cache = ResultCache(max_entries=3, max_bytes=100)
+    for key in range(4):
+        cache.put(key, key, 10)
+    assert cache.get(0) is None
+    assert cache.get(1) == 1  # now most recently used
+    cache.put(4, 4, 85)
+    assert len(cache) == 2 and cache.get(1) == 1 and cache.get(4) == 4
+    cache.put(5, 5, 200)  # larger than the whole cache
+    assert cache.get(5) is None
+
+
+def test_memoize_compute_decorator():
+    calls = []
+
+    class Square(Operator):
+        @memoize_compute(max_entries=2)
+        def compute(self, inputs, params):
+            calls.append(inputs[0])
+            return inputs[0] * inputs[0]
+
+    block = Square(None)
+    assert block.compute([3.0], []) == 9.0
+    assert block.compute([3.0], []) == 9.0
+    assert block.compute([4.0], []) == 16.0
+    assert calls == [3.0, 4.0]
 
 
 def test_simple_moving_average_values():
@@ -126,3 +196,163 @@ def test_exponential_moving_average_values():
         moving_average = ema.round(ema.compute([item], None), 2)
     assert moving_average == 15.34
 
+
+
+def test_simple_moving_average_period_change():
+    sma = SimpleMovingAverage(None)
+    for item in [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]:
+        sma.compute([item], [{'name': 'period', 'value': 4}])
+    assert sma.period_history == [3.0, 4.0, 5.0, 6.0]
+
+    # shrinking the period keeps the newest values
+    assert sma.compute([7.0], [{'name': 'period', 'value': 2}]) == 6.5
+    assert sma.period_history == [6.0, 7.0]
+
+    # growing the period keeps all values until the history fills up again
+    assert sma.compute([8.0], [{'name': 'period', 'value': 5}]) == 7.0
+    assert sma.period_history == [6.0, 7.0, 8.0]
+
+
+def test_ring_buffer_running_sum():
+    buffer = RingBuffer(3)
+    for value in range(1, 10001):
+        buffer.append(value * 0.1)
+    assert [round(value, 6) for value in buffer] == [999.8, 999.9, 1000.0]
+    assert abs(buffer.sum - sum(list(buffer))) < 1e-9
+
+
+def test_rolling_window_statistics():
+    random.seed(1)
+    data = [round(random.uniform(-50, 50), 2) for i in range(300)]
+    window = 7
+    params = [{'name': 'window', 'value': window}, {'name': 'percentile', 'value': 90}]
+    blocks = [RollingMinimum(None), RollingMaximum(None), RollingMedian(None),
+              RollingPercentile(None), RollingStandardDeviation(None)]
+    for index, item in enumerate(data):
+        recent = data[max(index - window + 1, 0):index + 1]
+        minimum, maximum, median, percentile, standard_deviation = [block.compute([item], params) for block in blocks]
+        assert minimum == min(recent)
+        assert maximum == max(recent)
+        assert abs(median - np.percentile(recent, 50)) < 1e-9
+        assert abs(percentile - np.percentile(recent, 90)) < 1e-9
+        assert abs(standard_deviation - np.std(recent)) < 1e-9
+
+
+def test_indexable_skiplist():
+    random.seed(2)
+    skiplist = IndexableSkiplist()
+    values = []
+    for i in range(2000):
+        if values and random.random() < 0.45:
+            value = random.choice(values)
+            values.remove(value)
+            skiplist.remove(value)
+        else:
+            value = random.randint(0, 30) * 0.5  # with repeated values
+            values.append(value)
+            skiplist.insert(value)
+    values.sort()
+    assert len(skiplist) == len(values)
+    assert [skiplist[rank] for rank in range(len(skiplist))] == values
+    with pytest.raises(ValueError):
+        skiplist.remove(100.0)
+    with pytest.raises(IndexError):
+        skiplist[len(values)]
+
+
+def test_rolling_window_change():
+    minimum = RollingMinimum(None)
+    median = RollingMedian(None)
+    for item in [5.0, 1.0, 4.0, 3.0, 2.0]:
+        minimum.compute([item], [{'name': 'window', 'value': 5}])
+        median.compute([item], [{'name': 'window', 'value': 5}])
+    assert minimum.compute([6.0], [{'name': 'window', 'value': 2}]) == 2.0
+    assert median.compute([6.0], [{'name': 'window', 'value': 3}]) == 3.0
+
+
+def operator_spec(type, input_count):
+    return {'id': 1, 'name': type, 'type': type, 'sources': [], 'input_count': input_count,
+            'input_type': 'n', 'output_type': 'n'}
+
+
+def test_operator_values():
+    assert Operator(operator_spec('plus', 2)).compute([1.5, 2.0], None) == 3.5
+    assert Operator(operator_spec('divided by', 2)).compute([1.0, 0.0], None) is None
+    assert Operator(operator_spec('not', 1)).compute([0.0], None) == 1
+    assert Operator(operator_spec('xor', 2)).compute([1.0, 0.0], None) == 1
+    assert Operator(operator_spec('number', 0)).compute([4.0], None) == 4.0
+
+
+def test_operator_input_count_validated():
+    with pytest.raises(ValueError):
+        Operator(operator_spec('plus', 1))
+
+
+def test_operator_registration():
+    register_binary_operator('maximum', max, np.maximum)
+    try:
+        operator = Operator(operator_spec('maximum', 2))
+        assert operator.compute([1.0, 3.0], None) == 3.0
+        assert list(operator.compute_batch([np.array([1.0, 5.0]), np.array([3.0, 2.0])], None, None)) == [3.0, 5.0]
+    finally:
+        del operators['maximum']
+
+
+def test_filter_pool_returns_latest_result():
+    pool = FilterPool(processes=1, slots=2)
+    try:
+        block = Blur({'id': 1, 'name': 'blur', 'type': 'blur', 'sources': [], 'input_count': 1,
+                      'input_type': 'i', 'output_type': 'i'})
+        block.offload_pool = pool
+        Blur.result_cache.clear()
+        inputs = [ImageValue(PIL.Image.new('RGB', (100, 100), color=(0, 0, 0)))]
+        params = [{'name': 'blur_amount', 'value': 2.0}]
+
+        # the first call starts a job but there is no result yet
+        assert block.compute(inputs, params) is None
+        deadline = time.time() + 10
+        image = None
+        while image is None and time.time() < deadline:
+            time.sleep(0.05)
+            image = block.compute(inputs, params)
+        assert isinstance(image, ImageValue) is True
+        assert image.image.size == (100, 100)
+    finally:
+        pool.close()
+
+
+def test_filter_pool_buffers_and_jobs():
+    pool = FilterPool(processes=1, slots=2)
+    try:
+        block = Blur({'id': 1, 'name': 'blur', 'type': 'blur', 'sources': [], 'input_count': 1,
+                      'input_type': 'i', 'output_type': 'i'})
+        params = [{'name': 'blur_amount', 'value': 2.0}]
+        assert pool.buffers == [None, None]  # nothing is allocated until an image is filtered
+
+        def wait_for_result(image):
+            deadline = time.time() + 10
+            while block in pool.jobs and time.time() < deadline:
+                time.sleep(0.05)
+                pool.collect(block)
+            return pool.process(block, image, params)
+
+        small = ImageValue(PIL.Image.new('RGB', (20, 10)))
+        assert pool.process(block, small, params) is None
+        slot = pool.jobs[block][0]
+        assert pool.buffers[slot].size == 20 * 10 * 3 + 20 * 10 * 4
+        assert wait_for_result(small).image.size == (20, 10)
+
+        # the same image is not processed again
+        assert pool.process(block, ImageValue(PIL.Image.new('RGB', (20, 10))), params).image.size == (20, 10)
+        assert block not in pool.jobs
+
+        # a larger image replaces the slot's buffer
+        large = ImageValue(PIL.Image.new('RGB', (40, 30)))
+        pool.process(block, large, params)
+        assert pool.jobs[block][0] == slot
+        assert pool.buffers[slot].size == 40 * 30 * 3 + 40 * 30 * 4
+        assert wait_for_result(large).image.size == (40, 30)
+        assert block not in pool.jobs
+    finally:
+        pool.close()
+    assert not os.path.exists(pool.directory)
@@ -0,0 +1,438 @@
+import re
+import sys
+import datetime
+import threading
+
+import pytest
+
+if sys.version_info[0] < 3:
+    pytest.skip('hissync.py requires python 3', allow_module_level=True)
+pytest.importorskip('influxdb')
+
+import hissync
+
+
+FIELD_TYPES = {'min': 'float', 'max': 'float', 'mean': 'float', 'count': 'integer'}
+
+
+def to_datetime(text):
+    return datetime.datetime.strptime(text.rstrip('Z').split('.')[0], '%Y-%m-%dT%H:%M:%S')
+
+
+class FakeResultSet(object):
+
+    def __init__(self, points, series=None):
+        self.points = points
+        self.series = series or []
+
+    def get_points(self):
+        return iter(self.points)
+
+    def items(self):
+        return [((measurement, tags), iter(points)) for measurement, tags, points in self.series]
+
+    def __len__(self):
+        return len(self.points)
+
+
+class FakeClient(object):
+
+    def __init__(self, store):
+        self.store = store
+
+    def write_points(self, points):
+        self.store.writes.append(points)
+        for point in points:
+            row = dict(point['tags'])
+            row.update(point['fields'])
+            row['time'] = point['time']
+            key = (point['measurement'], row['time'], tuple(sorted(point['tags'].items())))
+            self.store.rows[key] = (point['measurement'], row)
+
+
+class FakeStore(object):
+    """Answers the queries hissync makes from points kept in memory."""
+
+    def __init__(self, field_types=FIELD_TYPES):
+        self.rows = {}  # maps (measurement, time, tags) to (measurement, row)
+        self.field_types = field_types
+        self.queries = []
+        self.writes = []
+        self.dbclient = FakeClient(self)
+
+    def add(self, measurement, time, tags, fields):
+        self.dbclient.write_points([{'measurement': measurement, 'time': time, 'tags': tags, 'fields': fields}])
+
+    def records(self, measurement):
+        records = [row for row_measurement, row in self.rows.values() if row_measurement == measurement]
+        return sorted(records, key=lambda row: (to_datetime(row['time']), row['time']))
+
+    def query(self, querystr, chunked=False, chunk_size=0):
+        self.queries.append(querystr)
+        match = re.match(r'show field keys from (\w+)', querystr)
+        if match:
+            return FakeResultSet([{'fieldKey': key, 'fieldType': field_type}
+                                  for key, field_type in sorted(self.field_types.items())])
+        measurement = re.search(r' from (\w+)', querystr).group(1)
+        records = self.records(measurement)
+        for op, value in re.findall(r"time (>=|<) '([^']+)'", querystr):
+            value = to_datetime(value)
+            records = [row for row in records if (to_datetime(row['time']) >= value) == (op == '>=')]
+        if 'cumulative_sum(*)' in querystr:
+            return self.aggregate(measurement, records, cumulative=True)
+        if 'sum(*)' in querystr:
+            return self.aggregate(measurement, records, integral='integral(*)' in querystr)
+        if 'count(*)' in querystr:
+            return FakeResultSet([{'time': '1970-01-01T00:00:00Z', 'count_mean': len(records)}] if records else [])
+        if 'desc' in querystr:
+            records.reverse()
+        match = re.search(r'limit (\d+)', querystr)
+        if match:
+            records = records[:int(match.group(1))]
+        records = [self.full_row(row) for row in records]
+        if chunked:
+            return (FakeResultSet(records[i:i + chunk_size]) for i in range(0, len(records), chunk_size))
+        return FakeResultSet(records)
+
+    def full_row(self, row):
+        # like influxdb, select * returns every field, with None for fields a record doesn't have
+        full_row = dict((key, None) for key in self.field_types)
+        full_row.update(row)
+        return full_row
+
+    def aggregate(self, measurement, records, integral=False, cumulative=False):
+        series = {}
+        for row in records:
+            tags = tuple(sorted((key, value) for key, value in row.items()
+                                if key not in self.field_types and key != 'time'))
+            series.setdefault(tags, []).append(row)
+        result = []
+        for tags, rows in sorted(series.items()):
+            aggregates = {'time': '1970-01-01T00:00:00Z'}
+            for key in self.field_types:
+                points = [((to_datetime(row['time']) - datetime.datetime(1970, 1, 1)).total_seconds(), row[key])
+                          for row in rows if row.get(key) is not None]
+                values = [value for _, value in points]
+                if cumulative:
+                    # select sum(*) from (select cumulative_sum(*) ...)
+                    aggregates['sum_cumulative_sum_' + key] = \
+                        sum(sum(values[:i + 1]) for i in range(len(values))) if values else None
+                    continue
+                aggregates['count_' + key] = len(values)
+                aggregates['sum_' + key] = sum(values) if values else None
+                if integral and values:
+                    # the area under the values over time (in seconds), like influxdb's integral()
+                    aggregates['integral_' + key] = sum((t2 - t1) * (v1 + v2) / 2.0
+                                                        for (t1, v1), (t2, v2) in zip(points, points[1:]))
+            result.append((measurement, dict(tags), [aggregates]))
+        return FakeResultSet([], result)
+
+
+def minute(index, day=datetime.datetime(2017, 6, 21)):
+    return (day + datetime.timedelta(minutes=index)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def test_convert_point_uses_field_keys():
+    point = hissync.convert_point('sensor_mean', {'time': minute(0), 'min': 1, 'max': 3, 'mean': 2.5, 'count': None,
+                                                  'name': 'light', 'pin': '2671'}, FIELD_TYPES)
+    assert point == {'time': minute(0), 'measurement': 'sensor_mean',
+                     'fields': {'min': 1.0, 'max': 3.0, 'mean': 2.5}, 'tags': {'name': 'light', 'pin': '2671'}}
+
+    # run and diagram records have a value field
+    store = FakeStore({'value': 'float'})
+    field_types = hissync.get_field_types(store, 'run')
+    point = hissync.convert_point('run', {'time': minute(0), 'value': 60, 'name': 'r1', 'pin': '2671',
+                                          'action': 'start'}, field_types)
+    assert point['fields'] == {'value': 60.0}
+    assert point['tags'] == {'name': 'r1', 'pin': '2671', 'action': 'start'}
+
+    with pytest.raises(ValueError):
+        hissync.convert_point('run', {'time': minute(0), 'name': 'r1', 'value': None}, field_types)
+
+
+def test_bulk_transfer_of_value_measurements():
+    source = FakeStore({'value': 'float'})
+    destination = FakeStore({'value': 'float'})
+    for index in range(5):
+        source.add('run', minute(index), {'name': 'r%d' % index, 'action': 'start'}, {'value': float(index)})
+    assert hissync.perform_bulk_transfer(source, destination, 'run', datetime.datetime(1970, 1, 1), 2) == 5
+    assert destination.records('run') == source.records('run')
+
+
+def test_checkpoints(tmpdir):
+    path = str(tmpdir.join('checkpoints.json'))
+    checkpoints = hissync.Checkpoints(path)
+    key = hissync.Checkpoints.key('rpi', 'central', 'flow', 'sensor_mean')
+    assert checkpoints.get(key) is None
+    checkpoints.set(key, minute(3))
+    assert hissync.Checkpoints(path).get(key) == minute(3)
+    assert not tmpdir.join('checkpoints.json.tmp').exists()
+
+
+def test_checkpoint_only_advances_after_writes(tmpdir, monkeypatch):
+    source = FakeStore()
+    destination = FakeStore()
+    for index in range(10):
+        source.add('sensor_mean', minute(index), {'name': 'light'}, {'mean': float(index)})
+    monkeypatch.setattr(hissync, 'Store', lambda dbname, pin, host, *args, **kwargs:
+                        source if host == 'source' else destination)
+    path = str(tmpdir.join('checkpoints.json'))
+    key = hissync.Checkpoints.key('source', 'destination', 'flow', 'sensor_mean')
+
+    def failing_write(points):
+        raise IOError('no connection')
+
+    monkeypatch.setattr(destination.dbclient, 'write_points', failing_write)
+    with pytest.raises(IOError):
+        hissync.do_hissync('source', None, 'destination', None, 'flow', ['sensor_mean'], checkpoint_file=path)
+    assert hissync.Checkpoints(path).get(key) is None
+
+    monkeypatch.undo()
+    monkeypatch.setattr(hissync, 'Store', lambda dbname, pin, host, *args, **kwargs:
+                        source if host == 'source' else destination)
+    assert hissync.do_hissync('source', None, 'destination', None, 'flow', ['sensor_mean'], checkpoint_file=path) == 10
+    assert hissync.Checkpoints(path).get(key) == minute(9)
+
+    # later runs resume from the checkpoint (rewriting the checkpointed record), and --start overrides it
+    source.add('sensor_mean', minute(10), {'name': 'light'}, {'mean': 10.0})
+    assert hissync.do_hissync('source', None, 'destination', None, 'flow', ['sensor_mean'], checkpoint_file=path) == 2
+    assert hissync.do_hissync('source', None, 'destination', None, 'flow', ['sensor_mean'], checkpoint_file=path,
+                              start=minute(0)) == 11
+    assert destination.records('sensor_mean') == source.records('sensor_mean')
+
+
+def test_read_points_windows_and_gaps():
+    store = FakeStore()
+    times = [minute(index) for index in range(5)] + [minute(index, datetime.datetime(2017, 9, 1)) for index in range(3)]
+    for index, time in enumerate(times):
+        store.add('sensor_mean', time, {'name': 'light'}, {'mean': float(index)})
+        store.add('sensor_mean', time, {'name': 'other'}, {'mean': float(index)})
+    start = datetime.datetime(2017, 6, 21, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)
+    points = list(hissync.read_points(store, 'sensor_mean', start, end, datetime.timedelta(minutes=2), 3))
+
+    # every record is read once, in time order, across window boundaries
+    assert [(p['time'], p['name']) for p in points] == [(time, name) for time in times for name in ('light', 'other')]
+
+    # the months without records are skipped by looking up the next record rather than querying each window
+    window_queries = [query for query in store.queries if 'time <' in query]
+    assert len(window_queries) == 7
+    assert "time >= '2017-09-01T00:00:00.000000Z'" in window_queries[4]
+    assert len([query for query in store.queries if 'limit 1' in query]) == 2
+
+
+def test_chunk_sizer_uses_chunk_latency():
+    store = FakeStore()
+    for index in range(40):
+        store.add('sensor_mean', minute(index), {'name': 'light'}, {'mean': float(index)})
+    sizer = hissync.ChunkSizer(size=4, minimum=2, maximum=64)
+    start = datetime.datetime(2017, 6, 21, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2017, 6, 22, tzinfo=datetime.timezone.utc)
+    points = list(hissync.read_points(store, 'sensor_mean', start, end, datetime.timedelta(minutes=10), 100, sizer))
+    assert len(points) == 40
+    assert sizer.size > 4  # fast chunks grow the chunk size for later windows
+
+    sizer = hissync.ChunkSizer(size=64, minimum=2, maximum=64, target_seconds=0.0)
+    list(hissync.read_points(store, 'sensor_mean', start, end, datetime.timedelta(minutes=10), 100, sizer))
+    assert sizer.size < 64
+
+
+def test_bulk_transfer_in_windows():
+    source = FakeStore()
+    destination = FakeStore()
+    for index in range(3 * 24 * 60 + 7):
+        source.add('sensor_mean', minute(index), {'name': 'light', 'pin': '2671'},
+                   {'min': index, 'max': index + 2, 'mean': index + 1.0, 'count': 60} if index % 5 else
+                   {'mean': index + 1.0})
+    committed = []
+    count = hissync.perform_bulk_transfer(source, destination, 'sensor_mean', datetime.datetime(1970, 1, 1), 100,
+                                          on_commit=committed.append)
+    assert count == 3 * 24 * 60 + 7
+    assert destination.records('sensor_mean') == source.records('sensor_mean')
+    assert committed[-1] == minute(3 * 24 * 60 + 6)
+    assert all(len(points) <= 10000 for points in destination.writes)
+
+    # nothing new: only the first record lookup is made
+    source.queries = []
+    assert hissync.perform_bulk_transfer(source, destination, 'sensor_mean',
+                                         datetime.datetime(2017, 6, 25), 100) == 0
+    assert len(source.queries) == 1
+
+
+class StopAfterPolls(object):
+    """Stands in for the stop event of follow_measurement, calling between_polls after each poll."""
+
+    def __init__(self, polls, between_polls):
+        self.polls = polls
+        self.between_polls = between_polls
+
+    def is_set(self):
+        return self.polls <= 0
+
+    def wait(self, timeout=None):
+        self.polls -= 1
+        self.between_polls()
+
+
+def test_follow_counts_each_record_once():
+    source = FakeStore()
+    destination = FakeStore()
+    for index in range(5):
+        source.add('sensor_mean', minute(index), {'name': 'light'}, {'mean': float(index)})
+    new_records = [[(minute(4), 'other'), (minute(5), 'light')], []]
+
+    def between_polls():
+        for time, name in new_records.pop(0) if new_records else []:
+            source.add('sensor_mean', time, {'name': name}, {'mean': 1.0})
+
+    stop = StopAfterPolls(3, between_polls)
+    total = hissync.follow_measurement(source, destination, 'sensor_mean', datetime.datetime(1970, 1, 1), stop,
+                                       interval=0)
+    assert total == 7
+    assert destination.records('sensor_mean') == source.records('sensor_mean')
+    # the records at the last committed time were not written again
+    assert [len(points) for points in destination.writes] == [5, 2]
+
+
+def test_bulk_transfer_stops_when_stop_is_set():
+    source = FakeStore()
+    destination = FakeStore()
+    for index in range(100):
+        source.add('sensor_mean', minute(index), {'name': 'light'}, {'mean': float(index)})
+    stop = threading.Event()
+    committed = []
+
+    def commit(last_time):
+        committed.append(last_time)
+        stop.set()
+
+    total = hissync.perform_bulk_transfer(source, destination, 'sensor_mean', datetime.datetime(1970, 1, 1), 10,
+                                          on_commit=commit, stop=stop)
+    # only the first chunk is written
+    assert len(committed) == 1
+    assert 0 < total < 100
+    assert len(destination.records('sensor_mean')) == total
+    assert committed[0] == minute(total - 1)
+
+
+def reconcile_stores(records, field_types=FIELD_TYPES, measurement='sensor_mean'):
+    source = FakeStore(field_types)
+    destination = FakeStore(field_types)
+    for time, tags, fields in records:
+        source.add(measurement, time, tags, fields)
+        destination.add(measurement, time, tags, fields)
+    return source, destination
+
+
+def sensor_records(count):
+    return [(minute(index), {'name': 'light', 'pin': '2671'}, {'mean': float(index % 7), 'count': 60})
+            for index in range(count)]
+
+
+def reconcile(source, destination, measurement='sensor_mean', leaf_size=8):
+    destination.queries = []
+    total = hissync.reconcile_measurement(source, destination, measurement, datetime.datetime(2017, 6, 1),
+                                          end=datetime.datetime(2017, 7, 1, tzinfo=datetime.timezone.utc),
+                                          leaf_size=leaf_size)
+    reads = [query for query in destination.queries if query.startswith('select *')]
+    return total, reads
+
+
+def test_reconcile_identical_stores():
+    source, destination = reconcile_stores(sensor_records(200))
+    assert reconcile(source, destination) == (0, [])
+    assert len(destination.queries) == 2  # the whole range compared at once
+
+
+def test_reconcile_missing_records():
+    source, destination = reconcile_stores(sensor_records(200))
+    for index in (3, 150, 151):
+        del destination.rows[('sensor_mean', minute(index), (('name', 'light'), ('pin', '2671')))]
+    total, reads = reconcile(source, destination)
+    assert total == 3
+    assert destination.records('sensor_mean') == source.records('sensor_mean')
+    # only the leaf ranges next to the missing records are read (rather than the 25 leaf ranges of the records)
+    assert 0 < len(reads) <= 6
+
+    # nothing is left to do
+    assert reconcile(source, destination) == (0, [])
+
+
+def test_reconcile_changed_value():
+    source, destination = reconcile_stores(sensor_records(200))
+    destination.add('sensor_mean', minute(120), {'name': 'light', 'pin': '2671'}, {'mean': 100.0, 'count': 60})
+    assert reconcile(source, destination)[0] == 1
+    assert destination.records('sensor_mean') == source.records('sensor_mean')
+
+
+def test_reconcile_swapped_values():
+    # the counts, sums and integrals of the whole range are unchanged, so only the cumulative sums tell them apart
+    source, destination = reconcile_stores(sensor_records(200))
+    destination.add('sensor_mean', minute(20), {'name': 'light', 'pin': '2671'}, {'mean': float(180 % 7), 'count': 60})
+    destination.add('sensor_mean', minute(180), {'name': 'light', 'pin': '2671'}, {'mean': float(20 % 7), 'count': 60})
+    assert reconcile(source, destination)[0] == 2
+    assert destination.records('sensor_mean') == source.records('sensor_mean')
+
+
+def test_reconcile_shifted_record():
+    source, destination = reconcile_stores(sensor_records(200))
+    key = ('sensor_mean', minute(100), (('name', 'light'), ('pin', '2671')))
+    measurement, row = destination.rows.pop(key)
+    destination.add('sensor_mean', minute(100).replace(':00Z', ':30Z'), {'name': 'light', 'pin': '2671'},
+                    {'mean': row['mean'], 'count': 60})
+    assert reconcile(source, destination)[0] == 1
+    records = destination.records('sensor_mean')
+    # the source's record is restored; the shifted record (which only the destination has) is left
+    assert len(records) == 201
+    assert [record for record in records if record['time'] != minute(100).replace(':00Z', ':30Z')] == \
+        source.records('sensor_mean')
+
+
+def test_reconcile_changed_tags():
+    source, destination = reconcile_stores(sensor_records(200))
+    key = ('sensor_mean', minute(50), (('name', 'light'), ('pin', '2671')))
+    destination.rows.pop(key)
+    destination.add('sensor_mean', minute(50), {'name': 'light', 'pin': '1'}, {'mean': float(50 % 7), 'count': 60})
+    assert reconcile(source, destination)[0] == 1
+    assert source.records('sensor_mean')[50] in destination.records('sensor_mean')
+
+
+def test_reconcile_value_measurements():
+    records = [(minute(index), {'name': 'r%d' % (index % 3), 'action': 'start'}, {'value': float(index)})
+               for index in range(50)]
+    source, destination = reconcile_stores(records, {'value': 'float'}, 'run')
+    del destination.rows[('run', minute(10), (('action', 'start'), ('name', 'r1')))]
+    assert reconcile(source, destination, 'run')[0] == 1
+    assert destination.records('run') == source.records('run')
+
+
+def test_follow_polls_read_incrementally():
+    source = FakeStore({'mean': 'float'})
+    destination = FakeStore({'mean': 'float', 'max': 'float'})
+    for index in range(5):
+        source.add('sensor_mean', minute(index), {'name': 'light'}, {'mean': float(index)})
+    poll_queries = []
+
+    def add_field():
+        source.field_types['max'] = 'float'
+        source.add('sensor_mean', minute(7), {'name': 'light'}, {'mean': 7.0, 'max': 8.0})
+
+    changes = [lambda: source.add('sensor_mean', minute(6), {'name': 'light'}, {'mean': 6.0}), lambda: None,
+               add_field, lambda: None, lambda: None]
+
+    def between_polls():
+        poll_queries.append(source.queries)
+        source.queries = []
+        changes.pop(0)()
+
+    total = hissync.follow_measurement(source, destination, 'sensor_mean', datetime.datetime(1970, 1, 1),
+                                       StopAfterPolls(5, between_polls), interval=0)
+    assert total == 7
+    assert destination.records('sensor_mean') == source.records('sensor_mean')
+
+    # after the first poll, the field keys are only looked up again when a field is added,
+    # and each poll reads the new records with a single query
+    assert [query for query in poll_queries[0] if query.startswith('show field keys')]
+    assert [len(queries) for queries in poll_queries[1:]] == [1, 1, 2, 1]
+    assert poll_queries[3][1] == 'show field keys from sensor_mean'
+    assert poll_queries[1] == ["select * from sensor_mean where time >= '2017-06-21T00:04:00.000000Z'"]
@@ -0,0 +1,75 @@
+import re
+import datetime
+
+from flow.history_cache import HistoryCache
+
+
+def test_only_missing_buckets_queried():
+    queries = []
+
+    def query(querystr):
+        queries.append(querystr)
+        start, end = re.findall(r"time [<>]=? '([^']+)'", querystr)
+        start_hour, end_hour = int(start[11:13]), int(end[11:13])
+        return [{'time': '2017-06-16T%02d:00:00Z' % hour, 'mean': float(hour)}
+                for hour in range(start_hour, end_hour) if hour != 3]
+
+    cache = HistoryCache(query)
+    points = cache.get('light', '2017-06-16T00:30:00Z', '2017-06-16T05:00:00Z', '1h')
+    assert [point['mean'] for point in points] == [0.0, 1.0, 2.0, None, 4.0, 5.0]
+    assert points[0]['time'] == '2017-06-16T00:00:00Z'
+    assert len(queries) == 1
+
+    # a wider range only queries the new buckets
+    points = cache.get('light', '2017-06-16T00:00:00Z', '2017-06-16T07:10:00Z', '1h', limit=100)
+    assert [point['mean'] for point in points] == [0.0, 1.0, 2.0, None, 4.0, 5.0, 6.0, 7.0]
+    assert "time >= '2017-06-16T06:00:00Z' and time < '2017-06-16T08:00:00Z'" in queries[-1]
+    assert len(queries) == 2
+
+    # new data invalidates its bucket
+    cache.invalidate('light', datetime.datetime(2017, 6, 16, 5, 15))
+    cache.get('light', '2017-06-16T00:00:00Z', '2017-06-16T07:10:00Z', '1h', limit=4)
+    assert "time >= '2017-06-16T05:00:00Z' and time < '2017-06-16T06:00:00Z'" in queries[-1]
+    assert len(queries) == 3
+
+
+def test_limit_keeps_most_recent_buckets():
+    cache = HistoryCache(lambda querystr: [])
+    start, end = '2017-01-01T06:30:00Z', '2017-03-02T06:30:00Z'  # 60 days: 120 12h intervals over 121 buckets
+    points = cache.get('light', start, end, '12h', limit=120)
+    assert len(points) == 120
+    assert points[-1]['time'] == '2017-03-02T00:00:00Z'  # the last bucket covers the end of the range
+    assert points[0]['time'] == '2017-01-01T12:00:00Z'  # the oldest bucket is left out
+
+
+def test_recent_buckets_not_cached():
+    queries = []
+    cache = HistoryCache(lambda querystr: queries.append(querystr) or [])
+    now = datetime.datetime.utcnow()
+    for i in range(2):
+        cache.get('light', now - datetime.timedelta(minutes=1), now, '1m')
+    assert len(queries) == 2
+
+
+def test_invalidated_buckets_not_cached_until_settled():
+    queries = []
+    cache = HistoryCache(lambda querystr: queries.append(querystr) or [], settle_seconds=3600)
+    cache.get('light', '2017-06-16T00:00:00Z', '2017-06-16T05:00:00Z', '1h')
+    assert len(queries) == 1
+
+    # values uploaded late (e.g. from the spool after an outage) invalidate the buckets they fall in,
+    # which are queried again until the database has had time to update them
+    cache.invalidate('light', datetime.datetime(2017, 6, 16, 1, 30), datetime.datetime(2017, 6, 16, 2, 10))
+    for i in range(2):
+        cache.get('light', '2017-06-16T00:00:00Z', '2017-06-16T05:00:00Z', '1h')
+        assert "time >= '2017-06-16T01:00:00Z' and time < '2017-06-16T03:00:00Z'" in queries[-1]
+    assert len(queries) == 3
+    cache.get('dark', '2017-06-16T00:00:00Z', '2017-06-16T05:00:00Z', '1h')
+    cache.get('dark', '2017-06-16T00:00:00Z', '2017-06-16T05:00:00Z', '1h')
+    assert len(queries) == 4
+
+    # once settled, the buckets are cached again
+    cache.unsettled['light'] = (0, 0, 0)
+    cache.get('light', '2017-06-16T00:00:00Z', '2017-06-16T05:00:00Z', '1h')
+    cache.get('light', '2017-06-16T00:00:00Z', '2017-06-16T05:00:00Z', '1h')
+    assert len(queries) == 5
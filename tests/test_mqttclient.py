@@ -0,0 +1,53 @@
+import pytest
+
+mqtt = pytest.importorskip('paho.mqtt.client')
+
+from flow.mqttclient import MqttPublisher
+
+
+class FakeMessageInfo(object):
+
+    def __init__(self, rc):
+        self.rc = rc
+        self.published = False
+
+    def is_published(self):
+        return self.published
+
+
+# stands in for a paho client whose broker connection is backed up: messages are queued but not written
+class FakeClient(object):
+
+    def __init__(self, rc=mqtt.MQTT_ERR_SUCCESS):
+        self.rc = rc
+        self.messages = []
+
+    def publish(self, topic, payload):
+        info = FakeMessageInfo(self.rc)
+        self.messages.append((payload, info))
+        return info
+
+
+def test_publish_drops_messages_beyond_max_queued():
+    publisher = MqttPublisher('flow/ble', max_queued_messages=3)
+    publisher.client = FakeClient()
+    results = [publisher.publish('message %d' % i) for i in range(5)]
+    assert results == [True, True, True, False, False]
+    assert [payload for payload, info in publisher.client.messages] == ['message 0', 'message 1', 'message 2']
+    assert publisher.dropped_count == 2
+
+    # once messages have been written, more are queued
+    publisher.client.messages[0][1].published = True
+    publisher.client.messages[1][1].published = True
+    assert publisher.publish('message 5')
+    assert publisher.publish('message 6')
+    assert not publisher.publish('message 7')
+    assert len(publisher.unsent) == 3
+
+
+def test_publish_while_disconnected():
+    publisher = MqttPublisher('flow/ble')
+    publisher.client = FakeClient(mqtt.MQTT_ERR_NO_CONN)
+    assert not publisher.publish('message')
+    assert publisher.dropped_count == 1
+    assert len(publisher.unsent) == 0
@@ -0,0 +1,115 @@
+import json
+
+import gevent
+import pytest
+
+from flow.outbound import OutboundPipeline, encoders
+
+
+def create_pipeline(**kwargs):
+    sent = []
+    published = []
+    pipeline = OutboundPipeline(lambda type, parameters: sent.append((type, parameters)), published.append, **kwargs)
+    return pipeline, sent, published
+
+
+def test_messages_sent_when_greenlet_yields():
+    pipeline, sent, published = create_pipeline()
+    pipeline.send('update_diagram', {'values': {1: '2.5'}})
+    pipeline.send('update_sequence', {'sequence': 'image'})
+    assert sent == []
+    gevent.sleep(0)
+    assert sent == [('update_diagram', {'values': {1: '2.5'}}), ('update_sequence', {'sequence': 'image'})]
+    assert [json.loads(payload)['type'] for payload in published] == ['update_diagram']
+
+
+def test_batched_messages():
+    pipeline, sent, published = create_pipeline(batching=True)
+    pipeline.send('update_diagram', {'values': {}, 'src_folder': '/a'})
+    pipeline.send('status', {'src_folder': '/a'})
+    pipeline.flush()
+    assert len(sent) == 1 and len(published) == 1
+    type, parameters = sent[0]
+    assert type == 'message_batch'
+    assert [message['type'] for message in parameters['messages']] == ['update_diagram', 'status']
+    assert json.loads(published[0])['parameters'] == parameters
+
+    # a single message is sent as is
+    pipeline.send('status', {})
+    pipeline.flush()
+    assert sent[1] == ('status', {})
+    gevent.sleep(0)
+    assert len(sent) == 2
+
+
+def test_history_only_published():
+    pipeline, sent, published = create_pipeline()
+    pipeline.send('history', {'name': 'light', 'values': [1.5], 'timestamps': ['2017-06-16T20:42:00Z']})
+    pipeline.send('update_sequence', {'sequence': 'image'})
+    pipeline.flush()
+    assert sent == [('update_sequence', {'sequence': 'image'})]
+    assert [json.loads(payload)['type'] for payload in published] == ['history']
+    assert pipeline.is_critical('history')
+
+
+def test_message_encoding():
+    pipeline, sent, published = create_pipeline()
+    assert not pipeline.set_encoding('unknown')
+    assert pipeline.encoding == 'json'
+    msgpack = pytest.importorskip('msgpack')
+    assert pipeline.set_encoding('msgpack')
+    pipeline.send('update_diagram', {'values': {'1': '2.5'}})
+    pipeline.flush()
+    assert msgpack.unpackb(published[0], raw=False) == {'type': 'update_diagram', 'parameters': {'values': {'1': '2.5'}}}
+    assert 'json' in encoders
+
+
+def test_latest_value_wins_while_sender_is_blocked():
+    pipeline, sent, published = create_pipeline(max_queued=2)
+    for i in range(3):
+        pipeline.send('update_diagram', {'values': {1: str(i)}})
+        pipeline.send('update_sequence', {'value': i})
+        pipeline.send('save_diagram_response', {'success': i})
+    assert pipeline.queue_depth() == 6
+    assert pipeline.dropped_counts == {'update_diagram': 2, 'update_sequence': 1}
+    pipeline.flush()
+    assert sent == [('update_diagram', {'values': {1: '2'}}),
+                    ('save_diagram_response', {'success': 0}),
+                    ('update_sequence', {'value': 1}),
+                    ('save_diagram_response', {'success': 1}),
+                    ('update_sequence', {'value': 2}),
+                    ('save_diagram_response', {'success': 2})]
+    assert pipeline.queue_depth() == 0
+
+    # once sent, a newer message is queued again rather than replacing anything
+    pipeline.send('update_diagram', {'values': {1: '3'}})
+    pipeline.flush()
+    assert sent[-1] == ('update_diagram', {'values': {1: '3'}})
+    assert pipeline.dropped_counts['update_diagram'] == 2
+
+
+def test_keyframes_not_coalesced_away():
+    pipeline, sent, published = create_pipeline()
+    pipeline.send('update_diagram', {'values': {1: '1', 2: '2'}, 'keyframe': True})
+    pipeline.send('update_diagram', {'values': {1: '3'}, 'keyframe': False})
+    pipeline.send('update_diagram', {'values': {1: '4'}, 'keyframe': False})
+    pipeline.flush()
+    assert [parameters['values'] for type, parameters in sent] == [{1: '1', 2: '2'}, {1: '4'}]
+
+
+def test_server_only_messages_not_published():
+    pipeline, sent, published = create_pipeline()
+    pipeline.send('watchdog', {})
+    pipeline.send('send_sensor_data_response', {'success': True, 'data': []})
+    pipeline.flush()
+    assert [type for type, parameters in sent] == ['watchdog', 'send_sensor_data_response']
+    assert published == []
+
+
+def test_messages_dropped_by_publisher_counted():
+    sent = []
+    pipeline = OutboundPipeline(lambda type, parameters: sent.append((type, parameters)), lambda payload: False)
+    pipeline.send('update_diagram', {'values': {}})
+    pipeline.flush()
+    assert sent == [('update_diagram', {'values': {}})]
+    assert pipeline.dropped_counts == {'update_diagram': 1}
@@ -0,0 +1,45 @@
+import datetime
+
+from flow.rollup import RollupAggregator
+
+
+def time(minute, second):
+    return datetime.datetime(2017, 6, 16, 20, minute, second)
+
+
+def test_minute_and_coarser_rollups():
+    emitted = []
+    aggregator = RollupAggregator(lambda *args: emitted.append(args), intervals=[60, 600])
+    for minute, second, value in [(41, 10, 2.0), (41, 30, 4.0), (41, 59, 3.0), (42, 0, 10.0), (42, 5, 'image')]:
+        aggregator.add('light', value, time(minute, second))
+    assert emitted == [('sensor_mean', 'light', {'min': 2.0, 'max': 4.0, 'mean': 3.0, 'count': 3}, time(41, 0))]
+
+    # rollups are emitted once their interval has ended, even without new samples
+    aggregator.flush(time(42, 59))
+    assert len(emitted) == 1
+    aggregator.flush(time(43, 0))
+    assert emitted[1] == ('sensor_mean', 'light', {'min': 10.0, 'max': 10.0, 'mean': 10.0, 'count': 1}, time(42, 0))
+    aggregator.flush()
+    assert emitted[2] == ('sensor_mean_600s', 'light', {'min': 2.0, 'max': 10.0, 'mean': 4.75, 'count': 4}, time(40, 0))
+
+
+def test_late_samples_ignored():
+    emitted = []
+    aggregator = RollupAggregator(lambda *args: emitted.append(args))
+    aggregator.add('light', 1, time(41, 0))
+    aggregator.add('light', 3, time(42, 0))
+    aggregator.add('light', 5, time(41, 30))
+    aggregator.flush()
+    assert [fields['count'] for measurement, name, fields, timestamp in emitted] == [1, 1]
+    assert emitted[1][2]['mean'] == 3.0
+
+
+def test_int_samples_give_float_fields():
+    emitted = []
+    aggregator = RollupAggregator(lambda *args: emitted.append(args))
+    aggregator.add('light', 2, time(41, 0))
+    aggregator.add('light', 5, time(41, 30))
+    aggregator.flush()
+    fields = emitted[0][2]
+    assert fields == {'min': 2.0, 'max': 5.0, 'mean': 3.5, 'count': 2}
+    assert all(isinstance(fields[key], float) for key in ('min', 'max', 'mean'))
@@ -0,0 +1,51 @@
+import os
+
+from flow.spool import Spool
+
+
+def test_consumers_read_and_commit_independently(tmpdir):
+    spool = Spool(str(tmpdir), ['store', 'server'])
+    for i in range(5):
+        spool.append({'value': i})
+
+    records, position = spool.read('store', 3)
+    assert records == [{'value': 0}, {'value': 1}, {'value': 2}]
+    spool.commit('store', position)
+    records, position = spool.read('store')
+    assert [record['value'] for record in records] == [3, 4]
+
+    # an uncommitted read is repeated
+    assert len(spool.read('server')[0]) == 5
+    assert len(spool.read('server')[0]) == 5
+
+
+def test_restart_resumes_from_committed_offset(tmpdir):
+    spool = Spool(str(tmpdir), ['server'])
+    for i in range(3):
+        spool.append({'value': i})
+    records, position = spool.read('server', 2)
+    spool.commit('server', position)
+    spool.close()
+
+    # a partial record left by a crash is skipped
+    with open(os.path.join(str(tmpdir), '%012d.jsonl' % spool.segment), 'ab') as segment_file:
+        segment_file.write('{"value": 9')
+
+    spool = Spool(str(tmpdir), ['server'])
+    spool.append({'value': 3})
+    records, position = spool.read('server')
+    assert records == [{'value': 2}, {'value': 3}]
+
+
+def test_segments_rotated_removed_and_capped(tmpdir):
+    spool = Spool(str(tmpdir), ['server'], segment_bytes=50, max_bytes=200)
+    for i in range(10):
+        spool.append({'value': i, 'padding': 'x' * 20})
+    assert len(spool.segments()) > 1
+    assert spool.size() <= 200 + 50
+
+    # the oldest records were discarded to stay within max_bytes
+    records, position = spool.read('server', 100)
+    assert records[-1]['value'] == 9 and records[0]['value'] > 0
+    spool.commit('server', position)
+    assert spool.segments() == [spool.segment]
@@ -0,0 +1,79 @@
+import datetime
+import sqlite3
+
+import pytest
+
+from flow.sqlitestore import SqliteStore, Query
+
+
+def time(minute, second=0):
+    return datetime.datetime(2017, 6, 16, 20, minute, second)
+
+
+@pytest.fixture
+def store(tmpdir):
+    store = SqliteStore(str(tmpdir.join('flow.db')), pin='2671', batch_size=10, flush_interval=60)
+    yield store
+    store.close()
+
+
+def test_select_latest_points(store):
+    store.save('run', 'first run', 5, {'action': 'start'}, timestamp=time(1))
+    store.save('run', 'first run', 5, {'action': 'stop'}, timestamp=time(2))
+    store.save('diagram', 'diagram', 0, {'action': 'start'}, timestamp=time(3))
+    points = list(store.query("select * from run order by time desc limit 2").get_points())
+    assert points == [
+        {'time': '2017-06-16T20:02:00Z', 'name': 'first run', 'pin': '2671', 'action': 'stop', 'value': 5},
+        {'time': '2017-06-16T20:01:00Z', 'name': 'first run', 'pin': '2671', 'action': 'start', 'value': 5},
+    ]
+
+
+def test_history_queries(store):
+    for minute in range(10):
+        if minute != 4:
+            fields = {'min': minute, 'max': minute + 2, 'mean': minute + 1.0, 'count': 60}
+            store.save('sensor_mean', 'light', fields, timestamp=time(minute))
+            store.save('sensor_mean', 'other', fields, timestamp=time(minute))
+
+    points = list(store.query("""SELECT mean from sensor_mean where "name"='light' and """
+                              """time > '2017-06-16T20:02:00Z' and time <= '2017-06-16T20:05:00Z' limit 10""").get_points())
+    assert points == [{'time': '2017-06-16T20:03:00Z', 'mean': 4.0}, {'time': '2017-06-16T20:05:00Z', 'mean': 6.0}]
+
+    # empty buckets are included (with null values), as with influxdb's default fill
+    points = list(store.query("""SELECT mean(mean) from sensor_mean where "name"='light' and """
+                              """time > '2017-06-16T20:00:00.5Z' and time <= '2017-06-16T20:09:00Z' group by time(2m) limit 4""").get_points())
+    assert points == [
+        {'time': '2017-06-16T20:00:00Z', 'mean': 2.0},
+        {'time': '2017-06-16T20:02:00Z', 'mean': 3.5},
+        {'time': '2017-06-16T20:04:00Z', 'mean': 6.0},
+        {'time': '2017-06-16T20:06:00Z', 'mean': 7.5},
+    ]
+    points = list(store.query("""select max(max), count(mean) from sensor_mean where "name"='light' and """
+                              """time >= '2017-06-16T20:04:00Z' and time < '2017-06-16T20:05:00Z' group by time(1m)""").get_points())
+    assert points == [{'time': '2017-06-16T20:04:00Z', 'max': None, 'count': 0}]
+
+
+def test_unsupported_query(store):
+    with pytest.raises(ValueError):
+        store.query('show measurements')
+    with pytest.raises(ValueError):
+        store.query('select value from sensor group by time(1m)')
+
+
+def test_name_filtered_in_sql(tmpdir):
+    path = str(tmpdir.join('old.db'))
+    # a database from before name and pin had their own columns
+    connection = sqlite3.connect(path)
+    connection.execute('create table points (measurement text, time integer, tags text, fields text)')
+    connection.execute("""insert into points values ('sensor', 0, '{"name": "light", "pin": "2671"}', '{"value": 1}')""")
+    connection.execute("""insert into points values ('sensor', 1, '{"name": "other", "pin": "2671"}', '{"value": 2}')""")
+    connection.commit()
+    connection.close()
+
+    store = SqliteStore(path, pin='2671', batch_size=0)
+    store.save('sensor', 'light', 3, timestamp=datetime.datetime(1970, 1, 1, 0, 0, 1))
+    query = "select value from sensor where \"name\"='light'"
+    assert [point['value'] for point in store.query(query).get_points()] == [1, 3]
+    assert Query(query).indexed_tags == {'name': 'light'}
+    assert store.connection.execute("select count(*) from points where name = 'other'").fetchone() == (1,)
+    store.close()